@@ -0,0 +1,441 @@
+"""
+    benchmark.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Benchmark module
+
+    Generates synthetic PubMed-like collections (gzip jsonl
+    with pmid, title and abstract fields) and matching question
+    zips, runs the indexer and the searcher end to end over them
+    and writes the measured figures to a json file that can be
+    compared between runs.
+
+    Example:
+        python benchmark.py --scale tiny --output benchmarks/results-tiny.json
+        python benchmark.py --scale tiny --compare benchmarks/results-tiny.json
+
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+from time import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from utils import percentile
+
+BENCHMARK_VERSION = 2
+
+# number of documents, vocabulary size, number of questions and postings of each indexer block for each scale
+# (about 130 postings per document, so that every scale is indexed into a dozen blocks)
+SCALES = {
+    "tiny": {"documents": 2000, "vocabulary": 20000, "questions": 50, "block_postings": 20000},
+    "small": {"documents": 20000, "vocabulary": 80000, "questions": 100, "block_postings": 200000},
+    "medium": {"documents": 200000, "vocabulary": 300000, "questions": 200, "block_postings": 2000000},
+}
+
+# question files inside the generated zip (same layout as questions_with_gs.zip)
+QUESTION_FILES = 5
+
+SYLLABLES = ["ab", "ac", "ad", "al", "am", "an", "ar", "at", "ba", "be", "bi", "bo", "ca", "ce", "ci", "co",
+             "cy", "da", "de", "di", "do", "el", "em", "en", "er", "es", "fa", "fe", "fi", "ga", "ge", "gl",
+             "he", "hy", "id", "im", "in", "ir", "is", "ka", "ki", "la", "le", "li", "lo", "ly", "ma", "me",
+             "mi", "mo", "mu", "my", "na", "ne", "ni", "no", "ol", "om", "on", "or", "os", "pa", "pe", "ph",
+             "pi", "po", "pr", "ra", "re", "ri", "ro", "sa", "se", "si", "so", "st", "ta", "te", "th", "ti",
+             "to", "tr", "ul", "um", "un", "ur", "va", "ve", "vi", "xy", "zo"]
+
+# common english words that appear between the synthetic terms (most are in stopw.txt)
+FILLER_WORDS = ["the", "of", "and", "in", "to", "a", "with", "for", "was", "were", "is", "by", "on", "that",
+                "patients", "study", "results", "cells", "analysis", "treatment", "effect", "group"]
+
+
+class SyntheticCollection:
+    """
+    Generator of synthetic PubMed-like collections
+
+    Terms are drawn from a Zipf distribution over a synthetic
+    vocabulary, so that the postings lengths of the generated
+    index have the same long tail as the real collections.
+
+    """
+    def __init__(self, documents, vocabulary, questions, seed=42, zipf_exponent=1.07):
+        self.documents = documents
+        self.vocabulary_size = vocabulary
+        self.questions = questions
+        self.random = random.Random(seed)
+
+        self.vocabulary = self.build_vocabulary()
+        self.rank = {word: rank for rank, word in enumerate(self.vocabulary)}
+
+        # cumulative zipf weights used by random.choices
+        self.cum_weights = []
+        total = 0.0
+        for rank in range(1, self.vocabulary_size + 1):
+            total += 1.0 / (rank ** zipf_exponent)
+            self.cum_weights.append(total)
+
+        # source documents of the questions (and their relevant documents)
+        self.question_sources = set(self.random.sample(range(self.documents), min(self.questions, self.documents)))
+        self.question_terms = {}
+
+    def build_vocabulary(self):
+        """
+        Auxiliar function to build a vocabulary of unique synthetic words
+        with a realistic word length distribution
+
+        Returns
+        ----------
+        vocabulary
+            list of unique words ordered by their zipf rank
+        """
+        vocabulary = []
+        seen = set()
+        while len(vocabulary) < self.vocabulary_size:
+            # frequent words are shorter, as in natural language
+            syllables = 2 + min(4, int(self.random.expovariate(1.0) * (1 + len(vocabulary) / self.vocabulary_size)))
+            word = "".join(self.random.choice(SYLLABLES) for _ in range(syllables))
+            if word not in seen:
+                seen.add(word)
+                vocabulary.append(word)
+
+        return vocabulary
+
+    def sample_words(self, length):
+        """
+        Auxiliar function to sample a sequence of words
+
+        Parameters
+        ----------
+        length
+            number of words to be sampled
+
+        Returns
+        ----------
+        words
+            list of sampled words, mixed with some filler words
+        """
+        words = self.random.choices(self.vocabulary, cum_weights=self.cum_weights, k=length)
+        for i in range(0, length, 4):
+            if self.random.random() < 0.5:
+                words[i] = self.random.choice(FILLER_WORDS)
+
+        return words
+
+    def write_collection(self, collection_path):
+        """
+        Writes the synthetic collection as a gzip jsonl file
+
+        Parameters
+        ----------
+        collection_path
+            output file path
+        """
+        pmid = 10000000 + self.random.randint(0, 1000000)
+
+        with gzip.open(collection_path, "wt", encoding="utf-8") as collection_file:
+            for doc_num in range(self.documents):
+                pmid += self.random.randint(1, 20)
+
+                # realistic title and abstract lengths (in words)
+                title_length = max(3, int(self.random.gauss(13, 4)))
+                abstract_length = max(20, int(self.random.lognormvariate(5.3, 0.45)))
+
+                title = self.sample_words(title_length)
+                abstract = self.sample_words(abstract_length)
+
+                if doc_num in self.question_sources:
+                    # remember some of the rarer words of the document to build its question
+                    candidates = sorted(set(title + abstract) - set(FILLER_WORDS), key=self.rank.get, reverse=True)
+                    self.question_terms[str(pmid)] = candidates[:self.random.randint(3, 6)]
+
+                document = {"pmid": str(pmid),
+                            "title": " ".join(title).capitalize() + ".",
+                            "abstract": " ".join(abstract).capitalize() + "."}
+                collection_file.write(json.dumps(document) + "\n")
+
+    def write_questions(self, questions_path):
+        """
+        Writes the questions (with gold standard) as a zip file with the
+        same layout of questions_with_gs.zip
+
+        Parameters
+        ----------
+        questions_path
+            output file path
+        """
+        lines = [[] for _ in range(QUESTION_FILES)]
+        for i, (pmid, terms) in enumerate(sorted(self.question_terms.items())):
+            question = {"query_id": "synthetic{:06d}".format(i),
+                        "query_text": "What is the relation between {}?".format(" and ".join(terms)),
+                        "documents_pmid": [pmid]}
+            lines[i % QUESTION_FILES].append(json.dumps(question))
+
+        with ZipFile(questions_path, "w", ZIP_DEFLATED) as questions_zip:
+            for i in range(QUESTION_FILES):
+                questions_zip.writestr("questions_with_gs/question_synthetic{}_gs.jsonl".format(i + 1), "\n".join(lines[i]) + "\n")
+
+
+def folder_size(path):
+    """
+    Auxiliar function to get the total size of the files in a folder (recursively)
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            size += os.path.getsize(os.path.join(root, file_name))
+
+    return size
+
+
+def run_command(command, log_path, cwd):
+    """
+    Runs a command, saves its output to a log file and measures its
+    wall time and peak resident memory
+
+    Parameters
+    ----------
+    command
+        list with the command and its arguments
+    log_path
+        file where the stdout and stderr of the command are saved
+    cwd
+        working directory of the command
+
+    Returns
+    ----------
+    output
+        stdout of the command
+    wall_time
+        elapsed time in seconds
+    peak_memory
+        peak resident set size in bytes (Linux)
+    """
+    start = time()
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, cwd=cwd)
+        # wait4 gives the resource usage of this child only
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time() - start
+
+    with open(log_path, "r", encoding="utf-8") as log_file:
+        output = log_file.read()
+
+    if process.returncode != 0:
+        print(output)
+        raise RuntimeError("Command {} failed with exit code {} (see \"{}\")".format(" ".join(command), process.returncode, log_path))
+
+    # ru_maxrss is in KBytes on Linux
+    return output, wall_time, usage.ru_maxrss * 1024
+
+
+def parse_float(pattern, output):
+    """
+    Auxiliar function to get the first float value matched by a regex in a text
+    """
+    match = re.search(pattern, output)
+    return float(match.group(1)) if match else None
+
+
+def run_benchmark(args):
+    """
+    Generates the synthetic collection (if needed), runs the indexer and the
+    searcher and collects the measured figures
+
+    Parameters
+    ----------
+    args
+        parsed command line arguments
+
+    Returns
+    ----------
+    results
+        dictionary with the benchmark results
+    """
+    scale = SCALES[args.scale]
+    package_folder = os.path.dirname(os.path.abspath(__file__))
+    work_folder = os.path.abspath(args.workdir or os.path.join("benchmarks", args.scale))
+    os.makedirs(work_folder, exist_ok=True)
+
+    collection_path = os.path.join(work_folder, "pubmed_synthetic_{}_{}.jsonl.gz".format(args.scale, args.seed))
+    questions_path = os.path.join(work_folder, "questions_synthetic_{}_{}.zip".format(args.scale, args.seed))
+
+    if not os.path.exists(collection_path) or not os.path.exists(questions_path):
+        print("Generating synthetic \"{}\" collection to \"{}\"... ".format(args.scale, work_folder), end="", flush=True)
+        generation_start = time()
+        collection = SyntheticCollection(scale["documents"], scale["vocabulary"], scale["questions"], seed=args.seed)
+        collection.write_collection(collection_path)
+        collection.write_questions(questions_path)
+        print("Done! ({:.1f} seconds)".format(time() - generation_start))
+
+    index_folder = os.path.join(work_folder, "index")
+    main_path = os.path.join(package_folder, "main.py")
+    stopwords_path = os.path.join(package_folder, "stopw.txt")
+
+    # indexer (several blocks are written and merged in the background even at the small scales)
+    block_postings = args.block_postings or scale["block_postings"]
+    indexer_command = [sys.executable, main_path, "indexer", collection_path, index_folder,
+                       "--tk.minL", "2", "--tk.stopwords_path", stopwords_path, "--tk.stemmer", "potterNLTK",
+                       "--indexer.rsv", args.rsv, "--indexer.posting_threshold", str(block_postings),
+                       "--indexer.block_merge_factor", str(args.block_merge_factor)] + args.indexer_args.split()
+    print("Running indexer... ", end="", flush=True)
+    indexer_output, indexer_wall_time, indexer_memory = run_command(indexer_command, os.path.join(work_folder, "indexer.log"), work_folder)
+    print("Done! ({:.1f} seconds)".format(indexer_wall_time))
+
+    indexing_time = parse_float(r"Total indexing time: ([\d.]+)", indexer_output)
+
+    # searcher
+    searcher_command = [sys.executable, main_path, "searcher", questions_path, os.path.join(index_folder, "merged"),
+                        "--documents.topk", str(args.topk)] + args.searcher_args.split()
+    print("Running searcher... ", end="", flush=True)
+    searcher_output, searcher_wall_time, searcher_memory = run_command(searcher_command, os.path.join(work_folder, "searcher.log"), work_folder)
+    print("Done! ({:.1f} seconds)".format(searcher_wall_time))
+
+    query_times = [float(value) for value in re.findall(r"^Query Time: ([\d.e-]+)", searcher_output, re.MULTILINE)]
+    average_precisions = [float(value) for value in re.findall(r"^Average Precision: ([\d.e-]+)", searcher_output, re.MULTILINE)]
+
+    return {
+        "benchmark_version": BENCHMARK_VERSION,
+        "scale": args.scale,
+        "seed": args.seed,
+        "rsv": args.rsv,
+        "block_postings": block_postings,
+        "block_merge_factor": args.block_merge_factor,
+        "indexer_args": args.indexer_args,
+        "searcher_args": args.searcher_args,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "corpus": {
+            "documents": scale["documents"],
+            "vocabulary": scale["vocabulary"],
+            "collection_bytes": os.path.getsize(collection_path),
+        },
+        "indexer": {
+            "wall_time": indexer_wall_time,
+            "indexing_time": indexing_time,
+            "merging_time": parse_float(r"Total merging time: ([\d.]+)", indexer_output),
+            "documents_per_second": scale["documents"] / indexing_time if indexing_time else None,
+            "temporary_files": parse_float(r"Number of temporary index files: (\d+)", indexer_output),
+            "vocabulary_size": parse_float(r"Vocabulary Size \(number of terms\): (\d+)", indexer_output),
+            "index_bytes": folder_size(index_folder),
+            "peak_memory_bytes": indexer_memory,
+        },
+        "searcher": {
+            "wall_time": searcher_wall_time,
+            "queries": len(query_times),
+            "latency_mean": sum(query_times) / len(query_times) if query_times else None,
+            "latency_p50": percentile(query_times, 50),
+            "latency_p95": percentile(query_times, 95),
+            "latency_p99": percentile(query_times, 99),
+            "mean_average_precision": sum(average_precisions) / len(average_precisions) if average_precisions else None,
+            "peak_memory_bytes": searcher_memory,
+        },
+    }
+
+
+def compare_results(old_results, new_results):
+    """
+    Prints the relative change of every numeric figure between two benchmark results
+
+    Parameters
+    ----------
+    old_results
+        previous benchmark results (baseline)
+    new_results
+        current benchmark results
+    """
+    print("\n:: Comparison ::")
+    for section in ("indexer", "searcher"):
+        for key, new_value in new_results[section].items():
+            old_value = old_results.get(section, {}).get(key)
+            if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)):
+                continue
+
+            change = (new_value - old_value) / old_value * 100 if old_value != 0 else 0.0
+            print("> {}.{}: {:.4g} -> {:.4g} ({:+.1f}%)".format(section, key, old_value, new_value, change))
+
+
+def print_results(results):
+    """
+    Prints the benchmark results in the same format as the index statistics
+    """
+    print("\n:: Benchmark ({}, {} documents) ::".format(results["scale"], results["corpus"]["documents"]))
+    for section in ("indexer", "searcher"):
+        for key, value in results[section].items():
+            if isinstance(value, float):
+                print("> {}.{}: {:.4f}".format(section, key, value))
+            else:
+                print("> {}.{}: {}".format(section, key, value))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="End to end benchmark of the IR engine over synthetic PubMed-like collections")
+
+    parser.add_argument("--scale", type=str, default="tiny", choices=list(SCALES.keys()),
+                        help="Size of the synthetic collection (default=tiny).")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Seed of the collection generator (default=42).")
+    parser.add_argument("--rsv", type=str, default="tfidf",
+                        help="Retrieval status values option used by the indexer (default=tfidf).")
+    parser.add_argument("--topk", type=int, default=10,
+                        help="Top k documents retrieved by the searcher (default=10).")
+    parser.add_argument("--block-postings", type=int, default=None,
+                        help="Postings of each block written by the indexer (default=20000, 200000 and 2000000 for the tiny, small and medium scales).")
+    parser.add_argument("--block-merge-factor", type=int, default=4,
+                        help="Number of blocks of the same level merged in the background by the indexer (default=4).")
+    parser.add_argument("--indexer-args", type=str, default="",
+                        help="Additional arguments passed to the indexer (default=\"\").")
+    parser.add_argument("--searcher-args", type=str, default="",
+                        help="Additional arguments passed to the searcher (default=\"\").")
+    parser.add_argument("--workdir", type=str, default=None,
+                        help="Folder for the generated collection, index and logs (default=benchmarks/<scale>).")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Json file where the results are written (default=<workdir>/results.json).")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Previous results json file to compare against.")
+
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    print_results(results)
+
+    output_path = args.output or os.path.join(args.workdir or os.path.join("benchmarks", args.scale), "results.json")
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as compare_file:
+            compare_results(json.load(compare_file), results)
+
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        json.dump(results, output_file, indent=4)
+
+    print("\nResults saved to \"{}\"".format(output_path))
@@ -0,0 +1,332 @@
+"""
+    blocks.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Temporary blocks module
+
+    Holds the code/logic addressing the files of the
+    temporary blocks written by the SPIMI indexer, that
+    can be compressed (gzip or zlib streams) to reduce the
+    scratch disk space and the I/O of the merge, where they
+    are decompressed while streaming their lines, and of
+    the background writer and merges of the blocks.
+
+"""
+
+import gzip                         # gzip compressed blocks
+import heapq                        # k-way merge of the blocks
+import io                           # buffered text streams over the zlib streams
+import json                         # journal of the block merges
+import os                           # rename and delete the merged blocks
+import re                           # match the block files names
+import threading                    # write the blocks in the background
+import zlib                         # zlib compressed blocks
+
+# file name extension of the blocks of each codec ("<block number>.txt<extension>")
+BLOCK_CODECS = {"none": "", "gzip": ".gz", "zlib": ".zz"}
+
+BLOCK_NAME = re.compile(r"(\d+)\.txt(\.gz|\.zz)?")
+
+BUFFER_SIZE = 65536                 # bytes of the buffers of the compressed streams
+WRITE_BUFFER_SIZE = 1048576         # characters of the lines written to a block at once
+
+
+class ZlibWriter(io.RawIOBase):
+    """
+    Binary stream that compresses the written bytes into a zlib file
+
+    """
+    def __init__(self, path, level):
+        self.file = open(path, "wb")
+        self.compressor = zlib.compressobj(level)
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.file.write(self.compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.file.write(self.compressor.flush())
+            self.file.close()
+        super().close()
+
+
+class ZlibReader(io.RawIOBase):
+    """
+    Binary stream that decompresses a zlib file while it is read,
+    only a chunk of the file is decompressed at a time
+
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.decompressor = zlib.decompressobj()
+        self.buffer = memoryview(b"")   # decompressed bytes not read yet
+
+    def readable(self):
+        return True
+
+    def readinto(self, output):
+        while len(self.buffer) == 0:
+            if self.decompressor.eof:
+                return 0
+
+            data = self.file.read(BUFFER_SIZE)
+            self.buffer = memoryview(self.decompressor.decompress(data) if len(data) > 0 else self.decompressor.flush())
+
+            if len(data) == 0 and len(self.buffer) == 0:
+                return 0
+
+        size = min(len(output), len(self.buffer))
+        output[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+def get_block_path(folder, block_num, codec="none"):
+    """
+    Builds the path of a temporary block
+
+    Parameters
+    ----------
+    folder
+        folder of the blocks
+    block_num
+        number of the block
+    codec
+        "none", "gzip" or "zlib"
+
+    Returns
+    ----------
+    path
+        path of the block file
+    """
+    return "{}/{}.txt{}".format(folder, block_num, BLOCK_CODECS[codec])
+
+
+def is_block(file_name):
+    """
+    Checks if a file name is the name of a temporary block (of any codec)
+    """
+    return BLOCK_NAME.fullmatch(file_name) is not None
+
+
+def open_block(path, mode="r", level=1):
+    """
+    Opens a temporary block as a text file, the codec of the block
+    is given by the extension of its name (ignoring the ".tmp" suffix
+    of the blocks being merged)
+
+    Parameters
+    ----------
+    path
+        path of the block file
+    mode
+        "r" to read the block or "w" to write it
+    level
+        compression level (0 to 9) of the written compressed blocks
+
+    Returns
+    ----------
+    block_file
+        text file object of the block
+    """
+    name = path[:-len(".tmp")] if path.endswith(".tmp") else path
+
+    if name.endswith(".gz"):
+        if mode == "w":
+            return gzip.open(path, "wt", compresslevel=level, encoding="utf-8", newline="\n")
+        return gzip.open(path, "rt", encoding="utf-8", newline="\n")
+
+    if name.endswith(".zz"):
+        if mode == "w":
+            return io.TextIOWrapper(io.BufferedWriter(ZlibWriter(path, level), BUFFER_SIZE), encoding="utf-8", newline="\n")
+        return io.TextIOWrapper(io.BufferedReader(ZlibReader(path), BUFFER_SIZE), encoding="utf-8", newline="\n")
+
+    return open(path, mode, encoding="utf-8", newline="\n")
+
+
+class BlockWriter:
+    """
+    Background writer of the temporary blocks (double buffering)
+
+    A full block is handed off to a thread that sorts its
+    terms and writes it to disk, while the indexer fills a
+    new block. At most one block is being written, handing
+    off the next one waits for it, so at most two blocks
+    are held in memory. The errors of the writes are raised
+    by the next call that waits for the writer.
+
+    """
+    def __init__(self, write_block):
+        self.write_block = write_block      # function that writes a block, called with the handed off arguments
+        self.thread = None
+        self.error = None
+
+    def submit(self, *args):
+        """
+        Waits for the block being written and starts writing the given one
+        """
+        self.wait()
+
+        self.thread = threading.Thread(target=self.run, args=args)
+        self.thread.start()
+
+    def run(self, *args):
+        try:
+            self.write_block(*args)
+        except BaseException as error:
+            self.error = error
+
+    def wait(self):
+        """
+        Waits for the block being written (if any) to be on disk
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+def merge_block_files(input_paths, output_path, journal_path, level=1):
+    """
+    Merges consecutive blocks into a single block, the blocks hold disjoint
+    and increasing docno ranges so the postings of a term are the concatenation
+    (in block order) of its raw postings in each block. Runs in a background
+    process while the indexer goes on.
+
+    The merged block is written with a temporary name, then the journal (its
+    path and the paths of the other merged blocks) is written, the temporary
+    block replaces the first merged block and the other ones are deleted, so
+    that an interrupted merge can be finished or undone (recover_block_merge)
+
+    Parameters
+    ----------
+    input_paths
+        paths of the blocks in merge order
+    output_path
+        path of the merged block (the path of the first block in case it has
+        the same codec)
+    journal_path
+        path of the journal of the merge
+    level
+        compression level of the compressed merged block
+
+    Returns
+    ----------
+    output_path
+        path of the merged block
+    """
+    input_files = [open_block(path, "r") for path in input_paths]
+
+    def read_line(heap, block_num):
+        line = input_files[block_num].readline()
+        if line != "":
+            term, payload = line.rstrip("\n").split(";", 1)
+            heapq.heappush(heap, (term, block_num, payload))
+
+    heap = []
+    for block_num in range(len(input_files)):
+        read_line(heap, block_num)
+
+    lines = []
+    buffered = 0
+    with open_block(output_path + ".tmp", "w", level) as output_file:
+        while len(heap) > 0:
+            term = heap[0][0]
+
+            # raw postings of the term in each block (ties are popped in block order)
+            payloads = []
+            while len(heap) > 0 and heap[0][0] == term:
+                _, block_num, payload = heapq.heappop(heap)
+                payloads.append(payload)
+                read_line(heap, block_num)
+
+            line = term + ";" + ";".join(payloads) + "\n"
+            lines.append(line)
+            buffered += len(line)
+
+            if buffered >= WRITE_BUFFER_SIZE:
+                output_file.write("".join(lines))
+                lines.clear()
+                buffered = 0
+
+        output_file.write("".join(lines))
+
+    for input_file in input_files:
+        input_file.close()
+
+    with open(output_path + ".tmp", "rb") as output_file:
+        os.fsync(output_file.fileno())
+
+    with open(journal_path, "w", encoding="utf-8") as journal_file:
+        json.dump({"output": output_path, "inputs": [path for path in input_paths if path != output_path]}, journal_file)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    os.replace(output_path + ".tmp", output_path)
+    for path in input_paths:
+        if path != output_path:
+            os.remove(path)
+    os.remove(journal_path)
+
+    return output_path
+
+
+def recover_block_merge(folder, journal_path):
+    """
+    Finishes or undoes a block merge interrupted by a crash: in case the merged
+    block replaced the first block the other merged blocks are deleted,
+    otherwise the temporary merged block is deleted
+
+    Parameters
+    ----------
+    folder
+        folder of the blocks
+    journal_path
+        path of the journal of the merge
+    """
+    if os.path.exists(journal_path):
+        with open(journal_path, "r", encoding="utf-8") as journal_file:
+            journal = json.load(journal_file)
+
+        if not os.path.exists(journal["output"] + ".tmp"):
+            for path in journal["inputs"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        os.remove(journal_path)
+
+    # merged blocks that were being written
+    if os.path.exists(folder):
+        for file_name in os.listdir(folder):
+            if file_name.endswith(".tmp") and is_block(file_name[:-4]):
+                os.remove("{}/{}".format(folder, file_name))
@@ -31,7 +31,7 @@
 from tokenizers import dynamically_init_tokenizer
 from reader import dynamically_init_reader
 from index import dynamically_init_indexer
-from searcher import dynamically_init_searcher
+from searcher import dynamically_init_searcher, load_index_metadata, MultiIndexSearcher
 
 import math
 import os
@@ -40,6 +40,8 @@ from time import time
 from statistics import median
 
 from index import BaseIndex
+from utils import percentile
+from profiling import MemoryProfiler
 
 def add_more_options_to_indexer(indexer_parser, indexer_settings_parser, indexer_doc_parser):
     """Add more options to the main program argparser.
@@ -65,7 +67,136 @@ def add_more_options_to_indexer(indexer_parser, indexer_settings_parser, indexer
 
     """
     # Studends can implement if needed of additional argparse options
-    pass
+    indexer_settings_parser.add_argument('--indexer.incremental',
+                                         action="store_true",
+                                         help='Index the documents into a new generation of an existing index instead of rebuilding it.')
+
+    indexer_settings_parser.add_argument('--indexer.merge_factor',
+                                         type=int,
+                                         default=4,
+                                         help='Number of generations of the same size tier that are merged together in incremental mode (default=4).')
+
+    indexer_settings_parser.add_argument('--indexer.final_merge',
+                                         action="store_true",
+                                         help='In incremental mode, merge all the generations of the index into a single one.')
+
+    indexer_settings_parser.add_argument('--indexer.delete_pmids',
+                                         type=str,
+                                         default=None,
+                                         help='Path to a file with the pmids (one per line) of the documents to delete from an existing index. Use "-" as the collection to only delete documents (default=None).')
+
+    indexer_settings_parser.add_argument('--indexer.impact_ordered',
+                                         action="store_true",
+                                         help='Also write an impact ordered copy of the postings lists, used by the searcher when a postings or time budget is given.')
+
+    indexer_settings_parser.add_argument('--indexer.champions',
+                                         type=int,
+                                         default=None,
+                                         help='Number of postings of the champion list written for each term (its postings with the highest contributions), used by the tiered search. The absence means that will not be used (default=None).')
+
+    indexer_settings_parser.add_argument('--indexer.resume',
+                                         action="store_true",
+                                         help='Resume an interrupted build from the checkpoint saved after its last block flush, the documents already indexed are skipped (the same collection and settings must be given).')
+
+    indexer_settings_parser.add_argument('--indexer.block_codec',
+                                         type=str,
+                                         default="none",
+                                         choices=["none", "gzip", "zlib"],
+                                         help='Codec of the temporary blocks written while indexing, the compressed blocks are decompressed while they are merged (default=none).')
+
+    indexer_settings_parser.add_argument('--indexer.block_level',
+                                         type=int,
+                                         default=1,
+                                         choices=range(0, 10),
+                                         metavar="[0-9]",
+                                         help='Compression level of the gzip and zlib temporary blocks (default=1).')
+
+    indexer_settings_parser.add_argument('--indexer.block_merge_factor',
+                                         type=int,
+                                         default=None,
+                                         help='Merge the temporary blocks in the background while indexing, whenever this number of consecutive blocks of the same level exist, so that only a small final merge is left. The absence means that will not be used (default=None).')
+
+    indexer_settings_parser.add_argument('--indexer.memory_profile',
+                                         type=str,
+                                         default=None,
+                                         help='Path of a time series file (json lines) where the process memory, top allocators and estimated size of the indexer structures are written at each block flush and merge checkpoint. The absence means that will not be used (default=None).')
+
+    indexer_doc_parser.add_argument('--indexer.token_cache',
+                                    type=str,
+                                    default=None,
+                                    help='Folder where the tokenized collection is cached, later builds of the same collection with the same tokenizer settings read the tokens from it. The absence means that will not be used (default=None).')
+
+def add_more_options_to_searcher(searcher_parser):
+    """Add more options to the searcher mode of the main
+    program argparser.
+
+    Parameters
+    ----------
+    searcher_parser : ArgumentParser
+        This is the base argparser used during the searcher
+        mode.
+
+    """
+    searcher_settings_parser = searcher_parser.add_argument_group('Searcher settings', 'This settings are related to how the queries are processed and profiled.')
+
+    searcher_settings_parser.add_argument('--searcher.rsv',
+                                          type=str,
+                                          default=None,
+                                          help='Retrieval status values option, "tfidf" or "bm25". Indexes built with the "raw" (or "bm25") rsv support both, the absence means that the rsv of the index is used ("bm25" for raw indexes) (default=None).')
+
+    searcher_settings_parser.add_argument('--tfidf.smart_notation',
+                                          type=str,
+                                          default=None,
+                                          help='TFIDF SMART weighting notation to be used in raw indexes ("lnc.ltc", "lnc.lnc" or "lnu.ltc"), the absence means that the notation of the index is used ("lnc.ltc" for raw indexes) (default=None).')
+
+    searcher_settings_parser.add_argument('--searcher.match',
+                                          type=str,
+                                          default="any",
+                                          help='Query terms a document must hold to be scored, "any" (disjunctive), "all" (conjunctive) or the minimum number of query terms (default=any).')
+
+    searcher_settings_parser.add_argument('--searcher.postings_budget',
+                                          type=int,
+                                          default=None,
+                                          help='Maximum number of postings scored per query, the impact ordered postings are scored by decreasing impact until the budget runs out (requires an index built with --indexer.impact_ordered). The absence means that will not be used (default=None).')
+
+    searcher_settings_parser.add_argument('--searcher.time_budget',
+                                          type=float,
+                                          default=None,
+                                          help='Maximum time (in seconds) spent scoring the postings of a query, the impact ordered postings are scored by decreasing impact until the budget runs out (requires an index built with --indexer.impact_ordered). The absence means that will not be used (default=None).')
+
+    searcher_settings_parser.add_argument('--searcher.tiered',
+                                          action="store_true",
+                                          help='Score the champion lists of the query terms first, the full postings lists are only scored in case the champion lists can not give the top-k documents (requires an index built with --indexer.champions).')
+
+    searcher_settings_parser.add_argument('--searcher.max_open_segments',
+                                          type=int,
+                                          default=64,
+                                          help='Maximum number of merged segments of each index generation kept open while searching, the least recently used segment is closed when the limit is reached (default=64).')
+
+    searcher_settings_parser.add_argument('--searcher.prefetch_threads',
+                                          type=int,
+                                          default=4,
+                                          help='Number of threads reading the postings lists of the query terms from disk before they are scored, the segments are read concurrently (1 reads them sequentially) (default=4).')
+
+    searcher_settings_parser.add_argument('--searcher.memory_profile',
+                                          type=str,
+                                          default=None,
+                                          help='Path of a time series file (json lines) where the process memory, top allocators and estimated size of the searcher structures are written every --searcher.memory_profile_every queries. The absence means that will not be used (default=None).')
+
+    searcher_settings_parser.add_argument('--searcher.memory_profile_every',
+                                          type=int,
+                                          default=100,
+                                          help='Number of queries between the memory samples of the memory profiling, at least 1 (default=100).')
+
+    searcher_settings_parser.add_argument('--searcher.slow_query_threshold',
+                                          type=float,
+                                          default=None,
+                                          help='Queries that take longer than this value (in seconds) are written to the slow query log. The absence means that will not be used (default=None).')
+
+    searcher_settings_parser.add_argument('--searcher.slow_query_log',
+                                          type=str,
+                                          default="slow_queries.jsonl",
+                                          help='Path to the slow query log file (default=slow_queries.jsonl).')
 
 def engine_logic(args):
     """
@@ -103,7 +234,8 @@ def engine_logic(args):
                        args.bm25,
                        args.tfidf,
                        args.windowboost,
-                       args.documents)
+                       args.documents,
+                       args.searcher)
         
     else:
         # this should be ensured by the argparser
@@ -144,7 +276,7 @@ def indexer_logic(path_to_collection,
     else:
         indexer = dynamically_init_indexer(**indexer_args.get_kwargs())
 
-    if indexer.rsv != "tfidf" and indexer.rsv!= "bm25":
+    if indexer.rsv != "tfidf" and indexer.rsv!= "bm25" and indexer.rsv != "raw":
         print("RSV \"{}\" not supported.".format(indexer.rsv))
         return
 
@@ -153,15 +285,57 @@ def indexer_logic(path_to_collection,
         print("Supported notations: \"lnc.ltc\",\"lnc.lnc\",\"lnu.ltc\".")
         return
 
+    if indexer.merge_factor < 2:
+        print("Merge factor must be at least 2.")
+        return
+
+    if indexer.block_merge_factor is not None and indexer.block_merge_factor < 2:
+        print("Block merge factor must be at least 2.")
+        return
+
+    if indexer.posting_threshold is not None and indexer.posting_threshold < 1:
+        print("Posting threshold must be at least 1 posting.")
+        return
+
+    # delete documents from an existing index
+    if indexer.delete_pmids is not None:
+        with open(indexer.delete_pmids, "r", encoding="utf-8") as pmids_file:
+            pmids = [line.strip() for line in pmids_file if line.strip() != ""]
+
+        indexer.delete_documents(index_output_folder, pmids)
+
+        if path_to_collection == "-":
+            indexer.save_manifest(index_output_folder)
+            print("Done!")
+            return
+
+    # new generations must be tokenized like the existing ones
+    if indexer.incremental and os.path.exists("{}/data/manifest.json".format(index_output_folder)):
+        with open("{}/data/manifest.json".format(index_output_folder), "r", encoding="utf-8") as manifest_file:
+            tokenizer_metadata = json.load(manifest_file)["metadata"]["tokenizer"]
+
+        if tokenizer_metadata != {"minL": tokenizer.minL, "stopwords_path": tokenizer.stopwords_path, "stemmer": tokenizer.stemmer_name}:
+            print("Tokenizer settings {} do not match the ones of the existing index.".format(tokenizer_metadata))
+            return
+
     if (os.path.exists("{}/data/terms_data.txt".format(index_output_folder))):
-        print("\nWarning: previous index files found in index folder.\n")
+        if indexer.incremental:
+            print("\nAppending documents to the existing index.\n")
+        else:
+            print("\nWarning: previous index files found in index folder.\n")
     
     # execute the indexer logic
-    indexer.build_index(reader, tokenizer, index_output_folder)
+    indexer.build_generation(reader, tokenizer, index_output_folder)
+
+    # wait for the generations being merged in the background
+    indexer.wait_for_merges()
 
-    # save metadata used during indexing phase
+    if indexer.memory_profiler is not None:
+        indexer.memory_profiler.close()
+
+    # save metadata used during indexing phase (index manifest)
     indexer.save_metadata(tokenizer.minL, tokenizer.stopwords_path, tokenizer.stemmer_name, indexer.rsv, index_output_folder)
-    
+
     # get the final index
     index = indexer.get_index()
     
@@ -176,7 +350,8 @@ def searcher_logic(path_to_questions,
                    bm25_args,
                    tfidf_args,
                    windowboost_args,
-                   documents_args):
+                   documents_args,
+                   searcher_args):
     """
     Entrypoint for the main indexer logic. Here we start by
     dynamically loading the main modules (reader, tokenizer,
@@ -190,39 +365,103 @@ def searcher_logic(path_to_questions,
         cli and its default values.
 
     """
-    # start by loading metadata
-    metadata = {}
-
-    if (not os.path.exists("metadata/metadata.json")):
-        print("Could not load \"metadata.json\" file.")
+    if searcher_args.get_kwargs()["memory_profile"] is not None and searcher_args.get_kwargs()["memory_profile_every"] < 1:
+        print("Memory profile interval must be at least 1 query.")
         return
 
-    with open("metadata/metadata.json", "r", encoding="utf-8") as metadata_file: 
-        metadata = json.load(metadata_file)
-
-    # init searcher
-    if metadata["metadata"]["rsv"] == "tfidf":
-        # TFIDF
-        searcher = dynamically_init_searcher(index_folder=index_folder,
-                                            metadata=metadata,
-                                            **tfidf_args.get_kwargs(),
-                                            **windowboost_args.get_kwargs(),
-                                            **documents_args.get_kwargs())
-                                            #**searcher_args.get_kwargs())
-    else:
-        # BM25
-        searcher = dynamically_init_searcher(index_folder=index_folder,
-                                            metadata=metadata,
-                                            **bm25_args.get_kwargs(),
-                                            **windowboost_args.get_kwargs(),
-                                            **documents_args.get_kwargs())
-                                            #**searcher_args.get_kwargs())
-
-    if not searcher.load_terms_data():                      # load terms data file
-        return
+    # one searcher per index (shard), each index is described by its own manifest
+    index_folders = index_folder if isinstance(index_folder, list) else [index_folder]
+    searchers = []
+
+    for index_folder in index_folders:
+        # start by loading metadata
+        index_metadata = load_index_metadata(index_folder)
+        if index_metadata is None:
+            return
+
+        index_folder, metadata = index_metadata
+
+        # the rsv and smart notation can be chosen at query time, as long as the postings of the index support them
+        rsv = searcher_args.get_kwargs()["rsv"] or ("tfidf" if metadata["metadata"]["rsv"] == "tfidf" else "bm25")
+        smart_notation = tfidf_args.get_kwargs()["smart_notation"] or metadata["metadata"]["smart_notation"] or "lnc.ltc"
+
+        if rsv != "tfidf" and rsv != "bm25":
+            print("RSV \"{}\" not supported.".format(rsv))
+            return
 
-    if (searcher.metadata["metadata"]["rsv"] == "bm25"):    # load docs data file in case of BM25 rsv
-        if not searcher.load_docs_data():
+        match = searcher_args.get_kwargs()["match"]
+        if match != "any" and match != "all" and not (match.isdigit() and int(match) > 0):
+            print("Match mode \"{}\" not supported.".format(match))
+            print("Supported modes: \"any\",\"all\" or the minimum number of query terms.")
+            return
+
+        if rsv == "tfidf" and smart_notation != "lnc.ltc" and smart_notation != "lnc.lnc" and smart_notation != "lnu.ltc":
+            print("Weighting notation \"{}\" not supported.".format(smart_notation))
+            print("Supported notations: \"lnc.ltc\",\"lnc.lnc\",\"lnu.ltc\".")
+            return
+
+        # tfidf postings hold weights normalized with the document part of the notation of the index
+        if metadata["metadata"]["rsv"] == "tfidf" and (rsv != "tfidf" or smart_notation[:3] != metadata["metadata"]["smart_notation"][:3]):
+            print("Index \"{}\" was built with the \"tfidf\" rsv and \"{}\" notation, use a \"raw\" index to search with other weightings.".format(metadata["metadata"]["index_output_folder"], metadata["metadata"]["smart_notation"]))
+            return
+
+        metadata["metadata"]["searcher_rsv"] = rsv
+        metadata["metadata"]["searcher_smart_notation"] = smart_notation if rsv == "tfidf" else None
+
+        # all the indexes are queried with the same tokenizer and rsv
+        if len(searchers) > 0 and ({key: metadata["metadata"][key] for key in ("tokenizer", "searcher_rsv", "searcher_smart_notation")} !=
+                                   {key: searchers[0].metadata["metadata"][key] for key in ("tokenizer", "searcher_rsv", "searcher_smart_notation")}):
+            print("Index \"{}\" can not be searched with the same tokenizer and rsv settings of \"{}\".".format(metadata["metadata"]["index_output_folder"], searchers[0].metadata["metadata"]["index_output_folder"]))
+            return
+
+        # init searcher
+        if rsv == "tfidf":
+            # TFIDF
+            searcher = dynamically_init_searcher(index_folder=index_folder,
+                                                metadata=metadata,
+                                                match=match,
+                                                postings_budget=searcher_args.get_kwargs()["postings_budget"],
+                                                time_budget=searcher_args.get_kwargs()["time_budget"],
+                                                tiered=searcher_args.get_kwargs()["tiered"],
+                                                max_open_segments=searcher_args.get_kwargs()["max_open_segments"],
+                                                prefetch_threads=searcher_args.get_kwargs()["prefetch_threads"],
+                                                **tfidf_args.get_kwargs(),
+                                                **windowboost_args.get_kwargs(),
+                                                **documents_args.get_kwargs())
+                                                #**searcher_args.get_kwargs())
+        else:
+            # BM25
+            searcher = dynamically_init_searcher(index_folder=index_folder,
+                                                metadata=metadata,
+                                                match=match,
+                                                postings_budget=searcher_args.get_kwargs()["postings_budget"],
+                                                time_budget=searcher_args.get_kwargs()["time_budget"],
+                                                tiered=searcher_args.get_kwargs()["tiered"],
+                                                max_open_segments=searcher_args.get_kwargs()["max_open_segments"],
+                                                prefetch_threads=searcher_args.get_kwargs()["prefetch_threads"],
+                                                **bm25_args.get_kwargs(),
+                                                **windowboost_args.get_kwargs(),
+                                                **documents_args.get_kwargs())
+                                                #**searcher_args.get_kwargs())
+
+        if not searcher.load_terms_data():                      # load terms data file
+            return
+
+        if not searcher.load_docs_data():                       # load documents table (docno -> pmid, document length)
+            return
+
+        if not searcher.load_impacts_data():                    # load impact ordered postings (only with a postings or time budget)
+            return
+
+        if not searcher.load_champions_data():                  # load champion lists (only in tiered search)
+            return
+
+        searchers.append(searcher)
+
+    # several indexes, their top-k documents are merged
+    if len(searchers) > 1:
+        searcher = MultiIndexSearcher(searchers, documents_args.get_kwargs()["topk"])
+        if not searcher.load_collection_statistics():           # every shard is scored with the statistics of the whole collection
             return
 
     # init reader
@@ -240,6 +479,18 @@ def searcher_logic(path_to_questions,
     #################################
 
     query_times = []
+    queries_searched = 0
+
+    slow_query_threshold = searcher_args.get_kwargs()["slow_query_threshold"]
+    slow_query_file = None
+    if slow_query_threshold is not None:
+        slow_query_file = open(searcher_args.get_kwargs()["slow_query_log"], "w", encoding="utf-8")
+
+    # memory usage samples written every N queries
+    memory_profiler = None
+    if searcher_args.get_kwargs()["memory_profile"] is not None:
+        memory_profiler = MemoryProfiler(searcher_args.get_kwargs()["memory_profile"])
+        memory_profiler.sample("start", searcher.memory_structures(), queries=0)
 
     for query_data in reader.read_questions():
         query_start = time()    # start counter for indexing time
@@ -248,21 +499,34 @@ def searcher_logic(path_to_questions,
         # query_data[1] -> set with relevant documents' ids
         searcher.doc_scores.clear()
         searcher.doc_window_size.clear()
+        searcher.reset_query_stats()
 
         print(query_data[0])
         searcher.query_search(index, tokenizer, query_data[0])
+        queries_searched += 1
 
-        if len(searcher.doc_scores) == 0:
-            print("No matching documents found.")
-            continue
+        if memory_profiler is not None and queries_searched % searcher_args.get_kwargs()["memory_profile_every"] == 0:
+            memory_profiler.sample("queries", searcher.memory_structures(), queries=queries_searched)
 
-        topk_scores = {k: searcher.doc_scores[k] for k in list(searcher.doc_scores)[0:documents_args.get_kwargs()["topk"]]}
+        phase_start = time()
+        # the postings identify the documents by their docno
+        topk_scores = {str(searcher.get_pmid(k)): searcher.doc_scores[k] for k in list(searcher.doc_scores)[0:documents_args.get_kwargs()["topk"]]}
+        searcher.query_stats["topk"] += time() - phase_start
         #for key, value in topk_scores.items():
             #print("%12s\t%10.2f" % (key, value))
         #print("Relevant documents", query_data[1], "\n")
 
+        # queries without results are also timed (empty intersections can be the slowest ones)
         query_times.append(time() - query_start)
 
+        # register slow query
+        if slow_query_file is not None and query_times[-1] >= slow_query_threshold:
+            slow_query_file.write(json.dumps({"query_text": query_data[0], "query_time": query_times[-1], "results": len(searcher.doc_scores), **searcher.query_stats}) + "\n")
+
+        if len(searcher.doc_scores) == 0:
+            print("No matching documents found.")
+            continue
+
         # evaluation metrics
         tp = 0
         tn = 0
@@ -289,7 +553,8 @@ def searcher_logic(path_to_questions,
                 fn += 1
 
         precision = tp / (tp + fp)
-        recall = tp / (tp + fn)
+        # questions without gold standard (query logs) have no relevant documents
+        recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
 
         if (precision + recall) > 0.0:
             f_measure = 2 * precision * recall / (precision + recall)
@@ -303,8 +568,14 @@ def searcher_logic(path_to_questions,
         print("Average Precision:", average_precision)
 
         print("Query Time:", query_times[-1], "s")
+        print("Query Phases: tokenize={:.2f}ms, lookup={:.2f}ms, fetch={:.2f}ms ({} bytes, {} cache hits, {} cache misses), scoring={:.2f}ms, window boost={:.2f}ms, topk={:.2f}ms".format(
+                searcher.query_stats["tokenize"] * 1000, searcher.query_stats["lookup"] * 1000, searcher.query_stats["fetch"] * 1000,
+                searcher.query_stats["bytes_read"], searcher.query_stats["cache_hits"], searcher.query_stats["cache_misses"],
+                searcher.query_stats["scoring"] * 1000, searcher.query_stats["window_boost"] * 1000, searcher.query_stats["topk"] * 1000))
         print("Average Query Time:", sum(query_times) / len(query_times))
         print("Median Query Time:", median(query_times))
+        print("95th Percentile Query Time:", percentile(query_times, 95))
+        print("99th Percentile Query Time:", percentile(query_times, 99))
         
         '''# Statistics writting to file
         import csv
@@ -313,6 +584,21 @@ def searcher_logic(path_to_questions,
             writer = csv.writer(file)
             writer.writerow(data)'''
 
+    if slow_query_file is not None:
+        slow_query_file.close()
+
+    if memory_profiler is not None:
+        memory_profiler.sample("end", searcher.memory_structures(), queries=queries_searched)
+        memory_profiler.close()
+
+    if len(query_times) > 0:
+        print(f"\n:: Query Statistics ::")
+        print(f"> Number of queries: {'%d' % len(query_times)}")
+        print(f"> Average query time: {'%.4f' % (sum(query_times) / len(query_times))} seconds")
+        print(f"> Median query time: {'%.4f' % median(query_times)} seconds")
+        print(f"> 95th percentile query time: {'%.4f' % percentile(query_times, 95)} seconds")
+        print(f"> 99th percentile query time: {'%.4f' % percentile(query_times, 99)} seconds")
+
     #################################
     # searcher loop        ##########
     #################################
@@ -339,7 +625,7 @@ def searcher_logic(path_to_questions,
         while True:
             #print("Found {} results".format(len(doc_scores)))
             print("\nCurrent query: \"%s\"\n\n%12s\t%11s\n-------------------------------" % (query, "Document", "Score"))
-            top10_scores = {k: searcher.doc_scores[k] for k in list(searcher.doc_scores)[(cur_page - 1) * 10:(cur_page) * 10]}
+            top10_scores = {str(searcher.get_pmid(k)): searcher.doc_scores[k] for k in list(searcher.doc_scores)[(cur_page - 1) * 10:(cur_page) * 10]}
             for key, value in top10_scores.items():
                 print("%12s\t%10.2f" % (key, value))
 
@@ -356,6 +642,7 @@ def searcher_logic(path_to_questions,
 
     # clear searcher attributes
     searcher.metadata.clear()
-    searcher.terms_data.clear()
+    searcher.close()
     searcher.indexes_dict.clear()
+    searcher.positions_dict.clear()
     searcher.doc_scores.clear()
\ No newline at end of file
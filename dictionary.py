@@ -0,0 +1,266 @@
+"""
+    dictionary.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Term dictionary module
+
+    Holds the code/logic addressing the compact on-disk
+    term dictionary, that maps each term of an index to
+    its idf, document frequency, segment and offset
+    without loading the whole vocabulary to memory.
+
+"""
+
+from utils import encode_varint, decode_varint
+
+import mmap                         # memory map the dictionary file
+import struct                       # pack fixed width values
+import sys                          # check the system byte order
+from array import array             # compact arrays used while building the dictionary
+from bisect import bisect_right     # binary search over the block heads
+
+
+class TermDictionary:
+    """
+    Compact term dictionary
+
+    The dictionary file holds the sorted terms front coded in
+    blocks of `block_size` terms (the first term of a block is
+    stored in full and the remaining ones as the length of the
+    prefix shared with the previous term plus their suffix),
+    and the idf, document frequency, segment and offset of each
+    term in fixed width arrays indexed by the term ordinal.
+
+    Only the first term of each block is kept in memory, a
+    lookup binary searches these block heads and decodes a
+    single block.
+
+    File layout:
+        header          magic, version, number of terms, block size, number of blocks
+        idf             float32[terms]
+        df              uint32[terms]
+        segment         uint32[terms]
+        offset          uint64[terms]
+        block offsets   uint64[blocks] (relative to the start of the terms blob)
+        terms blob      front coded blocks
+
+    """
+    MAGIC = b"TDIC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIIII")
+
+    # offset of terms whose line position in the segment is not known (old terms data files)
+    UNKNOWN_OFFSET = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.terms, self.block_size, self.blocks = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RuntimeError("\"{}\" is not a valid term dictionary file".format(path))
+
+        # start of each array in the file
+        self.idf_start = self.HEADER.size
+        self.df_start = self.idf_start + 4 * self.terms
+        self.segment_start = self.df_start + 4 * self.terms
+        self.offset_start = self.segment_start + 4 * self.terms
+        self.blocks_start = self.offset_start + 8 * self.terms
+        self.blob_start = self.blocks_start + 8 * self.blocks
+
+        # sparse index with the first term of each block
+        self.heads = []
+        for block in range(self.blocks):
+            position = self.blob_start + struct.unpack_from("<Q", self.data, self.blocks_start + 8 * block)[0]
+            length, position = decode_varint(self.data, position)
+            self.heads.append(self.data[position:position + length])
+
+    @classmethod
+    def build(cls, terms_data_path, output_path, block_size=16):
+        """
+        Builds the dictionary file from a terms data file (sorted lines
+        of "term,idf,file_index[,df[,offset]]")
+
+        Parameters
+        ----------
+        terms_data_path
+            terms data file path
+        output_path
+            dictionary file path
+        block_size
+            number of terms of each front coded block
+        """
+        idfs = array("f")
+        dfs = array("I")
+        segments = array("I")
+        offsets = array("Q")
+        block_offsets = array("Q")
+        blob = bytearray()
+
+        previous = b""
+        with open(terms_data_path, "r", encoding="utf-8") as terms_data_file:
+            for line in terms_data_file:
+                data = line.strip().split(",")
+                term = data[0].encode("utf-8")
+
+                if len(idfs) % block_size == 0:
+                    # first term of the block, stored in full
+                    block_offsets.append(len(blob))
+                    encode_varint(len(term), blob)
+                    blob += term
+                else:
+                    # length of the prefix shared with the previous term and the remaining suffix
+                    prefix = 0
+                    while prefix < min(len(term), len(previous)) and term[prefix] == previous[prefix]:
+                        prefix += 1
+                    encode_varint(prefix, blob)
+                    encode_varint(len(term) - prefix, blob)
+                    blob += term[prefix:]
+
+                previous = term
+
+                idfs.append(float(data[1]))
+                segments.append(int(data[2]))
+                dfs.append(int(data[3]) if len(data) > 3 else 0)
+                offsets.append(int(data[4]) if len(data) > 4 else cls.UNKNOWN_OFFSET)
+
+        with open(output_path, "wb") as output_file:
+            output_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(idfs), block_size, len(block_offsets)))
+            for values in (idfs, dfs, segments, offsets, block_offsets):
+                # arrays are stored in little endian
+                if sys.byteorder == "big":
+                    values.byteswap()
+                output_file.write(values.tobytes())
+            output_file.write(blob)
+
+    def close(self):
+        """
+        Closes the dictionary file
+        """
+        self.data.close()
+        self.file.close()
+
+    def find(self, term):
+        """
+        Finds the ordinal of a term
+
+        Parameters
+        ----------
+        term
+            term to search for
+
+        Returns
+        ----------
+        ordinal
+            position of the term in the sorted terms, -1 if the term does not exist
+        """
+        term = term.encode("utf-8")
+
+        block = bisect_right(self.heads, term) - 1
+        if block < 0:
+            return -1
+
+        # decode the block until the term is found (or a greater term is reached)
+        position = self.blob_start + struct.unpack_from("<Q", self.data, self.blocks_start + 8 * block)[0]
+        length, position = decode_varint(self.data, position)
+        current = self.data[position:position + length]
+        position += length
+
+        ordinal = block * self.block_size
+        last = min(ordinal + self.block_size, self.terms)
+        while True:
+            if current == term:
+                return ordinal
+            if current > term or ordinal + 1 >= last:
+                return -1
+
+            prefix, position = decode_varint(self.data, position)
+            length, position = decode_varint(self.data, position)
+            current = current[:prefix] + self.data[position:position + length]
+            position += length
+            ordinal += 1
+
+    def get(self, term):
+        """
+        Gets the data of a term
+
+        Parameters
+        ----------
+        term
+            term to search for
+
+        Returns
+        ----------
+        data
+            (idf, df, segment, offset) tuple, None if the term does not exist
+            (offset is None in case it is not known)
+        """
+        ordinal = self.find(term)
+        if ordinal < 0:
+            return None
+
+        return self.get_entry(ordinal)
+
+    def get_entry(self, ordinal):
+        """
+        Gets the data of the term with a given ordinal
+
+        Parameters
+        ----------
+        ordinal
+            position of the term in the sorted terms
+
+        Returns
+        ----------
+        data
+            (idf, df, segment, offset) tuple (offset is None in case it is not known)
+        """
+        offset = struct.unpack_from("<Q", self.data, self.offset_start + 8 * ordinal)[0]
+
+        return (round(struct.unpack_from("<f", self.data, self.idf_start + 4 * ordinal)[0], 2),
+                struct.unpack_from("<I", self.data, self.df_start + 4 * ordinal)[0],
+                struct.unpack_from("<I", self.data, self.segment_start + 4 * ordinal)[0],
+                offset if offset != self.UNKNOWN_OFFSET else None)
+
+    def __contains__(self, term):
+        return self.find(term) >= 0
+
+    def __len__(self):
+        return self.terms
+
+    def __iter__(self):
+        """
+        Iterates over the terms of the dictionary in sorted order
+        """
+        for block in range(self.blocks):
+            position = self.blob_start + struct.unpack_from("<Q", self.data, self.blocks_start + 8 * block)[0]
+            length, position = decode_varint(self.data, position)
+            current = self.data[position:position + length]
+            position += length
+            yield current.decode("utf-8")
+
+            for _ in range(1, min(self.block_size, self.terms - block * self.block_size)):
+                prefix, position = decode_varint(self.data, position)
+                length, position = decode_varint(self.data, position)
+                current = current[:prefix] + self.data[position:position + length]
+                position += length
+                yield current.decode("utf-8")
@@ -0,0 +1,207 @@
+"""
+    impacts.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Impact ordered postings module
+
+    Holds the code/logic addressing the impact ordered copy
+    of the postings lists, used by the score-at-a-time query
+    processing to score the highest impact postings first and
+    stop once the query budget runs out.
+
+"""
+
+from utils import encode_varint, decode_varint
+
+import os                           # list the merged segments
+import mmap                         # memory map the impacts file
+import struct                       # pack fixed width values
+import sys                          # check the system byte order
+from array import array             # compact arrays used while building the impacts file
+
+
+class ImpactTable:
+    """
+    Impact ordered postings lists of an index generation
+
+    The postings of each term are grouped by their quantized
+    impact (the document side of their score contribution, the
+    tfidf weight or the BM25 term frequency component) into
+    impact segments, stored by decreasing impact. The docnos of
+    a segment are sorted and gap encoded. Deleted documents are
+    not removed, they must be skipped with the tombstones of the
+    generation.
+
+    File layout:
+        header          magic, version, number of terms, weighting, first docno, k1, b, impact scale
+        offsets         uint64[terms] (start of the term's entry in the impacts blob, indexed by the term ordinal)
+        impacts blob    (number of segments varint, (impact level uint8, number of postings varint,
+                         bytes of the docno gaps varint, docno gaps varint[postings])[segments])[terms]
+
+    The byte length of the docnos of each segment lets the segments
+    of a term be listed without decoding their docnos.
+
+    """
+    MAGIC = b"IMPC"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIIIQfff")
+
+    WEIGHTINGS = ("tfidf", "bm25")
+    LEVELS = 255
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.terms, weighting, self.first_docno, self.k1, self.b, self.scale = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RuntimeError("\"{}\" is not a valid impacts file".format(path))
+
+        self.weighting = self.WEIGHTINGS[weighting]
+        self.blob_start = self.HEADER.size + 8 * self.terms
+
+    @classmethod
+    def build(cls, index_folder, weighting, documents_table, k1=1.2, b=0.75):
+        """
+        Builds the impacts file of an index generation (`data/impacts.bin`)
+        from its merged segments
+
+        Parameters
+        ----------
+        index_folder
+            generation folder directory
+        weighting
+            "tfidf" (the postings hold normalized tfidf weights, which are the
+            impacts) or "bm25" (the postings hold term frequencies)
+        documents_table
+            documents table of the generation (BM25 length normalization)
+        k1
+            BM25 term frequency saturation parameter
+        b
+            BM25 length normalization parameter
+        """
+        # tfidf weights are rounded to 2 decimal places, so they are quantized without loss,
+        # the BM25 term frequency component is lower than k1 + 1
+        scale = 0.01 if weighting == "tfidf" else (k1 + 1) / cls.LEVELS
+
+        offsets = array("Q")
+        blob = bytearray()
+
+        # segments are read in their number order, so the terms follow the dictionary order
+        segment_names = sorted(os.listdir("{}/merged".format(index_folder)), key=lambda file: int(file.split(";")[0]))
+        for segment_name in segment_names:
+            with open("{}/merged/{}".format(index_folder, segment_name), "r", encoding="utf-8", newline="\n") as segment_file:
+                for line in segment_file:
+                    postings = line.rstrip("\n").split(";")
+
+                    # docnos of each impact level (in docno order)
+                    levels = {}
+                    for posting in postings[1:]:
+                        docno, weight, _ = posting.split(":", 2)
+                        docno, weight = int(docno), float(weight)
+
+                        if weighting == "bm25":
+                            dl_avdl = documents_table.get_length(docno) / documents_table.avdl
+                            weight = (k1 + 1) * weight / (k1 * ((1 - b) + b * dl_avdl) + weight)
+
+                        levels.setdefault(max(1, min(cls.LEVELS, round(weight / scale))), []).append(docno)
+
+                    offsets.append(len(blob))
+                    encode_varint(len(levels), blob)
+                    for level in sorted(levels, reverse=True):
+                        gaps = bytearray()
+                        previous = documents_table.first_docno
+                        for docno in levels[level]:
+                            encode_varint(docno - previous, gaps)
+                            previous = docno
+
+                        blob.append(level)
+                        encode_varint(len(levels[level]), blob)
+                        encode_varint(len(gaps), blob)
+                        blob += gaps
+
+        with open("{}/data/impacts.bin".format(index_folder), "wb") as impacts_file:
+            impacts_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(offsets), cls.WEIGHTINGS.index(weighting), documents_table.first_docno, k1, b, scale))
+            # arrays are stored in little endian
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            impacts_file.write(offsets.tobytes())
+            impacts_file.write(blob)
+
+    def close(self):
+        """
+        Closes the impacts file
+        """
+        self.data.close()
+        self.file.close()
+
+    def get(self, ordinal):
+        """
+        Gets the impact segments of a term (without decoding their docnos)
+
+        Parameters
+        ----------
+        ordinal
+            position of the term in the terms dictionary
+
+        Returns
+        ----------
+        segments
+            list of (impact, number of postings, position of the docnos)
+            tuples, by decreasing impact
+        """
+        position = self.blob_start + struct.unpack_from("<Q", self.data, self.HEADER.size + 8 * ordinal)[0]
+        segments_num, position = decode_varint(self.data, position)
+
+        segments = []
+        for _ in range(segments_num):
+            level = self.data[position]
+            postings_num, position = decode_varint(self.data, position + 1)
+
+            # skip the docnos of the segment by their byte length
+            docnos_length, position = decode_varint(self.data, position)
+            segments.append((level * self.scale, postings_num, position))
+            position += docnos_length
+
+        return segments
+
+    def read_docnos(self, position, postings_num):
+        """
+        Decodes the docnos of an impact segment
+
+        Parameters
+        ----------
+        position
+            position of the docnos of the segment
+        postings_num
+            number of docnos to decode (the first ones of the segment)
+
+        Yields
+        ----------
+        docno
+            docno of each posting of the segment
+        """
+        docno = self.first_docno
+        for _ in range(postings_num):
+            gap, position = decode_varint(self.data, position)
+            docno += gap
+            yield docno
@@ -29,6 +29,12 @@
 """
 
 from utils import dynamically_init_class
+from dictionary import TermDictionary
+from token_cache import TokenStreamCache
+from postings import SkipTable, ChampionTable
+from impacts import ImpactTable
+from profiling import MemoryProfiler
+from blocks import get_block_path, is_block, open_block, BlockWriter, WRITE_BUFFER_SIZE, merge_block_files, recover_block_merge
 
 import psutil                       # check available system memory
 import os                           # manage folders
@@ -36,6 +42,14 @@ import sys                          # get size of objects
 from time import time
 import math
 import json                         # save metadata in json format
+import shutil                       # remove and move generation folders
+import threading                    # background merging of generations
+from concurrent.futures import ProcessPoolExecutor     # background merging of blocks
+import heapq                        # k-way merge of the blocks
+from itertools import islice        # skip the documents indexed before a resume
+import struct                       # binary documents table
+import mmap                         # memory map the documents table
+from array import array             # compact arrays of the documents table
 
 def dynamically_init_indexer(**kwargs):
     """Dynamically initializes a Indexer object from this
@@ -75,6 +89,114 @@ class Indexer:
     def get_index(self):
         return self._index
     
+    def save_checkpoint(self, index_output_folder, reader, docs_data, block_counter, documents, total_length, complete=False):
+        """
+        Auxiliar function to save the indexing progress once a block is written to disk,
+        the documents data of the documents indexed since the last checkpoint
+        is appended to the checkpoint documents file and the checkpoint file
+        (number of documents and blocks and counters) is replaced atomically
+
+        Parameters
+        ----------
+        index_output_folder
+            output folder directory (of the generation being built)
+        reader
+            reader object
+        docs_data
+            (pmids, lengths, lnc norms, lnu norms) arrays of the indexed documents
+        block_counter
+            number of blocks written to disk
+        documents
+            number of documents indexed in the written blocks
+        total_length
+            total number of terms of those documents
+        complete
+            True in case every document of the collection was indexed
+        """
+        if (not os.path.exists("{}/data".format(index_output_folder))):
+            os.makedirs("{}/data".format(index_output_folder))
+
+        # the documents data file is only appended to, the checkpoint file holds its valid length
+        with open("{}/data/checkpoint_docs.bin".format(index_output_folder), "r+b" if self.checkpoint_documents > 0 else "wb") as docs_file:
+            docs_file.seek(self.checkpoint_documents * self.CHECKPOINT_DOCUMENT.size)
+            docs_file.truncate()
+            for i in range(self.checkpoint_documents, documents):
+                docs_file.write(self.CHECKPOINT_DOCUMENT.pack(*[values[i] for values in docs_data]))
+            docs_file.flush()
+            os.fsync(docs_file.fileno())
+        self.checkpoint_documents = documents
+
+        checkpoint = {"version": 1, "collection": os.path.abspath(reader.path_to_collection), "rsv": self.rsv, "smart_notation": getattr(self, "smart_notation", None),
+                      "first_docno": self.first_docno, "documents": documents, "total_length": total_length, "blocks": block_counter, "complete": complete}
+
+        with open("{}/data/checkpoint.json.tmp".format(index_output_folder), "w", encoding="utf-8") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=4)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace("{}/data/checkpoint.json.tmp".format(index_output_folder), "{}/data/checkpoint.json".format(index_output_folder))
+
+    def load_checkpoint(self, index_output_folder, reader):
+        """
+        Auxiliar function to load the indexing progress saved by an interrupted
+        build, the blocks written after the last checkpoint are deleted
+
+        Parameters
+        ----------
+        index_output_folder
+            output folder directory (of the generation being built)
+        reader
+            reader object
+
+        Returns
+        ----------
+        checkpoint
+            (checkpoint dictionary, (pmids, lengths, lnc norms, lnu norms) arrays)
+            tuple, None in case there is no checkpoint
+        """
+        if (not os.path.exists("{}/data/checkpoint.json".format(index_output_folder))):
+            return None
+
+        with open("{}/data/checkpoint.json".format(index_output_folder), "r", encoding="utf-8") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+
+        if (checkpoint["collection"] != os.path.abspath(reader.path_to_collection) or checkpoint["rsv"] != self.rsv or
+                checkpoint["smart_notation"] != getattr(self, "smart_notation", None) or checkpoint["first_docno"] != self.first_docno):
+            raise RuntimeError("The checkpoint of \"{}\" was saved by a build of \"{}\" with other settings, it can not be resumed".format(index_output_folder, checkpoint["collection"]))
+
+        docs_data = (array("Q"), array("f"), array("f"), array("f"))
+        with open("{}/data/checkpoint_docs.bin".format(index_output_folder), "rb") as docs_file:
+            data = docs_file.read(checkpoint["documents"] * self.CHECKPOINT_DOCUMENT.size)
+        for document in self.CHECKPOINT_DOCUMENT.iter_unpack(data):
+            for values, value in zip(docs_data, document):
+                values.append(value)
+
+        # block merge and blocks that were being written when the build was interrupted
+        recover_block_merge(index_output_folder, "{}/data/block_merge.json".format(index_output_folder))
+        for file_name in os.listdir(index_output_folder):
+            if is_block(file_name) and int(file_name.split(".")[0]) >= checkpoint["blocks"]:
+                os.remove("{}/{}".format(index_output_folder, file_name))
+
+        self.checkpoint_documents = checkpoint["documents"]
+
+        return (checkpoint, docs_data)
+
+    def remove_checkpoint(self, index_output_folder):
+        """
+        Auxiliar function to delete the checkpoint files of a build and the
+        blocks left by an interrupted build that is not resumed
+        """
+        for file_name in ("checkpoint.json", "checkpoint_docs.bin"):
+            if (os.path.exists("{}/data/{}".format(index_output_folder, file_name))):
+                os.remove("{}/data/{}".format(index_output_folder, file_name))
+
+        recover_block_merge(index_output_folder, "{}/data/block_merge.json".format(index_output_folder))
+        if (os.path.exists(index_output_folder)):
+            for file_name in os.listdir(index_output_folder):
+                if is_block(file_name):
+                    os.remove("{}/{}".format(index_output_folder, file_name))
+
+        self.checkpoint_documents = 0
+
     def build_index(self, reader, tokenizer, index_output_folder):
         """
         Holds the logic for the indexing algorithm.
@@ -103,25 +225,71 @@ class SPIMIIndexer(Indexer):
     spimi algorithm.
 
     """
+    CHECKPOINT_DOCUMENT = struct.Struct("<Qfff")    # pmid, length, lnc norm and lnu norm of each checkpointed document
+
     def __init__(self, 
                  posting_threshold, 
                  memory_threshold,
                  rsv,
+                 incremental=False,
+                 merge_factor=4,
+                 final_merge=False,
+                 delete_pmids=None,
+                 token_cache=None,
+                 impact_ordered=False,
+                 champions=None,
+                 memory_profile=None,
+                 resume=False,
+                 block_codec="none",
+                 block_level=1,
+                 block_merge_factor=None,
                  **kwargs):
         # lets suppose that the SPIMIIindex uses the inverted index, so
         # it initializes this type of index
         super().__init__(InvertedIndex(), **kwargs)
-        print("init SPIMIIndexer|", f"{posting_threshold=}, {memory_threshold=}, {rsv=}")
+        print("init SPIMIIndexer|", f"{posting_threshold=}, {memory_threshold=}, {rsv=}, {incremental=}, {merge_factor=}, {final_merge=}, {delete_pmids=}, {token_cache=}, {impact_ordered=}, {champions=}, {memory_profile=}, {resume=}, {block_codec=}, {block_level=}, {block_merge_factor=}")
         if kwargs:
             print(f"{self.__class__.__name__} also caught the following additional arguments {kwargs}")
             if ("smart_notation" in kwargs):
                 self.smart_notation = kwargs["smart_notation"]
 
         self.rsv = rsv
+        self.posting_threshold = posting_threshold  # postings of a block written to disk even with free memory (None if only the memory is checked)
         self.total_documents = 0
-        self.docs_data = {}
+        self.total_length = 0           # total number of terms of the indexed documents
+        self.first_docno = 0            # docno (internal document number) of the first indexed document
         self.average_doc_length = 0     # avdl
 
+        # incremental indexing attributes
+        self.incremental = incremental
+        self.merge_factor = merge_factor
+        self.final_merge = final_merge
+        self.merge_thread = None
+        self.delete_pmids = delete_pmids
+        self.indexed_pmids = []         # pmids indexed in incremental mode (older versions are deleted)
+
+        self.token_cache = token_cache  # folder of the tokenized collections cache
+
+        self.impact_ordered = impact_ordered    # also write an impact ordered copy of the postings
+        self.champions = champions              # number of postings of the champion lists (None if they are not written)
+
+        # memory usage samples written at each block flush and merge checkpoint (None if not profiled)
+        self.memory_profiler = MemoryProfiler(memory_profile) if memory_profile is not None else None
+
+        # checkpoints saved after each block flush, an interrupted build can be resumed from the last one
+        self.resume = resume
+        self.checkpoint_documents = 0   # documents whose data is in the checkpoint documents file
+
+        # codec ("none", "gzip" or "zlib") and compression level of the temporary blocks
+        self.block_codec = block_codec
+        self.block_level = block_level
+
+        # blocks merged in the background while indexing (None if they are only merged at the end)
+        self.block_merge_factor = block_merge_factor
+        self.block_levels = []          # (block number, level) of the blocks written by this build, in order
+        self.block_merge = None         # future of the running block merge
+        self.block_merge_pool = None
+
         # statistics attributes
         self.indexing_time = 0.0
         self.merging_time = 0.0
@@ -132,29 +300,85 @@ class SPIMIIndexer(Indexer):
 
     def save_metadata(self, minL, stopwords_path, stemmer_name, rsv, index_output_folder):
         """
-        Method to save metadata used on index to be loaded later by the searcher
+        Method to save the index manifest, that holds the metadata used on index
+        (to be loaded later by the searcher) together with the generations of the index
         """
-        # make sure output folder exists
-        if (not os.path.exists("metadata")):
-            os.makedirs("metadata")
+        metadata = {"tokenizer": {"minL": minL, "stopwords_path": stopwords_path, "stemmer": stemmer_name}, "rsv": rsv, "smart_notation": getattr(self, "smart_notation", None)}
 
-        print("\nSaving metadata file in path \"metadata/metadata.json\"... ")
+        self.save_manifest(index_output_folder, metadata)
 
-        if rsv == "tfidf":
-            metadata_dict = {"metadata": {"tokenizer": {"minL": minL, "stopwords_path": stopwords_path, "stemmer": stemmer_name}, "rsv": rsv, "smart_notation": self.smart_notation, "index_output_folder": index_output_folder} }
-        else:
-            metadata_dict = {"metadata": {"tokenizer": {"minL": minL, "stopwords_path": stopwords_path, "stemmer": stemmer_name}, "rsv": rsv, "index_output_folder": index_output_folder} }
-        
-            
+    def save_manifest(self, index_output_folder, metadata=None):
+        """
+        Method to save the self-describing manifest of an index (`data/manifest.json`),
+        with the metadata used on index and the segments, counts and file sizes of
+        each generation
 
-        with open("metadata/metadata.json", "w") as metadata_file:
-            json.dump(metadata_dict, metadata_file)
-        
+        Parameters
+        ----------
+        index_output_folder
+            index root folder
+        metadata
+            tokenizer settings, rsv and smart notation of the index, the ones
+            of the existing manifest are kept in case it is not given
+        """
+        manifest_path = "{}/data/manifest.json".format(index_output_folder)
+
+        if metadata is None:
+            with open(manifest_path, "r", encoding="utf-8") as manifest_file:
+                metadata = json.load(manifest_file)["metadata"]
+
+        print("\nSaving index manifest in path \"{}\"... ".format(manifest_path))
+
+        generations = []
+        for generation in self.load_generations(index_output_folder)["generations"]:
+            generation_folder = "{}/{}".format(index_output_folder, generation["folder"])
+
+            term_dictionary = TermDictionary("{}/data/terms_dict.bin".format(generation_folder))
+            terms = len(term_dictionary)
+            term_dictionary.close()
+
+            generations.append({**generation,
+                                "terms": terms,
+                                "deleted": len(TombstoneBitmap.load("{}/data/tombstones.bin".format(generation_folder))),
+                                "segments": [{"name": file_name, "size": os.path.getsize("{}/merged/{}".format(generation_folder, file_name))}
+                                             for file_name in sorted(os.listdir("{}/merged".format(generation_folder)))],
+                                "files": {file_name: os.path.getsize("{}/data/{}".format(generation_folder, file_name))
+                                          for file_name in sorted(os.listdir("{}/data".format(generation_folder))) if file_name != "manifest.json"}})
+
+        manifest = {"version": 1,
+                    "metadata": metadata,
+                    "documents": sum([generation["documents"] for generation in generations]),
+                    "total_length": sum([generation["total_length"] for generation in generations]),
+                    "deleted": sum([generation["deleted"] for generation in generations]),
+                    "size": sum([sum([segment["size"] for segment in generation["segments"]]) + sum(generation["files"].values()) for generation in generations]),
+                    "generations": generations}
+
+        with open(manifest_path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file, indent=4)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def profile_memory(self, event, structures, **details):
+        """
+        Auxiliar function to write a memory usage sample, in case the
+        memory profiling is enabled
 
-    def write_to_disk(self, index_output_folder, indexes_dict, terms_list, file_name, terms_data_file=None, terms_data_num=None):
+        Parameters
+        ----------
+        event
+            name of the checkpoint (block flush, merged segment, ...)
+        structures
+            dictionary with the in-memory structures of the checkpoint, by name
+        details
+            additional values written with the sample
+        """
+        if self.memory_profiler is not None:
+            self.memory_profiler.sample(event, structures, **details)
+
+    def write_to_disk(self, index_output_folder, indexes_dict, terms_list, file_name, terms_data_file=None, terms_data_num=None, term_positions=None):
         """
         Method that receives a dictionary and all its terms in an ordered list
-        and writes the dictionary to disk in alphabetical order
+        and writes the dictionary to disk in alphabetical order, the lines are
+        written in large buffers
 
         Parameters
         ----------
@@ -166,34 +390,117 @@ class SPIMIIndexer(Indexer):
             ordered terms list
         file_name
             output file name
+        terms_data_file
+            terms data file (in merging phase)
+        terms_data_num
+            number of the merged file (in merging phase)
+        term_positions
+            term positions of the postings of the dictionary (the ones of the
+            block being filled in case they are not given)
         """
+        if term_positions is None:
+            term_positions = self.term_positions
+
         # make sure output folder exists
         if (not os.path.exists(index_output_folder)):
             os.makedirs(index_output_folder)
 
-        print("Writing indexes to file \"{}.txt\"... ".format(file_name), end="")
+        block_path = get_block_path(index_output_folder, file_name, self.block_codec)
+
+        # byte offset of the current line, saved in the terms data file so that the searcher can seek to it
+        offset = 0
 
-        with open("{}/{}.txt".format(index_output_folder, file_name), "w", encoding="utf-8") as output_file:
+        # lines waiting to be written and their number of characters
+        lines = []
+        buffered = 0
+
+        # compressed blocks are written through a compression stream
+        with open_block(block_path, "w", self.block_level) as output_file:
             for term in terms_list:
                 # NOTE: what is the correct format to write to files?
                 #output_file.write('{"%s": %s}\n' % (term, json.dumps(indexes_dict[term])))
 
-                output_file.write(term)
-                for doc_id, term_weight in indexes_dict[term].items():
-                    output_file.write(';{}:{}:'.format(doc_id, term_weight))
-
-                    output_file.write(self.term_positions[term + doc_id])
+                line = term + "".join([';{}:{}:{}'.format(doc_id, term_weight, term_positions[term + doc_id]) for doc_id, term_weight in indexes_dict[term].items()]) + "\n"
+                lines.append(line)
+                buffered += len(line)
 
-                output_file.write('\n')
+                if buffered >= WRITE_BUFFER_SIZE:
+                    output_file.write("".join(lines))
+                    lines.clear()
+                    buffered = 0
 
                 # in merging phase, also write a terms data file to memory
                 if terms_data_file is not None:
-                    # (term, idf, doc_index)
-                    terms_data_file.write("{},{},{}\n".format(term, round(math.log(self.total_documents / len(indexes_dict[term]), 10), 2), terms_data_num))
+                    # (term, idf, doc_index, df, offset)
+                    terms_data_file.write("{},{},{},{},{}\n".format(term, round(math.log(self.total_documents / len(indexes_dict[term]), 10), 2), terms_data_num, len(indexes_dict[term]), offset))
+
+                offset += len(line.encode("utf-8"))
+
+            output_file.write("".join(lines))
+
+        print("Writing indexes to file \"{}\"... Done!".format(os.path.basename(block_path)))
+
+    def write_block(self, index_output_folder, indexes_dict, term_positions, block_num):
+        """
+        Auxiliar function to sort the terms of a full block and write it to
+        disk, called by the background block writer
 
-        print("Done!")
+        Parameters
+        ----------
+        index_output_folder
+            output folder directory
+        indexes_dict
+            dictionary of the block
+        term_positions
+            term positions of the postings of the block
+        block_num
+            number of the block
+        """
+        terms_list = list(indexes_dict.keys())
+        terms_list.sort()
+
+        self.write_to_disk(index_output_folder, indexes_dict, terms_list, block_num, term_positions=term_positions)
 
         
+    def read_documents(self, reader, tokenizer, skip=0):
+        """
+        Auxiliar function to read and tokenize the documents of the collection,
+        in case a token cache folder is given the tokenized documents are read
+        from the cache (when the collection was already tokenized with the same
+        settings) or saved to it
+
+        Parameters
+        ----------
+        reader
+            reader object
+        tokenizer
+            tokenizer object
+        skip
+            number of documents at the start of the collection that are skipped
+            without being tokenized (already indexed before a resume)
+
+        Yields
+        ----------
+        document
+            (pmid, token stream) tuple of each document
+        """
+        documents = ((document["pmid"], tokenizer.tokenize(document["title"] + document["abstract"])) for document in islice(reader.read_json(), skip, None))
+
+        if self.token_cache is None:
+            yield from documents
+            return
+
+        cache = TokenStreamCache(self.token_cache, reader.path_to_collection, tokenizer)
+        if cache.exists():
+            print("Reading tokenized documents from cache \"{}\"...".format(cache.path))
+            yield from islice(cache.read(), skip, None)
+        elif skip > 0:
+            # the cache must hold the whole collection, so it is not written by a resumed build
+            yield from documents
+        else:
+            print("Saving tokenized documents to cache \"{}\"...".format(cache.path))
+            yield from cache.write(documents)
+
     def build_index(self, reader, tokenizer, index_output_folder):
         """
         Function responsible for implementing the inverted index and
@@ -225,264 +532,932 @@ class SPIMIIndexer(Indexer):
 
         self.term_positions = {}
 
-        # read each line that is being returned by the reader
-        for document in reader.read_json():
+        # documents are identified in the postings by their docno (sequential number in reading order),
+        # their pmid and length are saved in the documents table
+        docs_pmids = array("Q")
+        docs_lengths = array("f")
+        docs_lnc_norms = array("f")
+        docs_lnu_norms = array("f")
+
+        # resume an interrupted build from its last checkpoint (the documents of its blocks are skipped)
+        checkpoint = self.load_checkpoint(index_output_folder, reader) if self.resume else None
+        if checkpoint is not None:
+            checkpoint, (docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms) = checkpoint
+            block_counter = checkpoint["blocks"]
+            self.total_documents = checkpoint["documents"]
+            self.total_length = checkpoint["total_length"]
+            if self.incremental:
+                self.indexed_pmids = [str(pmid) for pmid in docs_pmids]
+
+            print("Resuming from checkpoint: {} documents and {} blocks already indexed{}".format(self.total_documents, block_counter, ", merging" if checkpoint["complete"] else ""))
+        else:
+            self.remove_checkpoint(index_output_folder)
+
+        documents = self.read_documents(reader, tokenizer, self.total_documents) if checkpoint is None or not checkpoint["complete"] else []
+
+        # full blocks are sorted and written by a background writer while the next block is filled,
+        # the checkpoint of a block is saved once it was written (blocks, documents and total length)
+        block_writer = BlockWriter(self.write_block)
+        pending_checkpoint = None
+        block_postings = 0      # postings of the block being filled
+
+        # read each tokenized document
+        for pmid, document_tokens in documents:
             # count total documents
             self.total_documents += 1
+            doc_id = str(self.first_docno + self.total_documents - 1)
+
+            if self.incremental:
+                self.indexed_pmids.append(pmid)
 
             # tokenize the document
-            token_stream += tokenizer.tokenize(document["title"] + document["abstract"])
+            token_stream += document_tokens
+            self.total_length += len(token_stream)
+
+            docs_pmids.append(int(pmid))
+            docs_lengths.append(len(token_stream))
 
             # term positions list
             for i in range(len(token_stream)):
-                if token_stream[i] + document["pmid"] in self.term_positions.keys():
-                    self.term_positions[token_stream[i] + document["pmid"]] += ",{}".format(i)
+                if token_stream[i] + doc_id in self.term_positions.keys():
+                    self.term_positions[token_stream[i] + doc_id] += ",{}".format(i)
                 else:
-                    self.term_positions[token_stream[i] + document["pmid"]] = str(i) 
+                    self.term_positions[token_stream[i] + doc_id] = str(i) 
+
+            # get dictionary of raw term frequencies
+            term_freq_dict = {term:token_stream.count(term) for term in token_stream}
+
+            # normalization factors of the document, so that the tfidf weights can be computed at query time
+            #   lnc -> length of the document (cosine normalization of the "l" weights)
+            #   lnu -> number of unique terms of the document
+            lnc_norm = math.sqrt(sum([(1 + math.log(value, 10)) ** 2 for value in term_freq_dict.values()]))
+            lnu_norm = len(term_freq_dict)
+            docs_lnc_norms.append(lnc_norm)
+            docs_lnu_norms.append(lnu_norm)
 
             # TFIDF rsv
             if self.rsv == "tfidf":
                 # get dictionary of weighted terms
-                term_weight_dict = {term:(1 + math.log(token_stream.count(term), 10)) for term in token_stream}
+                term_weight_dict = {term:(1 + math.log(value, 10)) for term, value in term_freq_dict.items()}
 
                 if self.smart_notation == "lnc.ltc" or self.smart_notation == "lnc.lnc":
                     # calculate length of the document
-                    doc_length = math.sqrt(sum([value ** 2 for value in term_weight_dict.values()]))
+                    doc_length = lnc_norm
 
                     # normalize weight
                     term_weight_dict = {k: round(v / doc_length, 2) for k, v in term_weight_dict.items()}
 
                 elif self.smart_notation == "lnu.ltc":
                     # calculate length of the document
-                    doc_length = len(term_weight_dict)
+                    doc_length = lnu_norm
 
                     # normalize weight
                     term_weight_dict = {k: round(v / doc_length, 2) for k, v in term_weight_dict.items()}
 
-            # BM25 rsv
+            # BM25 and raw rsv (raw term frequencies)
             else:
-                # get dictionary of weighted terms
-                term_weight_dict = {term:token_stream.count(term) for term in token_stream}
-
-                # total document terms
-                total_terms = sum(term_weight_dict.values())
-
-                # save document data containing document id and total terms
-                self.docs_data[document["pmid"]] = total_terms
+                term_weight_dict = term_freq_dict
 
             # add "term: (docid, term_weight)" to dicionary - SPIMI inverted indexer
             for term, weight in term_weight_dict.items():
-                self._index.add_term(term, document["pmid"], indexes_dict, weight)
+                self._index.add_term(term, doc_id, indexes_dict, weight)
+            block_postings += len(term_weight_dict)
 
             token_stream.clear()
 
             #print('Available: ', self.memory_threshold, synthetic_memory - psutil.virtual_memory().available)
 
-            # check if we did not exceed our memory limit
-            if (self.total_documents % 1000 == 0) or (synthetic_memory - psutil.virtual_memory().available < 0):
+            # check if we did not exceed our memory limit (nor the postings limit of a block)
+            block_full = self.posting_threshold is not None and block_postings >= self.posting_threshold
+            if not block_full and ((self.total_documents % 1000 == 0) or (synthetic_memory - psutil.virtual_memory().available < 0)):
                 continue
 
-            # memory full, write to disk and reset indexes dictionary
-            terms_list = list(indexes_dict.keys())
-            terms_list.sort()
-
-            self.write_to_disk(index_output_folder, indexes_dict, terms_list, block_counter)
+            # memory full, hand off the block to the background writer and fill a new one
+            self.profile_memory("block_flush", {"indexes_dict": indexes_dict, "term_positions": self.term_positions,
+                                                "docs_data": [docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms]}, block=block_counter, documents=self.total_documents)
+            block_writer.submit(index_output_folder, indexes_dict, self.term_positions, block_counter)
             block_counter += 1
 
-            indexes_dict.clear()
-            self.term_positions.clear()
+            indexes_dict = {}
+            self.term_positions = {}
+            block_postings = 0
+
+            # handing off a block waits for the previous one, whose checkpoint can now be saved
+            if pending_checkpoint is not None:
+                self.save_checkpoint(index_output_folder, reader, (docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms), *pending_checkpoint)
+                self.apply_block_merge_policy(index_output_folder, pending_checkpoint[0] - 1)
+            pending_checkpoint = (block_counter, self.total_documents, self.total_length)
 
         # end of file, write to disk and reset indexes dictionary
         if len(indexes_dict) > 0:
-            terms_list = list(indexes_dict.keys())
-            terms_list.sort()
-
-            self.write_to_disk(index_output_folder, indexes_dict, terms_list, block_counter)
+            self.profile_memory("block_flush", {"indexes_dict": indexes_dict, "term_positions": self.term_positions,
+                                                "docs_data": [docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms]}, block=block_counter, documents=self.total_documents)
+            block_writer.submit(index_output_folder, indexes_dict, self.term_positions, block_counter)
             block_counter += 1
 
-            indexes_dict.clear()
-            self.term_positions.clear()
+            indexes_dict = {}
+            self.term_positions = {}
+
+        block_writer.wait()
+
+        # every document was indexed, a resumed build goes straight to the merge
+        self.save_checkpoint(index_output_folder, reader, (docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms), block_counter, self.total_documents, self.total_length, complete=True)
+
+        # only the blocks left by the background merges are merged at the end
+        self.wait_for_block_merges()
 
         self.indexing_time = (time() - index_start) # register total timestamp for indexing time
 
+        # documents table (docno -> pmid, document length)
+        if (not os.path.exists("{}/data".format(index_output_folder))):
+            os.makedirs("{}/data".format(index_output_folder))
+        DocumentsTable.write("{}/data/docs_table.bin".format(index_output_folder), self.first_docno, docs_pmids, docs_lengths, docs_lnc_norms, docs_lnu_norms)
+
         # merging step #################
 
         merge_start = time()
-        self.merge_blocks(index_output_folder)
+        self.merge_blocks(index_output_folder, self.champions)
+        if self.impact_ordered:
+            self.build_impacts(index_output_folder)
         self.merging_time = (time() - merge_start)  # register total timestamp for merging time
 
+        self.remove_checkpoint(index_output_folder)
+
         # register total index size on disk
         for file in os.scandir("{}/merged/".format(index_output_folder)):
             self.ind_size += os.path.getsize(file)
 
-        # save aditional data file in case of BM25 rsv
-        if self.rsv == "bm25":
-            with open("{}/data/docs_data.txt".format(index_output_folder), "w", encoding="utf-8") as docs_data_file:
-                avdl = sum(self.docs_data.values()) / self.total_documents
-                for doc_id, dl in self.docs_data.items():
-                    docs_data_file.write("{},{:.2f}\n".format(doc_id, dl / avdl))
+    def apply_block_merge_policy(self, index_output_folder, block_num):
+        """
+        Method to merge the blocks in the background while indexing, following
+        a logarithmic policy: whenever `block_merge_factor` consecutive blocks
+        have the same level they are merged (by a background process) into a
+        block of the next level, named after the first of them. Only one merge
+        runs at a time, a due merge is started once the running one finished
+
+        Parameters
+        ----------
+        index_output_folder
+            output folder directory (of the generation being built)
+        block_num
+            number of the block that was written to disk
+        """
+        if self.block_merge_factor is None:
+            return
+
+        self.block_levels.append((block_num, 0))
 
-            self.docs_data.clear()
+        if self.block_merge is not None:
+            if not self.block_merge.done():
+                return
+            self.block_merge.result()       # raise the errors of the merge
+            self.block_merge = None
 
-    def get_smaller_term_index(self, list):
+        for start in range(len(self.block_levels) - self.block_merge_factor + 1):
+            run = self.block_levels[start:start + self.block_merge_factor]
+            if any([level != run[0][1] for _, level in run]):
+                continue
+
+            if self.block_merge_pool is None:
+                self.block_merge_pool = ProcessPoolExecutor(max_workers=1)
+
+            print("Merging blocks {} in the background...".format(", ".join([str(num) for num, _ in run])))
+            block_paths = [get_block_path(index_output_folder, num, self.block_codec) for num, _ in run]
+            self.block_merge = self.block_merge_pool.submit(merge_block_files, block_paths, block_paths[0], "{}/data/block_merge.json".format(index_output_folder), self.block_level)
+
+            self.block_levels[start:start + self.block_merge_factor] = [(run[0][0], run[0][1] + 1)]
+            break
+
+    def wait_for_block_merges(self):
         """
-        Auxiliar function to get the index of the alphabetical first term
-        in a given list
-        
+        Auxiliar function to wait for the background block merge to finish
+        """
+        if self.block_merge is not None:
+            print("\nWaiting for background block merges to finish...")
+            self.block_merge.result()
+            self.block_merge = None
+
+        if self.block_merge_pool is not None:
+            self.block_merge_pool.shutdown()
+            self.block_merge_pool = None
+
+        self.block_levels.clear()
+
+    def load_generations(self, index_output_folder):
+        """
+        Auxiliar function to load the list of generations (independently built
+        pieces of the index) of an existing index
+
         Parameters
         ----------
-        list
-            list to be searched
-                
+        index_output_folder
+            index root folder
+
         Returns
         ----------
-        min
-            index of the first alphabetical term
+        generations
+            generations dictionary, None in case the index does not exist
         """
-        min = None
-        for i in range(len(list)):
-            if min is None and list[i][0] is not None:
-                min = i
-            elif list[i][0] is not None and list[i][0] < list[min][0]:
-                min = i
+        if (not os.path.exists("{}/data/generations.json".format(index_output_folder))):
+            return None
 
-        return min
+        with open("{}/data/generations.json".format(index_output_folder), "r", encoding="utf-8") as generations_file:
+            return json.load(generations_file)
 
-    
-    def add_to_dictionary(self, line, dictionary):
+    def save_generations(self, index_output_folder, generations):
         """
-        Auxiliar function to add a list containing a term and the documents where
-        it occurs to a dictionary
-        
+        Auxiliar function to save the list of generations of an index, the
+        file is replaced atomically so that a searcher never sees a half
+        written list
+
         Parameters
         ----------
-        line
-            list containing term and documents where it occurs
-        dictionary
-            dictionary where the parsed list will be added
+        index_output_folder
+            index root folder
+        generations
+            generations dictionary
         """
-        for i in range(1, len(line)):
-            doc_info = line[i].split(":")
+        if (not os.path.exists("{}/data".format(index_output_folder))):
+            os.makedirs("{}/data".format(index_output_folder))
 
-            if line[0] not in dictionary.keys():
-                dictionary[line[0]] = {doc_info[0]: float(doc_info[1])}
-            else:
-                dictionary[line[0]][doc_info[0]] = float(doc_info[1])
+        with open("{}/data/generations.json.tmp".format(index_output_folder), "w", encoding="utf-8") as generations_file:
+            json.dump(generations, generations_file, indent=4)
 
-            # term positions list
-            self.term_positions[line[0] + doc_info[0]] = doc_info[2]
+        os.replace("{}/data/generations.json.tmp".format(index_output_folder), "{}/data/generations.json".format(index_output_folder))
 
+    def build_generation(self, reader, tokenizer, index_output_folder):
+        """
+        Entry point of the indexer, builds a full index or, in incremental mode,
+        indexes the documents of the reader into a new generation of an existing
+        index, updating its documents count, idf values and avdl
 
-    def get_next_line(self, file):
+        Parameters
+        ----------
+        reader
+            reader object
+        tokenizer
+            tokenizer object
+        index_output_folder
+            index root folder
         """
-        Function to get next line of given file and split by delimiter
-        
+        generations = self.load_generations(index_output_folder)
+
+        # full build, the index root folder holds the only generation
+        if not self.incremental or generations is None:
+            if (os.path.exists("{}/generations".format(index_output_folder))):
+                shutil.rmtree("{}/generations".format(index_output_folder))
+            if (os.path.exists("{}/data/tombstones.bin".format(index_output_folder))):
+                os.remove("{}/data/tombstones.bin".format(index_output_folder))
+
+            self.first_docno = 0
+            self.build_index(reader, tokenizer, index_output_folder)
+
+            generations = {"rsv": self.rsv, "smart_notation": getattr(self, "smart_notation", None), "impact_ordered": self.impact_ordered, "champions": self.champions, "next_id": 1, "next_docno": self.total_documents,
+                           "generations": [{"id": 0, "folder": ".", "first_docno": 0, "documents": self.total_documents, "total_length": self.total_length}]}
+            self.save_generations(index_output_folder, generations)
+            return
+
+        if generations["rsv"] != self.rsv or generations["smart_notation"] != getattr(self, "smart_notation", None):
+            raise RuntimeError("Incremental indexing must use the same rsv and smart notation of the existing index ({}, {})".format(generations["rsv"], generations["smart_notation"]))
+
+        # every generation of an impact ordered index has its impacts file
+        self.impact_ordered = self.impact_ordered or generations.get("impact_ordered", False)
+        generations["impact_ordered"] = self.impact_ordered
+
+        # and its champion lists
+        self.champions = self.champions or generations.get("champions")
+        generations["champions"] = self.champions
+
+        # index the new documents into a new generation
+        # the docnos of the new generation follow the ones of the existing generations
+        generation = {"id": generations["next_id"], "folder": "generations/{}".format(generations["next_id"]), "first_docno": generations["next_docno"]}
+        print("\nIndexing new generation {} of \"{}/\"...".format(generation["id"], index_output_folder))
+
+        self.first_docno = generation["first_docno"]
+        self.build_index(reader, tokenizer, "{}/{}".format(index_output_folder, generation["folder"]))
+
+        generation["documents"] = self.total_documents
+        generation["total_length"] = self.total_length
+        generations["generations"].append(generation)
+        generations["next_id"] += 1
+        generations["next_docno"] += self.total_documents
+        self.save_generations(index_output_folder, generations)
+
+        # documents that were indexed again are updates, so their older versions are deleted
+        self.add_tombstones(index_output_folder, generations["generations"][:-1], self.indexed_pmids)
+        self.indexed_pmids.clear()
+
+        # merge generations in the background according to the merge policy
+        self.merge_thread = threading.Thread(target=self.apply_merge_policy, args=(index_output_folder,))
+        self.merge_thread.start()
+
+    def add_tombstones(self, index_output_folder, generations, pmids):
+        """
+        Auxiliar function to mark documents as deleted in the tombstones bitmap
+        of a group of generations
+
         Parameters
         ----------
-        file
-            input file to get next line
+        index_output_folder
+            index root folder
+        generations
+            generations where the documents are deleted
+        pmids
+            ids of the documents to be deleted
+        """
+        if len(pmids) == 0:
+            return
 
-        Returns
+        pmids = set([int(pmid) for pmid in pmids])
+
+        for generation in generations:
+            tombstones_path = "{}/{}/data/tombstones.bin".format(index_output_folder, generation["folder"])
+
+            # the postings identify the documents by their docno
+            documents_table = DocumentsTable("{}/{}/data/docs_table.bin".format(index_output_folder, generation["folder"]))
+            docnos = documents_table.find_docnos(pmids)
+            documents_table.close()
+
+            tombstones = TombstoneBitmap.load(tombstones_path)
+            for docno in docnos:
+                tombstones.add(docno)
+            tombstones.save(tombstones_path)
+
+    def delete_documents(self, index_output_folder, pmids):
+        """
+        Deletes documents from an existing index, the documents are marked as deleted
+        in the tombstones bitmap of every generation (so that the searcher ignores
+        them) and their postings are removed during the next merge
+
+        Parameters
+        ----------
+        index_output_folder
+            index root folder
+        pmids
+            ids of the documents to be deleted
+        """
+        generations = self.load_generations(index_output_folder)
+        if generations is None:
+            raise RuntimeError("Could not find an index to delete documents from in \"{}/\"".format(index_output_folder))
+
+        print("\nDeleting {} documents from \"{}/\"...".format(len(pmids), index_output_folder))
+        self.add_tombstones(index_output_folder, generations["generations"], pmids)
+
+    def purge_segment(self, input_path, output_path, tombstones):
+        """
+        Auxiliar function to copy an index segment without the postings of the
+        deleted documents
+
+        Parameters
+        ----------
+        input_path
+            segment file path
+        output_path
+            path of the purged copy of the segment
+        tombstones
+            tombstones bitmap of the segment's generation
+        """
+        with open(input_path, "r", encoding="utf-8") as input_file, open(output_path, "w", encoding="utf-8") as output_file:
+            for line in input_file:
+                line = line.strip().split(";")
+
+                postings = []
+                for posting in line[1:]:
+                    if posting[:posting.index(":")] not in tombstones:
+                        postings.append(posting)
+
+                if len(postings) > 0:
+                    output_file.write(line[0] + ";" + ";".join(postings) + "\n")
+
+    def wait_for_merges(self):
+        """
+        Auxiliar function to wait for the background merges to finish
+        """
+        if self.merge_thread is not None:
+            print("\nWaiting for background merges to finish...")
+            self.merge_thread.join()
+            self.merge_thread = None
+
+    def apply_merge_policy(self, index_output_folder):
+        """
+        Logarithmic merge policy, generations are assigned to a size tier
+        (log base merge_factor of their number of documents) and, whenever the
+        last merge_factor generations belong to the same tier, they are merged
+        into a single generation of a higher tier. In case a final merge was
+        requested, all the generations are merged into the index root folder
+
+        Parameters
+        ----------
+        index_output_folder
+            index root folder
+        """
+        generations = self.load_generations(index_output_folder)
+
+        if self.final_merge:
+            if len(generations["generations"]) > 1:
+                self.merge_generations(index_output_folder, generations, generations["generations"])
+            return
+
+        tier = lambda generation: int(math.log(max(generation["documents"], 1), self.merge_factor))
+
+        while len(generations["generations"]) >= self.merge_factor:
+            candidates = generations["generations"][-self.merge_factor:]
+            if len(set([tier(generation) for generation in candidates])) > 1:
+                break
+
+            self.merge_generations(index_output_folder, generations, candidates)
+
+    def merge_generations(self, index_output_folder, generations, sources):
+        """
+        Merges a contiguous group of generations into a single one, the idf values
+        (and the document lengths normalization in case of BM25 rsv) are computed
+        over all the documents of the index
+
+        Parameters
         ----------
-        head_line
-            next available line in the file, or None otherwise
+        index_output_folder
+            index root folder
+        generations
+            generations dictionary (updated in place and saved)
+        sources
+            generations to be merged
         """
-        # initialize empty head line
-        head_line = [None]
+        merge_start = time()
+        print("\nMerging generations {} of \"{}/\"...".format([generation["id"] for generation in sources], index_output_folder))
+
+        scratch_folder = "{}/generations/merging".format(index_output_folder)
+        if (os.path.exists(scratch_folder)):
+            shutil.rmtree(scratch_folder)
+        os.makedirs(scratch_folder)
+
+        # copy every segment of the generations to the scratch folder, so that they are merged as regular blocks
+        # (the postings of deleted documents are purged while copying)
+        block_counter = 0
+        docs_pmids = array("Q")
+        docs_lengths = array("f")
+        docs_lnc_norms = array("f")
+        docs_lnu_norms = array("f")
+        purged_documents = 0
+        purged_length = 0
+        for generation in sources:
+            generation_folder = "{}/{}".format(index_output_folder, generation["folder"])
+            tombstones = TombstoneBitmap.load("{}/data/tombstones.bin".format(generation_folder))
+
+            for file_name in sorted(os.listdir("{}/merged".format(generation_folder))):
+                if len(tombstones) > 0:
+                    self.purge_segment("{}/merged/{}".format(generation_folder, file_name), "{}/{}.txt".format(scratch_folder, block_counter), tombstones)
+                else:
+                    shutil.copyfile("{}/merged/{}".format(generation_folder, file_name), "{}/{}.txt".format(scratch_folder, block_counter))
+                block_counter += 1
+
+            # the documents tables are concatenated (the docnos of contiguous generations are contiguous),
+            # the purged documents keep their docno with a pmid and length of 0
+            documents_table = DocumentsTable("{}/data/docs_table.bin".format(generation_folder))
+            for i in range(len(documents_table)):
+                pmid, length = documents_table.pmids[i], documents_table.lengths[i]
+                if pmid != 0 and documents_table.first_docno + i in tombstones:
+                    purged_documents += 1
+                    purged_length += int(length)
+                    pmid, length = 0, 0.0
+                docs_pmids.append(pmid)
+                docs_lengths.append(length)
+            docs_lnc_norms.extend(documents_table.lnc_norms)
+            docs_lnu_norms.extend(documents_table.lnu_norms)
+            documents_table.close()
+
+        if purged_documents > 0:
+            print("Purged {} deleted documents".format(purged_documents))
+
+        # statistics of the whole index, without the purged documents
+        index_documents = sum([generation["documents"] for generation in generations["generations"]]) - purged_documents
+        index_length = sum([generation["total_length"] for generation in generations["generations"]]) - purged_length
+
+        # the documents table is written first, the champion lists are selected with the document lengths
+        os.makedirs("{}/data".format(scratch_folder))
+        DocumentsTable.write("{}/data/docs_table.bin".format(scratch_folder), sources[0]["first_docno"], docs_pmids, docs_lengths,
+                             docs_lnc_norms, docs_lnu_norms)
+
+        # merge with the statistics of the whole index (the statistics of the last build are kept)
+        total_documents, temp_ind, voc_num = self.total_documents, self.temp_ind, self.voc_num
+        self.total_documents = index_documents
+        self.merge_blocks(scratch_folder, self.champions or generations.get("champions"))
+        self.total_documents, self.temp_ind, self.voc_num = total_documents, temp_ind, voc_num
+
+        merged_documents = sum([generation["documents"] for generation in sources]) - purged_documents
+        merged_length = sum([generation["total_length"] for generation in sources]) - purged_length
+
+        if self.impact_ordered or generations.get("impact_ordered", False):
+            self.build_impacts(scratch_folder)
+
+        # the root folder keeps holding the oldest generation
+        if sources[0]["folder"] == ".":
+            merged = {"id": 0, "folder": ".", "first_docno": sources[0]["first_docno"]}
+            if (os.path.exists("{}/data/manifest.json".format(index_output_folder))):
+                os.rename("{}/data/manifest.json".format(index_output_folder), "{}/data/manifest.json".format(scratch_folder))
+            for folder_name in ("merged", "data"):
+                shutil.rmtree("{}/{}".format(index_output_folder, folder_name))
+                os.rename("{}/{}".format(scratch_folder, folder_name), "{}/{}".format(index_output_folder, folder_name))
+            shutil.rmtree(scratch_folder)
+        else:
+            merged = {"id": generations["next_id"], "folder": "generations/{}".format(generations["next_id"]), "first_docno": sources[0]["first_docno"]}
+            generations["next_id"] += 1
+            os.rename(scratch_folder, "{}/{}".format(index_output_folder, merged["folder"]))
+
+        merged["documents"] = merged_documents
+        merged["total_length"] = merged_length
+
+        position = generations["generations"].index(sources[0])
+        generations["generations"] = generations["generations"][:position] + [merged] + generations["generations"][position + len(sources):]
+        self.save_generations(index_output_folder, generations)
+
+        # remove the merged generations
+        for generation in sources:
+            if generation["folder"] != ".":
+                shutil.rmtree("{}/{}".format(index_output_folder, generation["folder"]))
+
+        print("Generations merged in {:.3f} seconds".format(time() - merge_start))
+
+    def build_impacts(self, index_output_folder):
+        """
+        Method to write the impact ordered copy of the postings lists of a
+        generation, the impacts are the tfidf weights of tfidf indexes and
+        the BM25 term frequency component (k1 = 1.2, b = 0.75) otherwise
+
+        Parameters
+        ----------
+        index_output_folder
+            generation folder directory (holding its merged segments and documents table)
+        """
+        print("\nWriting impact ordered postings to \"{}/data/impacts.bin\"...".format(index_output_folder))
+
+        documents_table = DocumentsTable("{}/data/docs_table.bin".format(index_output_folder))
+        ImpactTable.build(index_output_folder, "tfidf" if self.rsv == "tfidf" else "bm25", documents_table)
+        documents_table.close()
 
-        # try to fill head line with next element in the file
-        for line in file:
-            head_line = line.strip().split(";")
+    def read_block_line(self, heap, block_num, block_file):
+        """
+        Auxiliar function to read the next line of a block and push its
+        term and raw postings payload to the merge heap
+        
+        Parameters
+        ----------
+        heap
+            merge heap of (term, block number, payload) tuples
+        block_num
+            position of the block in the merge order
+        block_file
+            block file
+        """
+        for line in block_file:
+            term, payload = line.rstrip("\n").split(";", 1)
+            heapq.heappush(heap, (term, block_num, payload))
             break
 
-        return head_line
+    def close_segment(self, index_output_folder, segment_file, segment_num, first_term, last_term):
+        """
+        Auxiliar function to close a merged segment and give it its final
+        name, that holds the segment number and its first and last terms
+        
+        Parameters
+        ----------
+        index_output_folder
+            merged folder directory
+        segment_file
+            segment file (written with a temporary name)
+        segment_num
+            number of the segment
+        first_term
+            first term of the segment
+        last_term
+            last term of the segment
+        """
+        segment_file.close()
+        os.replace(segment_file.name, "{}/{};{}_{}.txt".format(index_output_folder, segment_num, first_term, last_term))
 
+        print("Writing indexes to file \"{};{}_{}.txt\"... Done!".format(segment_num, first_term, last_term))
 
-    def merge_blocks(self, index_output_folder):
+
+    def merge_blocks(self, index_output_folder, champions=None):
         """
         Method to merge a group of temporary index files
         into bigger sorted index
+
+        The blocks hold disjoint and increasing docno ranges, so
+        the postings of a term are the concatenation (in block
+        order) of its raw postings in each block, which are copied
+        without being parsed. Only the document frequency (and idf)
+        of each term is computed for the terms data file (and the
+        postings lists longer than the champion lists are parsed
+        to select their champions).
         
         Parameters
         ----------
         index_output_folder
             output folder directory
+        champions
+            number of postings of the champion list of each term, None
+            in case the champion lists are not written
         """
         print("\nMerging some blocks to \"{}/merged/\" folder...".format(index_output_folder))
 
-        dict_threshold = 20  # 20 MBytes
+        segment_threshold = 20 * 1048576  # 20 MBytes
+        skip_block_size = 128             # postings of each skip block
 
-        # create data folder
-        if (not os.path.exists("{}/data".format(index_output_folder))):
-            os.makedirs("{}/data".format(index_output_folder))
+        # create data and merged folders
+        for folder_name in ("data", "merged"):
+            if (not os.path.exists("{}/{}".format(index_output_folder, folder_name))):
+                os.makedirs("{}/{}".format(index_output_folder, folder_name))
             
         # create terms data file
         terms_data_file = open("{}/data/terms_data.txt".format(index_output_folder), "w", encoding="utf-8")
 
-        index_files = [open("{}/{}".format(index_output_folder, file), encoding='utf8') for file in os.listdir(index_output_folder) if os.path.isfile("{}/{}".format(index_output_folder, file))]
+        # blocks are merged in the order they were written ("<block number>.txt", compressed blocks are decompressed while they are read)
+        block_names = sorted([file for file in os.listdir(index_output_folder) if os.path.isfile("{}/{}".format(index_output_folder, file))], key=lambda file: int(file.split(".")[0]))
+        index_files = [open_block("{}/{}".format(index_output_folder, file), "r") for file in block_names]
         self.temp_ind = len(index_files)    # register number of temporary files
 
-        merge_dict = {}
-        head_terms = []
-        terms_data_num = 0
-        
-        # fill head terms list with first term of each block
-        for file in index_files:
-            for line in file:
-                head_terms.append(line.strip().split(";"))
-                break
-
-        # keep parsing the documents until eof
-        while True:
-            smaller_term_ind = self.get_smaller_term_index(head_terms)
-            # break if all documents have been parsed
-            if smaller_term_ind is None:
-                break
-
-            curr_line = head_terms[smaller_term_ind]
+        # fill the merge heap with the first term of each block
+        heap = []
+        for block_num, block_file in enumerate(index_files):
+            self.read_block_line(heap, block_num, block_file)
 
-            # fill merge dictionary
-            self.add_to_dictionary(curr_line, merge_dict)
+        terms_skips = []
 
-            # fill current entry with next line in the file
-            head_terms[smaller_term_ind] = self.get_next_line(index_files[smaller_term_ind])
-            
-            # write to disk in case we surpass the dictionary threshold
-            if (sys.getsizeof(merge_dict) / 1048576 > dict_threshold):
-                # add all the terms that are equal to the last in the dictionary to the dictionary
-                last_term = list(merge_dict.keys())[-1]
-                for i in range(len(head_terms)):
-                    if head_terms[i][0] == last_term:
-                        self.add_to_dictionary(head_terms[i], merge_dict)
-
-                        # fill current entry with next line in the file
-                        head_terms[i] = self.get_next_line(index_files[i])
-
-                terms_list = list(merge_dict.keys())
-                self.write_to_disk("{}/merged/".format(index_output_folder), merge_dict, terms_list, "{};{}_{}".format(terms_data_num, list(merge_dict.keys())[0], last_term), terms_data_file, terms_data_num)
+        # champion lists, the postings with the highest tfidf weight or BM25 term frequency component
+        # (k1 = 1.2, b = 0.75) of the long postings lists
+        terms_champions = []
+        champions_file = None
+        champions_offset = 0
+        if champions is not None:
+            champions_file = open("{}/data/champions.txt".format(index_output_folder), "w", encoding="utf-8", newline="\n")
+            if self.rsv == "tfidf":
+                contribution = lambda docno, weight: weight
+            else:
+                k1, b = 1.2, 0.75
+                documents_table = DocumentsTable("{}/data/docs_table.bin".format(index_output_folder))
+                contribution = lambda docno, tf: (k1 + 1) * tf / (k1 * ((1 - b) + b * documents_table.get_length(docno) / documents_table.avdl) + tf)
+
+        segment_file = None
+        segment_num = 0
+        first_term = None
+        last_term = None
+        offset = 0
+
+        # keep merging until eof of all the blocks
+        while len(heap) > 0:
+            term = heap[0][0]
+
+            # raw postings of the term in each block (ties are popped in block order)
+            payloads = []
+            while len(heap) > 0 and heap[0][0] == term:
+                _, block_num, payload = heapq.heappop(heap)
+                payloads.append(payload)
+                self.read_block_line(heap, block_num, index_files[block_num])
+
+            if segment_file is None:
+                segment_file = open("{}/merged/{}.tmp".format(index_output_folder, segment_num), "w", encoding="utf-8", newline="\n")
+                first_term = term
+                offset = 0
+
+            line = term + ";" + ";".join(payloads) + "\n"
+            segment_file.write(line)
+
+            # (term, idf, doc_index, df, offset)
+            df = sum([payload.count(";") + 1 for payload in payloads])
+            terms_data_file.write("{},{},{},{},{}\n".format(term, round(math.log(self.total_documents / df, 10), 2), segment_num, df, offset))
+
+            # skip pointers of the long postings lists
+            line_length = len(line.encode("utf-8"))
+            skips = SkipTable.get_skips(line, skip_block_size) if df > skip_block_size else None
+            terms_skips.append((skips, line_length) if skips is not None else None)
+
+            if champions_file is not None:
+                if df > champions:
+                    champions_line, threshold = ChampionTable.get_champions(line, champions, contribution)
+                    champions_file.write(champions_line)
+                    terms_champions.append((champions_offset, threshold))
+                    champions_offset += len(champions_line.encode("utf-8"))
+                else:
+                    terms_champions.append(None)
 
-                self.voc_num += len(merge_dict)         # add number of terms to vocabulary number
-                merge_dict.clear()
-                terms_data_num += 1                       # increase metadata file counter
+            offset += line_length
+            last_term = term
+            self.voc_num += 1       # add term to vocabulary number
 
-        # write to disk in case we reach eof in all files
-        if (len(merge_dict) > 0):
-            terms_list = list(merge_dict.keys())
-            self.write_to_disk("{}/merged/".format(index_output_folder), merge_dict, terms_list, "{};{}_{}".format(terms_data_num, list(merge_dict.keys())[0],list(merge_dict.keys())[-1]), terms_data_file, terms_data_num)
+            # start a new segment in case we surpass the segment threshold
+            if offset > segment_threshold:
+                self.close_segment("{}/merged".format(index_output_folder), segment_file, segment_num, first_term, last_term)
+                self.profile_memory("merge_segment", {"merge_heap": heap, "terms_skips": terms_skips, "terms_champions": terms_champions},
+                                    folder=index_output_folder, segment=segment_num, terms=self.voc_num)
+                segment_file = None
+                segment_num += 1
 
-            self.voc_num += len(merge_dict)         # add number of terms to vocabulary number
-            merge_dict.clear()
+        if segment_file is not None:
+            self.close_segment("{}/merged".format(index_output_folder), segment_file, segment_num, first_term, last_term)
+            self.profile_memory("merge_segment", {"merge_heap": heap, "terms_skips": terms_skips, "terms_champions": terms_champions},
+                                folder=index_output_folder, segment=segment_num, terms=self.voc_num)
 
         # close all files after the merging step
         for file in index_files:
             file.close()
         terms_data_file.close()
 
+        # compact term dictionary used by the searcher
+        TermDictionary.build("{}/data/terms_data.txt".format(index_output_folder), "{}/data/terms_dict.bin".format(index_output_folder))
+        SkipTable.write("{}/data/skips.bin".format(index_output_folder), skip_block_size, terms_skips)
+
+        if champions_file is not None:
+            champions_file.close()
+            ChampionTable.write("{}/data/champions.bin".format(index_output_folder), champions, "tfidf" if self.rsv == "tfidf" else "bm25", terms_champions, 1.2, 0.75)
+            if self.rsv != "tfidf":
+                documents_table.close()
+
         # delete temporary index files
-        for file_name in os.listdir(index_output_folder) :
-            if os.path.isfile("{}/{}".format(index_output_folder, file_name)):
-                os.remove("{}/{}".format(index_output_folder, file_name))
+        for file_name in block_names:
+            os.remove("{}/{}".format(index_output_folder, file_name))
+
+        self.profile_memory("merge_end", {}, folder=index_output_folder, blocks=len(block_names), terms=self.voc_num)
         
+class DocumentsTable:
+    """
+    Documents table of an index generation, maps the docno
+    (internal document number, assigned sequentially while
+    indexing) of each document to its pmid, length and
+    cosine (lnc) and unique terms (lnu) normalization factors
+
+    File layout:
+        header          magic, version, first docno, number of documents, avdl
+        pmids           uint64[documents]
+        lengths         float32[documents]
+        lnc norms       float32[documents]
+        lnu norms       float32[documents]
+
+    The table is memory mapped, documents that were purged
+    from the generation have a pmid (and length) of 0.
+
+    """
+    MAGIC = b"DOCS"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIQQd")
+
+    # columns of the table (name, type code) in file order
+    COLUMNS = (("pmids", "Q"), ("lengths", "f"), ("lnc_norms", "f"), ("lnu_norms", "f"))
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.first_docno, self.documents, self.avdl = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RuntimeError("\"{}\" is not a valid documents table file".format(path))
+
+        start = self.HEADER.size
+        for name, typecode in self.COLUMNS:
+            end = start + array(typecode).itemsize * self.documents
+            if sys.byteorder == "little":
+                # zero copy views over the mapped file
+                values = memoryview(self.data)[start:end].cast(typecode)
+            else:
+                values = array(typecode, self.data[start:end])
+                values.byteswap()
+            setattr(self, name, values)
+            start = end
+
+    @classmethod
+    def write(cls, path, first_docno, pmids, lengths, lnc_norms, lnu_norms):
+        """
+        Writes a documents table to disk
+
+        Parameters
+        ----------
+        path
+            documents table file path
+        first_docno
+            docno of the first document of the table
+        pmids
+            array("Q") with the pmid of each document
+        lengths
+            array("f") with the length of each document (0 for purged documents)
+        lnc_norms
+            array("f") with the cosine normalization factor of each document
+        lnu_norms
+            array("f") with the unique terms normalization factor of each document
+        """
+        documents = len([pmid for pmid in pmids if pmid != 0])
+        avdl = sum(lengths) / documents if documents > 0 else 0.0
+
+        with open(path, "wb") as table_file:
+            table_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, first_docno, len(pmids), avdl))
+            for values in (pmids, lengths, lnc_norms, lnu_norms):
+                # arrays are stored in little endian
+                if sys.byteorder == "big":
+                    values = array(values.typecode, values)
+                    values.byteswap()
+                table_file.write(values.tobytes())
+
+    def close(self):
+        """
+        Closes the documents table file
+        """
+        for name, _ in self.COLUMNS:
+            if isinstance(getattr(self, name), memoryview):
+                getattr(self, name).release()
+        self.data.close()
+        self.file.close()
+
+    def __contains__(self, docno):
+        return self.first_docno <= docno < self.first_docno + self.documents
+
+    def __len__(self):
+        return self.documents
+
+    def get_pmid(self, docno):
+        """
+        Gets the pmid of a document
+        """
+        return self.pmids[docno - self.first_docno]
+
+    def get_length(self, docno):
+        """
+        Gets the length (number of terms) of a document
+        """
+        return self.lengths[docno - self.first_docno]
+
+    def get_norm(self, docno, normalization):
+        """
+        Gets a normalization factor of a document, "c" (cosine) or "u" (unique terms)
+        """
+        if normalization == "c":
+            return self.lnc_norms[docno - self.first_docno]
+        return self.lnu_norms[docno - self.first_docno]
+
+    def find_docnos(self, pmids):
+        """
+        Gets the docnos of a group of documents of the table
+
+        Parameters
+        ----------
+        pmids
+            set with the (numeric) pmids of the documents
+
+        Returns
+        ----------
+        docnos
+            list with the docno of each document of the table whose pmid is in pmids
+        """
+        return [self.first_docno + i for i, pmid in enumerate(self.pmids) if pmid in pmids]
+
+
+class TombstoneBitmap:
+    """
+    Bitmap of deleted documents of an index generation,
+    indexed by the docno of the documents
+
+    """
+    def __init__(self, bitmap=None):
+        self.bitmap = bitmap if bitmap is not None else bytearray()
+        self.count = sum([bin(byte).count("1") for byte in self.bitmap])
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a tombstones bitmap from disk (an empty bitmap is returned
+        in case the file does not exist)
+        """
+        if (not os.path.exists(path)):
+            return cls()
+
+        with open(path, "rb") as tombstones_file:
+            return cls(bytearray(tombstones_file.read()))
+
+    def save(self, path):
+        """
+        Saves the tombstones bitmap to disk
+        """
+        with open(path, "wb") as tombstones_file:
+            tombstones_file.write(self.bitmap)
+
+    def add(self, docno):
+        """
+        Marks a document as deleted
+        """
+        docno = int(docno)
+        if (docno >> 3) >= len(self.bitmap):
+            self.bitmap.extend(bytes((docno >> 3) + 1 - len(self.bitmap)))
+
+        if not self.bitmap[docno >> 3] & (1 << (docno & 7)):
+            self.bitmap[docno >> 3] |= 1 << (docno & 7)
+            self.count += 1
+
+    def __contains__(self, docno):
+        docno = int(docno)
+        return (docno >> 3) < len(self.bitmap) and self.bitmap[docno >> 3] & (1 << (docno & 7)) != 0
+
+    def __len__(self):
+        return self.count
+
+
 class BaseIndex:
     """
     Top-level Index class
@@ -498,7 +1473,7 @@ class BaseIndex:
         raise NotImplementedError()
 
     @classmethod
-    def load_from_disk(cls, path_to_folder:str, indexes_dict, term, doc_window_size):
+    def load_from_disk(cls, path_to_folder:str, indexes_dict, term, doc_window_size, tombstones=None, offset=None):
         """
         Loads the index from disk, note that this
         the process may be complex, especially if your index
@@ -522,30 +1497,94 @@ class BaseIndex:
             term to search for
         doc_window_size
             dictionary to hold documents' window size
+        tombstones
+            tombstones bitmap of the index generation (the postings of
+            deleted documents are skipped)
+        offset
+            byte offset of the term's line in the index file, the whole file
+            is scanned until the term is found in case it is not known
+
+        Returns
+        ----------
+        bytes_read
+            number of bytes read from the index file until the term was found
         """
-        with open(path_to_folder, "r", encoding="utf-8") as index_file:
+        bytes_read = 0
+
+        if offset is not None:
+            # seek directly to the term's line
+            with open(path_to_folder, "rb") as index_file:
+                index_file.seek(offset)
+                lines = [index_file.readline().decode("utf-8")]
+        else:
+            index_file = open(path_to_folder, "r", encoding="utf-8")
+            lines = index_file
+
+        try:
             # read each line of the file
-            for line in index_file:
-                line = line.strip().split(";")
-                
-                # check if current line contains desired term
-                if (line[0] == term):
-                    # parse line
-                    for i in range(1, len(line)):
-                        doc_info = line[i].split(":")
-
-                        if line[0] not in indexes_dict.keys():
-                            indexes_dict[line[0]] = {doc_info[0]: float(doc_info[1])}
-                        else:
-                            indexes_dict[line[0]][doc_info[0]] = float(doc_info[1])
-
-                        # window size calculation auxiliar structure
-                        if doc_info[0] not in doc_window_size.keys():
-                            doc_window_size[doc_info[0]] = {line[0]: doc_info[2].split(',')}
-                        else:
-                            doc_window_size[doc_info[0]][line[0]] = doc_info[2].split(',')
+            for line in lines:
+                bytes_read += len(line.encode("utf-8"))
 
+                # check if current line contains desired term
+                if cls.load_postings_line(line, indexes_dict, term, doc_window_size, tombstones):
                     break
+        finally:
+            if offset is None:
+                index_file.close()
+
+        return bytes_read
+
+    @classmethod
+    def load_postings_line(cls, line, indexes_dict, term, doc_window_size, tombstones=None):
+        """
+        Parses a postings list line read from an index file, loading its
+        postings to the indexes dictionary in case it holds the desired term
+
+        Parameters
+        ----------
+        line
+            postings list line (term;docno:weight:positions;...)
+        indexes_dict
+            structure to save term and postings list
+        term
+            term to search for
+        doc_window_size
+            dictionary to hold documents' window size
+        tombstones
+            tombstones bitmap of the index generation (the postings of
+            deleted documents are skipped)
+
+        Returns
+        ----------
+        True
+            in case the line holds the term
+        False
+            otherwise
+        """
+        line = line.strip().split(";")
+
+        if (line[0] != term):
+            return False
+
+        # parse line
+        for i in range(1, len(line)):
+            doc_info = line[i].split(":")
+
+            if tombstones is not None and doc_info[0] in tombstones:
+                continue
+
+            if line[0] not in indexes_dict.keys():
+                indexes_dict[line[0]] = {doc_info[0]: float(doc_info[1])}
+            else:
+                indexes_dict[line[0]][doc_info[0]] = float(doc_info[1])
+
+            # window size calculation auxiliar structure
+            if doc_info[0] not in doc_window_size.keys():
+                doc_window_size[doc_info[0]] = {line[0]: doc_info[2].split(',')}
+            else:
+                doc_window_size[doc_info[0]][line[0]] = doc_info[2].split(',')
+
+        return True
 
 
 class InvertedIndex(BaseIndex):
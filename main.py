@@ -32,7 +32,7 @@
 """
 
 import argparse
-from core import engine_logic, add_more_options_to_indexer
+from core import engine_logic, add_more_options_to_indexer, add_more_options_to_searcher
 
 class Params:
     """
@@ -160,7 +160,7 @@ if __name__ == "__main__":
     indexer_settings_parser.add_argument('--indexer.posting_threshold', 
                                     type=int, 
                                     default=None,
-                                    help='Maximum number of postings that each index should hold.')
+                                    help='Maximum number of postings that each temporary block should hold, a block is written to disk once it reaches this value or the memory threshold. The absence means that only the memory is checked (default=None).')
     
     indexer_settings_parser.add_argument('--indexer.memory_threshold', 
                                     type=int, 
@@ -225,7 +225,8 @@ if __name__ == "__main__":
     # indexes folder
     searcher_parser.add_argument('index_folder', 
                                 type=str, 
-                                help='Folder where all the index related files will be loaded.')
+                                nargs='+',
+                                help='Folder where all the index related files will be loaded. Several folders can be given to query sharded indexes together, every shard is scored with the statistics (number of documents, document frequencies and average document length) of all the shards.')
 
     """# searcher
     searcher_parser.add_argument('--searcher.class', 
@@ -280,6 +281,8 @@ if __name__ == "__main__":
                                 type=int,
                                 default="10",
                                 help='Top k documents retrieved (default=10).')
+
+    add_more_options_to_searcher(searcher_parser)
     
     # CLI parsing
     
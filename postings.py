@@ -0,0 +1,897 @@
+"""
+    postings.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Postings module
+
+    Holds the code/logic addressing the skip pointers and
+    champion lists of the merged postings lists, the
+    registry of the merged segments and the cursors used
+    to traverse a postings list without decoding it whole.
+
+"""
+
+import os                           # list and read the merged segments
+import mmap                         # memory map the skip table file
+import threading                    # guard the open segments read by several threads
+import struct                       # pack fixed width values
+import sys                          # check the system byte order
+import heapq                        # merge the docnos of several cursors and select the champions
+from array import array             # compact arrays used while building the skip table
+from bisect import bisect_left      # binary search over the blocks last docnos
+from collections import OrderedDict # least recently used open segments
+
+
+class SkipTable:
+    """
+    Skip pointers of the postings lists of an index generation
+
+    The postings list of each term with more than `block_size`
+    postings is split into blocks of `block_size` postings, and
+    for each block the skip table holds its last docno, the byte
+    offset of its first posting (relative to the start of the
+    term's line) and the maximum weight of its postings. Shorter
+    postings lists have no skip pointers and are read whole.
+
+    File layout:
+        header          magic, version, number of terms, block size
+        offsets         uint64[terms] (start of the term's entry in the skips blob, NO_SKIPS if it has none)
+        skips blob      (number of blocks uint32, line length uint32,
+                         (last docno uint64, offset uint32, max weight float32)[blocks])[terms with skips]
+
+    """
+    MAGIC = b"SKIP"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIII")
+    ENTRY = struct.Struct("<II")
+    BLOCK = struct.Struct("<QIf")
+
+    NO_SKIPS = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.terms, self.block_size = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RuntimeError("\"{}\" is not a valid skip table file".format(path))
+
+        self.blob_start = self.HEADER.size + 8 * self.terms
+
+    @classmethod
+    def get_skips(cls, line, block_size):
+        """
+        Computes the skip pointers of a postings list line (only the
+        docno and weight of the last posting of each block are parsed)
+
+        Parameters
+        ----------
+        line
+            postings list line ("term;doc:weight:positions;...")
+        block_size
+            number of postings of each block
+
+        Returns
+        ----------
+        skips
+            list of (last docno, offset, max weight) tuples, None in case
+            the postings list is not longer than a block
+        """
+        postings = line.rstrip("\n").split(";")
+        if len(postings) - 1 <= block_size:
+            return None
+
+        skips = []
+        offset = len(postings[0].encode("utf-8")) + 1
+        for start in range(1, len(postings), block_size):
+            block = postings[start:start + block_size]
+            skips.append((int(block[-1][:block[-1].index(":")]), offset, max([float(posting.split(":", 2)[1]) for posting in block])))
+            offset += sum([len(posting) + 1 for posting in block])
+
+        return skips
+
+    @classmethod
+    def write(cls, path, block_size, terms_skips):
+        """
+        Writes a skip table to disk
+
+        Parameters
+        ----------
+        path
+            skip table file path
+        block_size
+            number of postings of each block
+        terms_skips
+            list with, for each term (in the terms dictionary order), None or
+            a (skips, line length) tuple
+        """
+        offsets = array("Q")
+        blob = bytearray()
+
+        for term_skips in terms_skips:
+            if term_skips is None:
+                offsets.append(cls.NO_SKIPS)
+                continue
+
+            skips, line_length = term_skips
+            offsets.append(len(blob))
+            blob += cls.ENTRY.pack(len(skips), line_length)
+            for skip in skips:
+                blob += cls.BLOCK.pack(*skip)
+
+        with open(path, "wb") as skips_file:
+            skips_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(offsets), block_size))
+            # arrays are stored in little endian
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            skips_file.write(offsets.tobytes())
+            skips_file.write(blob)
+
+    def close(self):
+        """
+        Closes the skip table file
+        """
+        self.data.close()
+        self.file.close()
+
+    def get(self, ordinal):
+        """
+        Gets the skip pointers of a term
+
+        Parameters
+        ----------
+        ordinal
+            position of the term in the terms dictionary
+
+        Returns
+        ----------
+        skips
+            (list of (last docno, offset, max weight) tuples, line length) tuple,
+            None in case the term has no skip pointers
+        """
+        position = struct.unpack_from("<Q", self.data, self.HEADER.size + 8 * ordinal)[0]
+        if position == self.NO_SKIPS:
+            return None
+
+        position += self.blob_start
+        blocks, line_length = self.ENTRY.unpack_from(self.data, position)
+        position += self.ENTRY.size
+
+        return ([self.BLOCK.unpack_from(self.data, position + i * self.BLOCK.size) for i in range(blocks)], line_length)
+
+
+class ChampionTable:
+    """
+    Champion lists of the postings lists of an index generation
+
+    The champion list of each term with more than `champions`
+    postings holds its `champions` postings with the highest
+    score contribution (the tfidf weight, or the BM25 term
+    frequency component), in docno order, as a line of the
+    champions file (`data/champions.txt`, in the merged segments
+    format). The table holds the offset of each champion list
+    in that file and the contribution of its last champion, an
+    upper bound of the contribution of the remaining postings.
+    Shorter postings lists are their own champion lists.
+
+    The BM25 contributions are computed with the k1 and b stored
+    in the header, the thresholds are only upper bounds for these.
+
+    File layout:
+        header          magic, version, number of terms, champions per term, weighting, k1, b
+        entries         (offset uint64 (NO_CHAMPIONS if it has none), threshold float32)[terms]
+
+    """
+    MAGIC = b"CHMP"
+    VERSION = 2
+    HEADER = struct.Struct("<4sIIIIff")
+    ENTRY = struct.Struct("<Qf")
+
+    WEIGHTINGS = ("tfidf", "bm25")
+    NO_CHAMPIONS = 0xFFFFFFFFFFFFFFFF
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.terms, self.champions, weighting, self.k1, self.b = self.HEADER.unpack_from(self.data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise RuntimeError("\"{}\" is not a valid champions table file".format(path))
+
+        self.weighting = self.WEIGHTINGS[weighting]
+
+    @classmethod
+    def get_champions(cls, line, champions, contribution):
+        """
+        Selects the champion postings of a postings list line
+
+        Parameters
+        ----------
+        line
+            postings list line ("term;doc:weight:positions;...")
+        champions
+            number of postings of the champion list
+        contribution
+            function that computes the score contribution of a posting
+            from its docno and weight
+
+        Returns
+        ----------
+        champions
+            (champions line, threshold) tuple where threshold is the
+            contribution of the lowest scored champion
+        """
+        postings = line.rstrip("\n").split(";")
+
+        contributions = []
+        for posting in postings[1:]:
+            docno, weight, _ = posting.split(":", 2)
+            contributions.append(contribution(int(docno), float(weight)))
+
+        # the champions keep the docno order of the postings list
+        selected = sorted(heapq.nlargest(champions, range(len(contributions)), key=lambda i: contributions[i]))
+
+        return (postings[0] + ";" + ";".join([postings[i + 1] for i in selected]) + "\n", min([contributions[i] for i in selected]))
+
+    @classmethod
+    def write(cls, path, champions, weighting, entries, k1=1.2, b=0.75):
+        """
+        Writes a champions table to disk
+
+        Parameters
+        ----------
+        path
+            champions table file path
+        champions
+            number of postings of each champion list
+        weighting
+            "tfidf" or "bm25", rsv of the contributions
+        entries
+            list with, for each term (in the terms dictionary order), None or
+            an (offset, threshold) tuple
+        k1
+            BM25 term frequency saturation parameter of the contributions
+        b
+            BM25 length normalization parameter of the contributions
+        """
+        with open(path, "wb") as champions_file:
+            champions_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(entries), champions, cls.WEIGHTINGS.index(weighting), k1, b))
+            for entry in entries:
+                champions_file.write(cls.ENTRY.pack(*entry) if entry is not None else cls.ENTRY.pack(cls.NO_CHAMPIONS, 0.0))
+
+    def close(self):
+        """
+        Closes the champions table file
+        """
+        self.data.close()
+        self.file.close()
+
+    def get(self, ordinal):
+        """
+        Gets the champion list of a term
+
+        Parameters
+        ----------
+        ordinal
+            position of the term in the terms dictionary
+
+        Returns
+        ----------
+        champions
+            (offset in the champions file, threshold) tuple, None in case
+            the whole postings list is the champion list
+        """
+        offset, threshold = self.ENTRY.unpack_from(self.data, self.HEADER.size + self.ENTRY.size * ordinal)
+        if offset == self.NO_CHAMPIONS:
+            return None
+
+        return (offset, threshold)
+
+
+class SegmentRegistry:
+    """
+    Merged segments of an index generation
+
+    The segments are listed once, ordered by the number at
+    the start of their name (`{number};{first term}_{last term}.txt`),
+    which is the segment index held by the term dictionary.
+    The segments are opened when they are first read and at
+    most `max_open` of them are kept open, the least recently
+    used one is closed when the limit is reached.
+
+    The reads use positional reads (no shared file position),
+    so a registry can be read by several threads at once, a
+    segment being read is never closed. Where positional reads
+    are not available (Windows) the file position of a segment
+    is moved and read under a lock of the segment.
+
+    """
+    CHUNK_SIZE = 65536                  # bytes read at once when the length of a line is not known
+
+    def __init__(self, merged_folder, max_open=64):
+        self.merged_folder = merged_folder
+        self.max_open = max(1, max_open)
+        self.opened = OrderedDict()         # file descriptors of the open segments by segment number (least recently used first)
+        self.readers = {}                   # number of reads in progress of each open segment
+        self.fd_locks = {}                  # locks of the file positions of the open segments (without positional reads)
+        self.lock = threading.Lock()        # guards the open segments
+        self.opens = 0                      # number of times a segment was opened
+
+        segments = {}
+        for file_name in os.listdir(merged_folder):
+            number = file_name.split(";", 1)[0]
+            if ";" not in file_name or not number.isdigit() or not os.path.isfile("{}/{}".format(merged_folder, file_name)):
+                raise RuntimeError("\"{}\" is not a merged segment of \"{}\"".format(file_name, merged_folder))
+            if int(number) in segments:
+                raise RuntimeError("\"{}\" holds two segments numbered {}".format(merged_folder, number))
+            segments[int(number)] = file_name
+
+        if sorted(segments) != list(range(len(segments))):
+            raise RuntimeError("The segments of \"{}\" are not numbered from 0 to {}".format(merged_folder, len(segments) - 1))
+
+        self.names = [segments[number] for number in range(len(segments))]
+
+    def validate(self, term_dictionary):
+        """
+        Checks that the segments match the term dictionary of the generation,
+        the first term of each segment must start it in the dictionary and the
+        last term of the dictionary must be in the last segment
+
+        Parameters
+        ----------
+        term_dictionary
+            term dictionary of the generation
+        """
+        if len(term_dictionary) == 0:
+            if len(self.names) > 0:
+                raise RuntimeError("\"{}\" holds segments of an empty term dictionary".format(self.merged_folder))
+            return
+
+        for segment_num in range(len(self.names)):
+            head = self.read(segment_num, 0, 4096)
+            first_term = head[:head.find(b";")].decode("utf-8", errors="replace")
+
+            entry = term_dictionary.get(first_term)
+            if entry is None or entry[2] != segment_num or entry[3] not in (0, None):
+                raise RuntimeError("Segment \"{}\" does not match the term dictionary, the index must be rebuilt.".format(self.names[segment_num]))
+
+        if term_dictionary.get_entry(len(term_dictionary) - 1)[2] != len(self.names) - 1:
+            raise RuntimeError("\"{}\" is missing segments of the term dictionary, the index must be rebuilt.".format(self.merged_folder))
+
+    def acquire(self, segment_num):
+        """
+        Auxiliar function to get the file descriptor of a segment, opening it
+        in case it is not open, and mark it as being read
+
+        Parameters
+        ----------
+        segment_num
+            number of the segment
+
+        Returns
+        ----------
+        fd
+            file descriptor of the segment
+        """
+        with self.lock:
+            fd = self.opened.get(segment_num)
+            if fd is None:
+                # close the least recently used segments that are not being read
+                for open_num in list(self.opened):
+                    if len(self.opened) < self.max_open:
+                        break
+                    if self.readers[open_num] == 0:
+                        fd = self.opened.pop(open_num)
+                        os.close(fd)
+                        del self.readers[open_num]
+                        del self.fd_locks[fd]
+
+                fd = os.open("{}/{}".format(self.merged_folder, self.names[segment_num]), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+                self.opened[segment_num] = fd
+                self.readers[segment_num] = 0
+                self.fd_locks[fd] = threading.Lock()
+                self.opens += 1
+            else:
+                self.opened.move_to_end(segment_num)
+
+            self.readers[segment_num] += 1
+
+        return fd
+
+    def release(self, segment_num):
+        """
+        Auxiliar function to mark a read of a segment as finished
+        """
+        with self.lock:
+            self.readers[segment_num] -= 1
+
+    def pread(self, fd, length, offset):
+        """
+        Auxiliar function to read a byte range of an open segment, with a positional
+        read or, where it is not available, moving the file position under the lock
+        of the segment
+        """
+        if hasattr(os, "pread"):
+            return os.pread(fd, length, offset)
+
+        with self.fd_locks[fd]:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)
+
+    def read(self, segment_num, offset, length):
+        """
+        Reads a byte range of a segment
+
+        Returns
+        ----------
+        data
+            bytes read
+        """
+        fd = self.acquire(segment_num)
+        try:
+            return self.pread(fd, length, offset)
+        finally:
+            self.release(segment_num)
+
+    def read_line(self, segment_num, offset):
+        """
+        Reads the postings list line starting at an offset of a segment
+
+        Returns
+        ----------
+        line
+            decoded line (with its line break)
+        """
+        return self.read_lines(segment_num, [offset])[offset]
+
+    def read_lines(self, segment_num, offsets):
+        """
+        Reads the postings list lines starting at several offsets of a segment,
+        the lines that are close to each other are read together
+
+        Parameters
+        ----------
+        segment_num
+            number of the segment
+        offsets
+            offsets of the lines
+
+        Returns
+        ----------
+        lines
+            dictionary with the decoded line (with its line break) starting at each offset
+        """
+        lines = {}
+
+        fd = self.acquire(segment_num)
+        try:
+            data, start = b"", 0
+            for offset in sorted(set(offsets)):
+                # start a new read in case the line does not start in the last chunk
+                if offset >= start + len(data):
+                    data, start = self.pread(fd, self.CHUNK_SIZE, offset), offset
+
+                # extend the chunk until the end of the line (doubling the read size)
+                end = data.find(b"\n", offset - start)
+                while end < 0:
+                    searched = len(data)
+                    chunk = self.pread(fd, max(self.CHUNK_SIZE, searched), start + searched)
+                    if len(chunk) == 0:
+                        # last line without a line break
+                        end = searched - 1
+                        break
+                    data += chunk
+                    end = data.find(b"\n", searched)
+
+                lines[offset] = data[offset - start:end + 1].decode("utf-8")
+        finally:
+            self.release(segment_num)
+
+        return lines
+
+    def path(self, segment_num):
+        """
+        Gets the path of a segment (scanned when the offsets of its terms are not known)
+        """
+        return "{}/{}".format(self.merged_folder, self.names[segment_num])
+
+    def close(self):
+        """
+        Closes the open segments
+        """
+        with self.lock:
+            for fd in self.opened.values():
+                os.close(fd)
+            self.opened.clear()
+            self.readers.clear()
+            self.fd_locks.clear()
+
+    def __len__(self):
+        return len(self.names)
+
+
+class PostingsCursor:
+    """
+    Cursor over the postings list of a term in an index segment
+
+    The postings are decoded one block at a time, `advance`
+    uses the last docno of each block to skip (without reading
+    or decoding them) the blocks that can not hold the target
+    docno. Postings lists without skip pointers are read and
+    decoded as a single block.
+
+    The cursor starts before the first posting, `next` must be
+    called to move it to the first posting.
+
+    """
+    def __init__(self, segments, segment_num, offset, skips=None, tombstones=None):
+        self.segments = segments            # segment registry of the term's generation
+        self.segment_num = segment_num
+        self.offset = offset                # offset of the term's line in the segment
+        self.tombstones = tombstones        # deleted documents are skipped
+
+        self.bytes_read = 0
+        self.blocks_decoded = 0
+
+        if skips is None:
+            # a single block with the whole line
+            line = segments.read_line(segment_num, offset)
+            self.line_length = len(line.encode("utf-8"))
+            self.bytes_read += self.line_length
+
+            postings = line.rstrip("\n").split(";")
+            self.term = postings[0]
+            self.skips = [(None, len(postings[0].encode("utf-8")) + 1, None)]
+            self.block_postings = postings[1:]
+            self.blocks_decoded = 1
+        else:
+            self.skips, self.line_length = skips
+            self.block_postings = None
+
+        self.last_docnos = [skip[0] for skip in self.skips]
+        self.block = 0                      # current block
+        self.position = -1                  # position of the current posting in the current block
+        self.docno = None                   # docno of the current posting (None before the first posting or after the last one)
+
+    def read_block(self, block):
+        """
+        Auxiliar function to read and split the postings of a block
+        """
+        start = self.skips[block][1]
+        end = self.skips[block + 1][1] if block + 1 < len(self.skips) else self.line_length
+
+        data = self.segments.read(self.segment_num, self.offset + start, end - start).decode("utf-8")
+
+        self.bytes_read += end - start
+        self.blocks_decoded += 1
+        self.block_postings = data.rstrip("\n").rstrip(";").split(";")
+
+    def move_to(self, block, position):
+        """
+        Auxiliar function to move the cursor to a posting, the postings
+        of deleted documents are skipped
+
+        Returns
+        ----------
+        docno
+            docno of the posting, None after the last posting
+        """
+        while True:
+            if block >= len(self.skips):
+                self.block, self.position, self.docno = len(self.skips), 0, None
+                return None
+
+            if block != self.block or self.block_postings is None:
+                self.read_block(block)
+
+            self.block = block
+
+            if position >= len(self.block_postings):
+                block, position = block + 1, 0
+                continue
+
+            self.position = position
+            posting = self.block_postings[position]
+            self.docno = int(posting[:posting.index(":")])
+
+            if self.tombstones is None or self.docno not in self.tombstones:
+                return self.docno
+
+            position += 1
+
+    def next(self):
+        """
+        Moves the cursor to the next posting
+
+        Returns
+        ----------
+        docno
+            docno of the posting, None after the last posting
+        """
+        if self.block >= len(self.skips):
+            return None
+
+        return self.move_to(self.block, self.position + 1)
+
+    def advance(self, target):
+        """
+        Moves the cursor to the first posting with a docno greater or
+        equal to target (the cursor never moves backwards)
+
+        Parameters
+        ----------
+        target
+            docno to advance to
+
+        Returns
+        ----------
+        docno
+            docno of the posting, None after the last posting
+        """
+        if self.docno is not None and self.docno >= target:
+            return self.docno
+
+        if self.block >= len(self.skips):
+            return None
+
+        # skip the blocks whose last docno is lower than the target
+        block = self.block
+        if len(self.skips) > 1:
+            block = max(block, bisect_left(self.last_docnos, target))
+
+        position = self.position + 1 if block == self.block else 0
+        while block < len(self.skips):
+            if block != self.block or self.block_postings is None:
+                self.read_block(block)
+                self.block = block
+
+            # first posting of the block with a docno greater or equal to the target
+            position = self.gallop(position, target)
+            if position < len(self.block_postings):
+                return self.move_to(block, position)
+
+            block, position = block + 1, 0
+
+        return self.move_to(block, 0)
+
+    def get_docno(self, position):
+        """
+        Auxiliar function to get the docno of a posting of the current block
+        """
+        posting = self.block_postings[position]
+        return int(posting[:posting.index(":")])
+
+    def gallop(self, position, target):
+        """
+        Galloping (exponential) search for the first posting of the current
+        block, from a given position, with a docno greater or equal to target
+        (only the docnos of the probed postings are decoded)
+
+        Parameters
+        ----------
+        position
+            position of the current block where the search starts
+        target
+            docno to search for
+
+        Returns
+        ----------
+        position
+            position of the posting, the number of postings of the block in
+            case every posting has a lower docno
+        """
+        postings_num = len(self.block_postings)
+        if position >= postings_num or self.get_docno(position) >= target:
+            return position
+
+        # the docno at low is lower than the target, the one at high (if it exists) is greater or equal
+        low, step = position, 1
+        while low + step < postings_num and self.get_docno(low + step) < target:
+            low += step
+            step *= 2
+        high = min(low + step, postings_num)
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self.get_docno(middle) < target:
+                low = middle
+            else:
+                high = middle
+
+        return high
+
+    def weight(self):
+        """
+        Gets the weight of the current posting
+        """
+        return float(self.block_postings[self.position].split(":", 2)[1])
+
+    def positions(self):
+        """
+        Gets the positions of the term in the document of the current posting
+        """
+        return [int(position) for position in self.block_postings[self.position].split(":", 2)[2].split(",")]
+
+    def block_max_weight(self):
+        """
+        Gets the maximum weight of the current block (None in case the
+        postings list has no skip pointers)
+        """
+        if self.block >= len(self.skips):
+            return None
+        return self.skips[self.block][2]
+
+
+def intersect(cursors, match=None):
+    """
+    Intersects the docnos of several postings cursors, the first cursor
+    drives the intersection (so it should be the one with the fewest
+    postings) and the other ones gallop to its docnos
+
+    Parameters
+    ----------
+    cursors
+        postings cursors (not yet started)
+    match
+        optional function called with the cursors positioned on a common
+        docno, the docno is only kept in case it returns True
+
+    Returns
+    ----------
+    docnos
+        sorted list of the common docnos
+    """
+    docnos = []
+
+    target = cursors[0].next()
+    while target is not None:
+        for cursor in cursors:
+            docno = cursor.advance(target)
+            if docno is None:
+                return docnos
+            if docno > target:
+                break
+        else:
+            if match is None or match(cursors):
+                docnos.append(target)
+            target = cursors[0].next()
+            continue
+
+        # some cursor went past the target, it is the new target
+        target = cursors[0].advance(docno)
+
+    return docnos
+
+
+def match_at_least(cursors, min_match):
+    """
+    Finds the docnos present in at least min_match of several postings
+    cursors, which must be ordered by increasing number of postings. A
+    document present in min_match postings lists is present in at least
+    one of the len(cursors) - min_match + 1 shortest ones, so only these
+    are merged to get the candidate docnos and the remaining cursors
+    gallop to them
+
+    Parameters
+    ----------
+    cursors
+        postings cursors (not yet started), shortest postings list first
+    min_match
+        minimum number of postings lists holding a docno
+
+    Returns
+    ----------
+    docnos
+        sorted list of the matching docnos
+    """
+    if min_match > len(cursors):
+        return []
+
+    if min_match == len(cursors):
+        return intersect(cursors)
+
+    drivers = cursors[:len(cursors) - min_match + 1]
+    others = cursors[len(drivers):]
+
+    heap = []
+    for driver_num, cursor in enumerate(drivers):
+        docno = cursor.next()
+        if docno is not None:
+            heap.append((docno, driver_num))
+    heapq.heapify(heap)
+
+    docnos = []
+    while heap:
+        docno = heap[0][0]
+
+        # drivers holding the candidate docno
+        count = 0
+        while heap and heap[0][0] == docno:
+            driver_num = heapq.heappop(heap)[1]
+            count += 1
+
+            following = drivers[driver_num].next()
+            if following is not None:
+                heapq.heappush(heap, (following, driver_num))
+
+        # the remaining cursors are only probed until the outcome is known
+        for other_num, cursor in enumerate(others):
+            if count >= min_match or count + len(others) - other_num < min_match:
+                break
+            if cursor.advance(docno) == docno:
+                count += 1
+
+        if count >= min_match:
+            docnos.append(docno)
+
+    return docnos
+
+
+class ChainedCursor:
+    """
+    Cursor over the postings lists of a term in several
+    generations of an index, whose docno ranges are disjoint
+    and increasing in the generations order
+
+    """
+    def __init__(self, cursors):
+        self.cursors = cursors
+        self.current = 0
+        self.docno = None
+
+    def next(self):
+        while self.current < len(self.cursors):
+            self.docno = self.cursors[self.current].next()
+            if self.docno is not None:
+                return self.docno
+            self.current += 1
+
+        self.docno = None
+        return None
+
+    def advance(self, target):
+        while self.current < len(self.cursors):
+            self.docno = self.cursors[self.current].advance(target)
+            if self.docno is not None:
+                return self.docno
+            self.current += 1
+
+        self.docno = None
+        return None
+
+    def weight(self):
+        return self.cursors[self.current].weight()
+
+    def positions(self):
+        return self.cursors[self.current].positions()
+
+    def block_max_weight(self):
+        return self.cursors[self.current].block_max_weight()
+
+    @property
+    def bytes_read(self):
+        return sum([cursor.bytes_read for cursor in self.cursors])
+
+    @property
+    def blocks_decoded(self):
+        return sum([cursor.blocks_decoded for cursor in self.cursors])
@@ -0,0 +1,145 @@
+"""
+    profiling.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Memory profiling module
+
+    Holds the code/logic addressing the opt-in memory
+    profiling of the indexer and searcher, which samples
+    the process memory, the top allocators and the size of
+    the main in-memory structures at checkpoints and writes
+    them to a time series file.
+
+"""
+
+import json                         # write the samples as json lines
+import sys                          # size of the python objects
+import threading                    # guard the samples written by the background merges
+import tracemalloc                  # trace the python allocations
+from itertools import islice        # sample the items of large containers
+from time import time
+
+import psutil                       # resident set size of the process
+
+
+def estimate_size(structure, sample_size=1000, seen=None):
+    """
+    Estimates the bytes held by a structure (a container and its items,
+    nested containers included). The items of large containers are sampled
+    and their average size is extrapolated to the whole container, objects
+    shared by several items (like the docno strings) are counted once
+
+    Parameters
+    ----------
+    structure
+        python object to measure
+    sample_size
+        maximum number of items measured of each container
+    seen
+        ids of the objects already counted
+
+    Returns
+    ----------
+    size
+        estimated size in bytes
+    """
+    if seen is None:
+        seen = set()
+
+    if id(structure) in seen:
+        return 0
+    seen.add(id(structure))
+
+    size = sys.getsizeof(structure)
+
+    if isinstance(structure, dict):
+        items = len(structure)
+        if items == 0:
+            return size
+        sampled = sum([estimate_size(key, sample_size, seen) + estimate_size(value, sample_size, seen) for key, value in islice(structure.items(), sample_size)])
+    elif isinstance(structure, (list, tuple, set, frozenset)):
+        items = len(structure)
+        if items == 0:
+            return size
+        sampled = sum([estimate_size(item, sample_size, seen) for item in islice(structure, sample_size)])
+    else:
+        # strings, numbers and buffers (arrays report their buffer in getsizeof)
+        return size
+
+    return size + int(sampled * items / min(items, sample_size))
+
+
+class MemoryProfiler:
+    """
+    Memory profiler writing a time series of samples
+
+    Each sample is a json line with the elapsed time, the
+    event that triggered it, the resident set size of the
+    process, the current and peak memory traced by tracemalloc,
+    the top allocators (by source line) and the estimated size
+    of the given structures.
+
+    """
+    def __init__(self, path, top=10):
+        self.path = path
+        self.top = top                      # number of allocators of each sample
+        self.start = time()
+        self.lock = threading.Lock()        # samples may be taken by the background merges
+        self.process = psutil.Process()
+
+        self.file = open(path, "w", encoding="utf-8")
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def sample(self, event, structures=None, **details):
+        """
+        Writes a sample of the memory usage
+
+        Parameters
+        ----------
+        event
+            name of the checkpoint that triggered the sample
+        structures
+            dictionary with the structures whose size is estimated, by name
+        details
+            additional values written with the sample (block number, queries, ...)
+        """
+        with self.lock:
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            statistics = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+
+            sample = {"time": round(time() - self.start, 4), "event": event, **details,
+                      "rss": self.process.memory_info().rss, "traced": traced, "traced_peak": traced_peak,
+                      "structures": {name: estimate_size(structure) for name, structure in (structures or {}).items()},
+                      "top_allocators": [{"location": "{}:{}".format(statistic.traceback[0].filename, statistic.traceback[0].lineno),
+                                          "size": statistic.size, "count": statistic.count} for statistic in statistics[:self.top]]}
+
+            self.file.write(json.dumps(sample) + "\n")
+            self.file.flush()
+
+    def close(self):
+        """
+        Closes the time series file and stops tracing the allocations
+        """
+        with self.lock:
+            self.file.close()
+            tracemalloc.stop()
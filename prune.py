@@ -0,0 +1,424 @@
+"""
+    prune.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Static pruning module
+
+    Writes a pruned copy of an index, without the postings that
+    are unlikely to ever reach the top-k of a query, and reports
+    the size reduction and (given the questions with their gold
+    standard) the change of the evaluation metrics of the searcher.
+
+    Example:
+        python prune.py pubmedSPIMIindex pubmedSPIMIindexPruned --method term --epsilon 0.5
+        python prune.py pubmedSPIMIindex pubmedSPIMIindexPruned --method document --epsilon 0.3 --questions questions/questions_with_gs.zip
+
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+from array import array
+from time import time
+
+from index import SPIMIIndexer, DocumentsTable
+from dictionary import TermDictionary
+from postings import SkipTable, ChampionTable
+from impacts import ImpactTable
+from searcher import load_index_metadata
+from benchmark import run_command, folder_size
+
+# BM25 parameters of the postings contributions (the same of the impacts and champion lists)
+K1 = 1.2
+B = 0.75
+
+# postings of each skip block (the same of the merging step)
+SKIP_BLOCK_SIZE = 128
+
+
+def get_contribution(rsv, documents_table):
+    """
+    Auxiliar function to get the function that computes the score contribution
+    of a posting (without the idf) from its docno and weight, that is, its tfidf
+    weight or its BM25 term frequency component
+
+    Parameters
+    ----------
+    rsv
+        rsv of the index ("tfidf", "bm25" or "raw")
+    documents_table
+        documents table of the generation
+
+    Returns
+    ----------
+    contribution
+        function of the docno and weight of a posting
+    """
+    if rsv == "tfidf":
+        return lambda docno, weight: weight
+
+    return lambda docno, tf: (K1 + 1) * tf / (K1 * ((1 - B) + B * documents_table.get_length(docno) / documents_table.avdl) + tf)
+
+
+def read_postings(generation_folder):
+    """
+    Auxiliar function to read the postings lists of a generation in the terms
+    dictionary order
+
+    Parameters
+    ----------
+    generation_folder
+        generation folder directory
+
+    Yields
+    ----------
+    postings
+        (segment name, terms data fields, postings) tuple of each term, where
+        postings is a list of (docno, weight, raw posting) tuples
+    """
+    segment_names = sorted(os.listdir("{}/merged".format(generation_folder)), key=lambda file: int(file.split(";")[0]))
+
+    with open("{}/data/terms_data.txt".format(generation_folder), "r", encoding="utf-8") as terms_data_file:
+        for segment_name in segment_names:
+            with open("{}/merged/{}".format(generation_folder, segment_name), "r", encoding="utf-8", newline="\n") as segment_file:
+                for line in segment_file:
+                    fields = terms_data_file.readline().strip().split(",")
+
+                    postings = []
+                    for posting in line.rstrip("\n").split(";")[1:]:
+                        docno, weight, _ = posting.split(":", 2)
+                        postings.append((int(docno), float(weight), posting))
+
+                    yield (segment_name, fields, postings)
+
+
+def get_documents_thresholds(generation_folder, contribution, documents_table, epsilon):
+    """
+    Auxiliar function to compute the document-centric pruning threshold of
+    each document of a generation, a fraction of the highest score
+    contribution (with the idf) of its terms
+
+    Parameters
+    ----------
+    generation_folder
+        generation folder directory
+    contribution
+        score contribution function
+    documents_table
+        documents table of the generation
+    epsilon
+        fraction of the highest contribution of each document
+
+    Returns
+    ----------
+    thresholds
+        array with the threshold of each document (indexed by docno - first docno)
+    """
+    thresholds = array("f", [0.0]) * len(documents_table)
+
+    for _, fields, postings in read_postings(generation_folder):
+        idf = float(fields[1])
+        for docno, weight, _ in postings:
+            score = idf * contribution(docno, weight)
+            if score > thresholds[docno - documents_table.first_docno]:
+                thresholds[docno - documents_table.first_docno] = score
+
+    for i in range(len(thresholds)):
+        thresholds[i] *= epsilon
+
+    return thresholds
+
+
+def prune_generation(generation_folder, output_folder, rsv, method, epsilon, topk):
+    """
+    Writes the pruned copy of a generation
+
+    Term-centric pruning keeps the postings of each term whose contribution
+    is at least epsilon times the k-th highest contribution of the term (so
+    the top-k of a single term query is kept), document-centric pruning keeps
+    the postings of each document whose contribution (with the idf) is at
+    least epsilon times the highest contribution of the document. The best
+    posting of every term is always kept, and the collection statistics (df
+    and idf) of the terms are not changed.
+
+    Parameters
+    ----------
+    generation_folder
+        generation folder directory
+    output_folder
+        pruned generation folder directory
+    rsv
+        rsv of the index
+    method
+        "term" or "document"
+    epsilon
+        pruning threshold factor
+    topk
+        top k documents of the term-centric pruning
+
+    Returns
+    ----------
+    postings
+        (postings of the generation, kept postings) tuple
+    """
+    for folder_name in ("data", "merged"):
+        os.makedirs("{}/{}".format(output_folder, folder_name))
+
+    # the documents table and tombstones are not changed
+    for file_name in ("docs_table.bin", "tombstones.bin"):
+        if (os.path.exists("{}/data/{}".format(generation_folder, file_name))):
+            shutil.copyfile("{}/data/{}".format(generation_folder, file_name), "{}/data/{}".format(output_folder, file_name))
+
+    documents_table = DocumentsTable("{}/data/docs_table.bin".format(generation_folder))
+    contribution = get_contribution(rsv, documents_table)
+
+    if method == "document":
+        thresholds = get_documents_thresholds(generation_folder, contribution, documents_table, epsilon)
+
+    # champion lists are selected again from the pruned postings lists
+    champion_table = None
+    if (os.path.exists("{}/data/champions.bin".format(generation_folder))):
+        champion_table = ChampionTable("{}/data/champions.bin".format(generation_folder))
+        champions_file = open("{}/data/champions.txt".format(output_folder), "w", encoding="utf-8", newline="\n")
+        champions_offset = 0
+        terms_champions = []
+
+    terms_data_file = open("{}/data/terms_data.txt".format(output_folder), "w", encoding="utf-8")
+    terms_skips = []
+    segment_file = None
+    total_postings = 0
+    kept_postings = 0
+
+    for segment_name, fields, postings in read_postings(generation_folder):
+        if segment_file is None or os.path.basename(segment_file.name) != segment_name:
+            if segment_file is not None:
+                segment_file.close()
+            segment_file = open("{}/merged/{}".format(output_folder, segment_name), "w", encoding="utf-8", newline="\n")
+            offset = 0
+
+        contributions = [contribution(docno, weight) for docno, weight, _ in postings]
+
+        if len(postings) == 0:
+            kept = []
+        elif method == "term":
+            # k-th highest contribution of the term
+            threshold = epsilon * sorted(contributions, reverse=True)[min(topk, len(contributions)) - 1]
+            kept = [i for i in range(len(postings)) if contributions[i] >= threshold]
+        else:
+            idf = float(fields[1])
+            kept = [i for i in range(len(postings)) if idf * contributions[i] >= thresholds[postings[i][0] - documents_table.first_docno]]
+
+        # the best posting of the term is always kept
+        if len(kept) == 0 and len(postings) > 0:
+            kept = [max(range(len(postings)), key=lambda i: contributions[i])]
+
+        total_postings += len(postings)
+        kept_postings += len(kept)
+
+        line = fields[0] + ";" + ";".join([postings[i][2] for i in kept]) + "\n"
+        segment_file.write(line)
+
+        # (term, idf, doc_index, df, offset), the collection statistics are kept
+        terms_data_file.write("{},{},{},{},{}\n".format(fields[0], fields[1], fields[2], fields[3], offset))
+
+        line_length = len(line.encode("utf-8"))
+        skips = SkipTable.get_skips(line, SKIP_BLOCK_SIZE) if len(kept) > SKIP_BLOCK_SIZE else None
+        terms_skips.append((skips, line_length) if skips is not None else None)
+
+        if champion_table is not None:
+            if len(kept) > champion_table.champions:
+                champions_line, threshold = ChampionTable.get_champions(line, champion_table.champions, contribution)
+                champions_file.write(champions_line)
+                terms_champions.append((champions_offset, threshold))
+                champions_offset += len(champions_line.encode("utf-8"))
+            else:
+                terms_champions.append(None)
+
+        offset += line_length
+
+    if segment_file is not None:
+        segment_file.close()
+    terms_data_file.close()
+
+    TermDictionary.build("{}/data/terms_data.txt".format(output_folder), "{}/data/terms_dict.bin".format(output_folder))
+    SkipTable.write("{}/data/skips.bin".format(output_folder), SKIP_BLOCK_SIZE, terms_skips)
+
+    if champion_table is not None:
+        champions_file.close()
+        ChampionTable.write("{}/data/champions.bin".format(output_folder), champion_table.champions, champion_table.weighting, terms_champions, K1, B)
+        champion_table.close()
+
+    if (os.path.exists("{}/data/impacts.bin".format(generation_folder))):
+        ImpactTable.build(output_folder, "tfidf" if rsv == "tfidf" else "bm25", documents_table, K1, B)
+
+    documents_table.close()
+
+    return (total_postings, kept_postings)
+
+
+def prune_index(index_folder, output_folder, method, epsilon, topk):
+    """
+    Writes the pruned copy of an index (every generation is pruned)
+
+    Parameters
+    ----------
+    index_folder
+        index root folder
+    output_folder
+        pruned index root folder
+    method
+        "term" or "document"
+    epsilon
+        pruning threshold factor
+    topk
+        top k documents of the term-centric pruning
+
+    Returns
+    ----------
+    postings
+        (postings of the index, kept postings) tuple
+    """
+    index_metadata = load_index_metadata(index_folder)
+    if index_metadata is None or not os.path.exists("{}/data/generations.json".format(index_folder)):
+        raise RuntimeError("\"{}\" has no manifest, the index must be rebuilt to be pruned.".format(index_folder))
+
+    # the output folder is deleted before the index is read, so it can not hold the index (or be inside it)
+    index_path, output_path = os.path.realpath(index_folder), os.path.realpath(output_folder)
+    if os.path.commonpath([index_path, output_path]) in (index_path, output_path):
+        raise RuntimeError("The output folder \"{}\" can not be, contain or be inside the pruned index \"{}\".".format(output_folder, index_folder))
+
+    metadata = index_metadata[1]["metadata"]
+    metadata.pop("index_output_folder", None)
+
+    if (os.path.exists(output_folder)):
+        shutil.rmtree(output_folder)
+
+    with open("{}/data/generations.json".format(index_folder), "r", encoding="utf-8") as generations_file:
+        generations = json.load(generations_file)
+
+    total_postings = 0
+    kept_postings = 0
+    for generation in generations["generations"]:
+        print("Pruning generation {} of \"{}/\"...".format(generation["id"], index_folder))
+        generation_postings = prune_generation("{}/{}".format(index_folder, generation["folder"]), "{}/{}".format(output_folder, generation["folder"]),
+                                               metadata["rsv"], method, epsilon, topk)
+        total_postings += generation_postings[0]
+        kept_postings += generation_postings[1]
+
+    shutil.copyfile("{}/data/generations.json".format(index_folder), "{}/data/generations.json".format(output_folder))
+
+    # the manifest of the pruned index describes its own segments and files
+    indexer = SPIMIIndexer(posting_threshold=None, memory_threshold=None, rsv=metadata["rsv"])
+    indexer.save_manifest(output_folder, metadata)
+
+    return (total_postings, kept_postings)
+
+
+def evaluate_index(questions_path, index_folder, topk, searcher_args, log_path):
+    """
+    Runs the searcher over the questions with gold standard and averages
+    its evaluation metrics
+
+    Parameters
+    ----------
+    questions_path
+        questions zip file path
+    index_folder
+        index root folder
+    topk
+        top k documents retrieved by the searcher
+    searcher_args
+        additional arguments passed to the searcher
+    log_path
+        file where the searcher output is saved
+
+    Returns
+    ----------
+    metrics
+        dictionary with the mean precision, recall, f-measure, average precision
+        and query time
+    """
+    searcher_command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py"), "searcher", questions_path, index_folder,
+                        "--documents.topk", str(topk)] + searcher_args.split()
+    searcher_output, _, _ = run_command(searcher_command, log_path, os.getcwd())
+
+    metrics = {}
+    for name, pattern in (("precision", r"^Precision: ([\d.e-]+)"), ("recall", r"^Recall: ([\d.e-]+)"), ("f_measure", r"^F-measure: ([\d.e-]+)"),
+                          ("average_precision", r"^Average Precision: ([\d.e-]+)"), ("query_time", r"^Query Time: ([\d.e-]+)")):
+        values = [float(value) for value in re.findall(pattern, searcher_output, re.MULTILINE)]
+        metrics[name] = sum(values) / len(values) if values else None
+
+    return metrics
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Static pruning of an index, writes a smaller copy of the index without the postings that are unlikely to reach a top-k")
+
+    parser.add_argument("index_folder", type=str,
+                        help="Index root folder.")
+    parser.add_argument("output_folder", type=str,
+                        help="Folder where the pruned index is written.")
+    parser.add_argument("--method", type=str, default="term", choices=["term", "document"],
+                        help="Term-centric (per term threshold) or document-centric (per document threshold) pruning (default=term).")
+    parser.add_argument("--epsilon", type=float, default=0.5,
+                        help="Postings whose contribution is lower than epsilon times the k-th highest contribution of their term (term-centric) or the highest contribution of their document (document-centric) are dropped (default=0.5).")
+    parser.add_argument("--topk", type=int, default=10,
+                        help="Top k documents of the term-centric pruning and of the evaluation searcher (default=10).")
+    parser.add_argument("--questions", type=str, default=None,
+                        help="Questions zip with gold standard, the searcher metrics over the original and pruned indexes are compared (default=None).")
+    parser.add_argument("--searcher-args", type=str, default="",
+                        help="Additional arguments passed to the evaluation searcher (default=\"\").")
+
+    args = parser.parse_args()
+
+    index_folder = os.path.normpath(args.index_folder)
+    if os.path.basename(index_folder) == "merged":
+        index_folder = os.path.dirname(index_folder) or "."
+
+    prune_start = time()
+    total_postings, kept_postings = prune_index(index_folder, args.output_folder, args.method, args.epsilon, args.topk)
+
+    original_size = folder_size(index_folder)
+    pruned_size = folder_size(args.output_folder)
+
+    print("\n:: Pruning ({}-centric, epsilon={}) ::".format(args.method, args.epsilon))
+    print("> Pruning time: {:.3f} seconds".format(time() - prune_start))
+    print("> Postings kept: {} of {} ({:.1f}%)".format(kept_postings, total_postings, kept_postings / total_postings * 100 if total_postings > 0 else 0.0))
+    print("> Index size: {:.3f} MBytes -> {:.3f} MBytes ({:+.1f}%)".format(original_size / 1048576, pruned_size / 1048576,
+                                                                          (pruned_size - original_size) / original_size * 100))
+
+    if args.questions is not None:
+        print("\nEvaluating the original and pruned indexes...")
+
+        # the searcher logs are written beside the pruned index (the files in its root are read as blocks by the indexer)
+        log_prefix = os.path.normpath(args.output_folder)
+        original_metrics = evaluate_index(args.questions, index_folder, args.topk, args.searcher_args, log_prefix + "_searcher_original.log")
+        pruned_metrics = evaluate_index(args.questions, args.output_folder, args.topk, args.searcher_args, log_prefix + "_searcher_pruned.log")
+
+        for name in original_metrics:
+            if original_metrics[name] is None or pruned_metrics[name] is None:
+                print("> {}: not available".format(name))
+                continue
+            print("> {}: {:.4f} -> {:.4f} ({:+.4f})".format(name, original_metrics[name], pruned_metrics[name], pruned_metrics[name] - original_metrics[name]))
@@ -32,7 +32,8 @@ from utils import dynamically_init_class
 
 import json                         # parse json files
 import gzip                         # decode gzip format files
-from zipfile import ZipFile         # decompress zip files
+import io                           # decode the zip members as text streams
+from zipfile import ZipFile, is_zipfile     # decompress zip files
 
 
 def dynamically_init_reader(**kwargs):
@@ -125,42 +126,77 @@ class QuestionsReader(Reader):
         # I do not want to refactor Reader and here path_to_collection does not make any sense.
         # So consider using self.path_to_questions instead (but both variables point to the same thing, it just to not break old code)
         self.path_to_questions = self.path_to_collection
+        self.bad_lines = 0                  # lines of the questions files that are not valid questions
         print("init QuestionsReader|", f"{self.path_to_questions=}")
         if kwargs:
             print(f"{self.__class__.__name__} also caught the following additional arguments {kwargs}")
 
-    def read_questions(self):
+    def open_question_files(self):
         """
-        Auxiliar function to open the gzip file and read each json line
-                
+        Auxiliar function to open the questions file, that can be a zip of
+        json lines files (every member is read), a gzip json lines file or a
+        plain json lines file. The files are streamed, never read whole
+
         Yields
         ----------
-        data
-            each line of the files converted to dictionaries
-            with keys and values
+        question_file
+            (file name, text stream) tuple of each questions file
         """
-        #with open(self.path_to_questions, 'r') as questions_file:
-        #    for question in questions_file:
-                # yield each question
-        #        yield question
+        if is_zipfile(self.path_to_questions):
+            with ZipFile(self.path_to_questions, 'r') as zip:
+                print()
+                zip.printdir()
+                print()
+
+                for file_name in zip.namelist():
+                    if file_name.endswith("/"):
+                        continue
+
+                    with io.TextIOWrapper(zip.open(file_name, 'r'), encoding='utf-8') as question_file:
+                        yield (file_name, question_file)
+            return
+
+        with open(self.path_to_questions, 'rb') as question_file:
+            compressed = question_file.read(2) == b"\x1f\x8b"
+
+        if compressed:
+            with gzip.open(self.path_to_questions, 'rt', encoding='utf-8') as question_file:
+                yield (self.path_to_questions, question_file)
+        else:
+            with open(self.path_to_questions, 'r', encoding='utf-8') as question_file:
+                yield (self.path_to_questions, question_file)
 
-        with ZipFile(self.path_to_questions, 'r') as zip:
-            print()
-            zip.printdir()
-            print()
+    def read_questions(self):
+        """
+        Auxiliar function to read each json line of the questions files,
+        one line at a time (the lines that are not valid questions are
+        skipped and counted)
+
+        Yields
+        ----------
+        query_data
+            (question, set with the pmids of the relevant documents) tuple of
+            each question (the set is empty in case the line has no gold standard)
+        """
+        self.bad_lines = 0
 
-            for file_name in zip.namelist():
-                file_data = (zip.read(file_name).decode('utf-8')).split('\n')
+        for file_name, question_file in self.open_question_files():
+            file_bad_lines = 0
 
-                for line in file_data:
-                    line_data = line.split(',')
+            for line in question_file:
+                if line.strip() == "":
+                    continue
 
-                    # we do this verification because there are some faulty lines in the json file, so we first need to make sure the line
-                    # can be converted to json
-                    if (len(line_data) > 1):
-                        query_data = (json.loads(line)["query_text"], set([int(x) for x in json.loads(line)["documents_pmid"]]))
+                # there are some faulty lines in the questions files, so each line is only used in case it is a valid question
+                try:
+                    question = json.loads(line)
+                    query_data = (question["query_text"], set([int(x) for x in question.get("documents_pmid", [])]))
+                except (ValueError, KeyError, TypeError):
+                    file_bad_lines += 1
+                    continue
 
-                        #print(query_data)
-                        yield query_data
+                yield query_data
 
-                #break # only read one question file for now 
\ No newline at end of file
+            if file_bad_lines > 0:
+                print("Warning: skipped {} invalid question lines of \"{}\"".format(file_bad_lines, file_name))
+                self.bad_lines += file_bad_lines
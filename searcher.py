@@ -29,12 +29,20 @@
 """
 
 from utils import dynamically_init_class
+from index import TombstoneBitmap, DocumentsTable
+from dictionary import TermDictionary
+from postings import SkipTable, ChampionTable, SegmentRegistry, PostingsCursor, ChainedCursor, intersect, match_at_least
+from impacts import ImpactTable
 
 import math
 import os
 import operator
 import json
 import sys
+import re
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
 
 def dynamically_init_searcher(**kwargs):
     """Dynamically initializes a Searcher object from this
@@ -57,6 +65,45 @@ def dynamically_init_searcher(**kwargs):
     return dynamically_init_class(__name__, **kwargs)
 
 
+def load_index_metadata(index_folder):
+    """Loads the metadata of an index from its manifest
+    (`<index>/data/manifest.json`), indexes without a manifest
+    fall back to the `metadata/metadata.json` file of the
+    current working directory.
+
+    Parameters
+    ----------
+    index_folder : str
+        index root folder or its "merged" folder
+
+    Returns
+    ----------
+    tuple
+        (merged folder, metadata) tuple, None in case the
+        metadata could not be loaded
+    """
+    index_output_folder = os.path.normpath(index_folder)
+    if os.path.basename(index_output_folder) == "merged":
+        index_output_folder = os.path.dirname(index_output_folder) or "."
+
+    if (os.path.exists("{}/data/manifest.json".format(index_output_folder))):
+        with open("{}/data/manifest.json".format(index_output_folder), "r", encoding="utf-8") as manifest_file:
+            metadata = json.load(manifest_file)
+
+        # the index may have been moved since it was built
+        metadata["metadata"]["index_output_folder"] = index_output_folder
+    elif (os.path.exists("metadata/metadata.json")):
+        with open("metadata/metadata.json", "r", encoding="utf-8") as metadata_file:
+            metadata = json.load(metadata_file)
+
+        metadata["metadata"].setdefault("smart_notation", None)
+    else:
+        print("Could not load \"manifest.json\" file.")
+        return None
+
+    return ("{}/merged".format(index_output_folder), metadata)
+
+
 class Searcher:
     """
     Top-level Searcher class
@@ -65,32 +112,470 @@ class Searcher:
     a searcher.
 
     """
-    
+    TIME_CHECK_POSTINGS = 1024      # postings scored between the checks of the time budget (score-at-a-time)
+
     def __init__(self,
                 index_folder:str,
                 metadata,
+                match="any",
+                postings_budget=None,
+                time_budget=None,
+                tiered=False,
+                max_open_segments=64,
+                prefetch_threads=4,
                 **kwargs):
         super().__init__()
 
         self.index_folder = index_folder    # index files folder
         self.metadata = metadata            # metadata structure
-
-        self.terms_data = {}                # terms data structure
+        self.match = match                  # query terms a document must hold to be scored ("any", "all" or a minimum number)
+        self.postings_budget = postings_budget      # maximum number of postings scored per query (score-at-a-time)
+        self.time_budget = time_budget              # maximum time spent scoring the postings of a query (score-at-a-time)
+        self.tiered = tiered                # score the champion lists first (tiered search)
+        self.max_open_segments = max_open_segments  # maximum number of segments kept open by each generation
+        self.prefetch_threads = prefetch_threads    # threads reading the postings lists of the query terms (1 reads them sequentially)
+        self.prefetch_pool = None                   # thread pool of the prefetch stage (created on the first concurrent prefetch)
+        self.prefetched_lines = {}                  # postings lists lines read by the prefetch stage by (generation, segment, offset)
+
+        self.term_dictionaries = []         # term dictionary of each generation
+        self.skip_tables = []               # skip pointers of the postings lists of each generation (None if missing)
+        self.segments = []                  # segment registry (ordered and open merged segments) of each generation
+        self.impact_tables = []             # impact ordered postings lists of each generation (score-at-a-time only)
+        self.champion_tables = []           # champion lists of each generation (tiered search only)
+        self.champions_bound = 0.0          # highest score of a document missing from every champion list of the query
+        self.champions_seen = {}            # sum of the champion thresholds of the query terms whose champion list holds each document
+        self.rescored_docnos = None         # docnos to which the scoring is restricted (tiered search top-k)
         self.indexes_dict = {}              # holds term's postings list loaded to memory
+        self.positions_dict = {}            # holds the positions of each document of the terms in indexes_dict
         self.doc_scores = {}                # documents' score
 
         self.oldest_keys = []               # holds old indexes_dict terms by decreasing order (oldest term in first index and so on)
 
         self.doc_window_size = {}           # auxiliar structure to hold window size calculations
 
+        self.generations = []               # generations (independently built pieces) of the index
+        self.first_docnos = []              # docno of the first document of each generation
+        self.avdl = 0.0                     # average document length of the index
+        self.collection_statistics = None   # searcher of the shards searched together, whose statistics are used (None if the index is searched alone)
+
+        self.reset_query_stats()
+
 
     def query_search(self):
         raise NotImplementedError()
 
+    def reset_query_stats(self):
+        """
+        Auxiliar function to reset the statistics of the current query, that is,
+        the time spent in each phase (in seconds) and the postings fetching data
+        """
+        self.query_stats = {"tokenize": 0.0, "lookup": 0.0, "fetch": 0.0, "scoring": 0.0, "window_boost": 0.0, "topk": 0.0,
+                            "bytes_read": 0, "cache_hits": 0, "cache_misses": 0, "postings_scored": 0, "fallbacks": 0, "terms": {}}
+
+    def memory_structures(self):
+        """
+        Auxiliar function to get the in-memory structures of the searcher
+        whose size is sampled by the memory profiler
+
+        Returns
+        ----------
+        structures
+            dictionary with the structures by name
+        """
+        return {"indexes_dict": self.indexes_dict, "positions_dict": self.positions_dict, "doc_window_size": self.doc_window_size, "doc_scores": self.doc_scores,
+                "prefetched_lines": self.prefetched_lines, "champions_seen": self.champions_seen}
+
+    def lookup_term(self, term):
+        """
+        Auxiliar function to get the data of a term from the term dictionaries
+        of the generations
+
+        Parameters
+        ----------
+        term
+            term to search for
+
+        Returns
+        ----------
+        term_data
+            (idf, locations) tuple where locations is a list of (generation,
+            file index, offset) tuples, None in case the term does not exist
+        """
+        locations = []
+        df = 0
+        for generation_num, term_dictionary in enumerate(self.term_dictionaries):
+            entry = term_dictionary.get(term)
+            if entry is not None:
+                idf = entry[0]
+                df += entry[1]
+                locations.append((generation_num, entry[2], entry[3]))
+
+        if len(locations) == 0:
+            return None
+
+        # shards searched together, the idf is computed from the document frequencies of all the shards
+        if self.collection_statistics is not None:
+            idf = self.collection_statistics.get_idf(term)
+        # several generations, the idf is computed from the document frequencies of all the generations
+        elif len(self.generations) > 1:
+            idf = round(math.log(sum([generation["documents"] for generation in self.generations]) / df, 10), 2)
+
+        return (idf, locations)
+
+    def fetch_postings(self, index, term, term_data):
+        """
+        Auxiliar function to make sure a term's postings list is loaded in the
+        indexes dictionary, fetching it from disk in case it is not cached, and
+        to add its positions to the window size structure of the query
+
+        Parameters
+        ----------
+        index
+            index object
+        term
+            term to be fetched
+        term_data
+            term data returned by the term dictionary lookup
+        """
+        # postings list dictionary size threshold
+        dict_threshold = 20  # 20 MBytes
+
+        fetch_start = perf_counter()
+
+        # fetch term postings list from disk in case term is not yet in our indexes dictionary
+        if (term not in self.indexes_dict.keys()):
+            self.query_stats["cache_misses"] += 1
+
+            self.oldest_keys.append(term)
+
+            # memory managemet
+            if (sys.getsizeof(self.indexes_dict) / 1048576 > dict_threshold):
+                # remove oldest least used key from dictionary
+                self.indexes_dict.pop(self.oldest_keys[0])
+                self.positions_dict.pop(self.oldest_keys[0])
+                # remove oldest least used key from list
+                self.oldest_keys.pop(0)
+                #self.indexes_dict.clear()
+
+            # the positions are cached with the postings, the window size structure is cleared at every query
+            term_window_size = {}
+
+            # NOTE: term_data[1] -> (generation, index of the file, offset) where the term is saved
+            for generation_num, file_num, offset in term_data[1]:
+                if offset is None:
+                    self.query_stats["bytes_read"] += index.load_from_disk(self.segments[generation_num].path(file_num), self.indexes_dict, term, term_window_size,
+                                                                           self.generations[generation_num]["tombstones"])
+                    continue
+
+                # the line may have been read by the prefetch stage
+                line = self.prefetched_lines.pop((generation_num, file_num, offset), None)
+                if line is None:
+                    line = self.segments[generation_num].read_line(file_num, offset)
+                self.query_stats["bytes_read"] += len(line.encode("utf-8"))
+                index.load_postings_line(line, self.indexes_dict, term, term_window_size, self.generations[generation_num]["tombstones"])
+
+            # every posting of the term may belong to deleted documents
+            if term not in self.indexes_dict.keys():
+                self.indexes_dict[term] = {}
+            self.positions_dict[term] = {docid: terms_positions[term] for docid, terms_positions in term_window_size.items()}
+        # update term in oldest used key list
+        else:
+            self.query_stats["cache_hits"] += 1
+
+            self.oldest_keys.remove(term)
+            self.oldest_keys.append(term)
+
+        # the window boost consumes the positions lists, so the query gets copies of the cached ones
+        for docid, positions in self.positions_dict[term].items():
+            self.doc_window_size.setdefault(docid, {})[term] = list(positions)
+
+        self.query_stats["fetch"] += perf_counter() - fetch_start
+        self.query_stats["terms"][term] = len(self.indexes_dict[term])
+
+    def prefetch_postings(self, terms):
+        """
+        Auxiliar function to read from disk the postings lists of several query
+        terms at once, before they are scored. The terms are resolved to their
+        segments and offsets first, the lines of each segment are read together
+        (the close ones in a single read) and the segments are read concurrently
+
+        Parameters
+        ----------
+        terms
+            query terms
+        """
+        fetch_start = perf_counter()
+
+        self.prefetched_lines.clear()
+
+        # lines to read from each segment (the cached terms are not read again)
+        reads = {}
+        for term in terms:
+            if term in self.indexes_dict.keys():
+                continue
+
+            term_data = self.lookup_term(term)
+            if term_data is None:
+                continue
+
+            for generation_num, file_num, offset in term_data[1]:
+                if offset is not None:
+                    reads.setdefault((generation_num, file_num), []).append(offset)
+
+        def read_segment(segment):
+            (generation_num, file_num), offsets = segment
+            return (generation_num, file_num, self.segments[generation_num].read_lines(file_num, offsets))
+
+        # a single segment is read by the searcher thread
+        if len(reads) > 1 and self.prefetch_threads > 1:
+            if self.prefetch_pool is None:
+                self.prefetch_pool = ThreadPoolExecutor(max_workers=self.prefetch_threads)
+            segments_lines = list(self.prefetch_pool.map(read_segment, reads.items()))
+        else:
+            segments_lines = [read_segment(segment) for segment in reads.items()]
+
+        for generation_num, file_num, lines in segments_lines:
+            for offset, line in lines.items():
+                self.prefetched_lines[(generation_num, file_num, offset)] = line
+
+        self.query_stats["fetch"] += perf_counter() - fetch_start
+
+    def open_cursor(self, term):
+        """
+        Auxiliar function to open a cursor over the postings list of a term
+        in every generation, that decodes the postings one block at a time
+        and uses the skip pointers to skip blocks (the postings of deleted
+        documents are skipped)
+
+        Parameters
+        ----------
+        term
+            term to be fetched
+
+        Returns
+        ----------
+        cursor
+            cursor over the postings list, None in case the term does not exist
+        """
+        cursors = []
+        for generation_num, term_dictionary in enumerate(self.term_dictionaries):
+            ordinal = term_dictionary.find(term)
+            if ordinal < 0:
+                continue
+
+            _, _, file_num, offset = term_dictionary.get_entry(ordinal)
+            if offset is None:
+                raise RuntimeError("The term dictionary of \"{}\" has no postings offsets, the index must be rebuilt.".format(self.generations[generation_num]["folder"]))
+
+            skips = self.skip_tables[generation_num].get(ordinal) if self.skip_tables[generation_num] is not None else None
+
+            cursors.append(PostingsCursor(self.segments[generation_num], file_num, offset, skips, self.generations[generation_num]["tombstones"]))
+
+        if len(cursors) == 0:
+            return None
+
+        return cursors[0] if len(cursors) == 1 else ChainedCursor(cursors)
+
+    def parse_query(self, query):
+        """
+        Auxiliar function to extract the positional operators of a query,
+        exact phrases ("heart failure") and proximity (heart NEAR/3 failure,
+        the terms appear at most 3 positions apart, in any order)
+
+        Parameters
+        ----------
+        query
+            user query
+
+        Returns
+        ----------
+        parsed_query
+            (text, operators) tuple where text is the query without the operators
+            syntax (so that all its terms are scored) and operators is a list of
+            ("phrase", words) and ("near", distance, left word, right word) tuples
+        """
+        operators = []
+
+        for phrase in re.findall(r'"([^"]+)"', query):
+            operators.append(("phrase", phrase))
+
+        # consecutive operators share their operands (a NEAR/2 b NEAR/5 c)
+        for left, distance, right in re.findall(r'(?<!\S)(?=(\S+)\s+NEAR/(\d+)\s+(\S+))', query):
+            operators.append(("near", int(distance), left.strip('"'), right.strip('"')))
+
+        text = re.sub(r'\bNEAR/\d+\b', ' ', query).replace('"', ' ')
+
+        return (text, operators)
+
+    def match_operators(self, tokenizer, operators):
+        """
+        Auxiliar function to find the documents that satisfy every positional
+        operator of a query, the postings of each operator's terms are
+        intersected by docno (starting from the rarest term) and the positions
+        are only compared for the common documents
+
+        Parameters
+        ----------
+        tokenizer
+            tokenizer object
+        operators
+            operators returned by parse_query
+
+        Returns
+        ----------
+        candidates
+            sorted list of the docnos of the matching documents, None in case
+            the query has no operators (that are not made of stop words only)
+        """
+        candidates = None
+
+        for operator in operators:
+            if operator[0] == "phrase":
+                terms = tokenizer.tokenize(operator[1])
+                if len(terms) == 0:
+                    continue
+
+                # offset of each term in the phrase
+                offsets = list(range(len(terms)))
+                match = lambda cursors, offsets=offsets: self.match_phrase(cursors, offsets)
+            else:
+                left, right = tokenizer.tokenize(operator[2]), tokenizer.tokenize(operator[3])
+                if len(left) == 0 or len(right) == 0:
+                    continue
+
+                terms = [left[-1], right[0]]
+                offsets = [0, 0]
+                match = lambda cursors, distance=operator[1]: self.match_near(cursors, distance)
+
+            # rarest term first
+            dfs = [sum([entry[1] for entry in [term_dictionary.get(term) for term_dictionary in self.term_dictionaries] if entry is not None]) for term in terms]
+            order = sorted(range(len(terms)), key=lambda i: dfs[i])
+
+            if min(dfs) == 0:
+                return []
+
+            cursors = [self.open_cursor(terms[i]) for i in order]
+            ordered_match = lambda cursors, match=match, order=order: match([cursors[order.index(i)] for i in range(len(order))])
+
+            docnos = intersect(cursors, ordered_match)
+            candidates = docnos if candidates is None else sorted(set(candidates) & set(docnos))
+
+            if len(candidates) == 0:
+                break
+
+        return candidates
+
+    def match_terms(self, terms, candidates):
+        """
+        Auxiliar function to find the documents holding all (or at least a
+        minimum number) of the query terms, according to the match mode. The
+        terms are ordered by document frequency and the postings of the
+        rarest ones drive the search, so that the work is bounded by them
+
+        Parameters
+        ----------
+        terms
+            query terms
+        candidates
+            sorted list of the docnos that satisfy the positional operators,
+            None in case the query has no operators
+
+        Returns
+        ----------
+        candidates
+            sorted list of the docnos of the matching documents, None in case
+            every document holding any query term is to be scored
+        """
+        if self.match == "any" or len(terms) == 0:
+            return candidates
+
+        min_match = len(terms) if self.match == "all" else min(int(self.match), len(terms))
+
+        # terms missing from the index are never matched
+        dfs = {term: sum([entry[1] for entry in [term_dictionary.get(term) for term_dictionary in self.term_dictionaries] if entry is not None]) for term in terms}
+        terms = sorted([term for term in terms if dfs[term] > 0], key=lambda term: dfs[term])
+
+        if len(terms) < min_match:
+            return []
+
+        docnos = match_at_least([self.open_cursor(term) for term in terms], min_match)
+
+        return docnos if candidates is None else sorted(set(candidates) & set(docnos))
+
+    def match_phrase(self, cursors, offsets):
+        """
+        Auxiliar function to check if the terms of a phrase appear
+        consecutively in the document the cursors are positioned on
+        """
+        positions = [set(cursor.positions()) for cursor in cursors]
+
+        for position in positions[0]:
+            if all([position + offsets[i] in positions[i] for i in range(1, len(positions))]):
+                return True
+
+        return False
+
+    def match_near(self, cursors, distance):
+        """
+        Auxiliar function to check if two terms appear at most distance
+        positions apart in the document the cursors are positioned on
+        """
+        left, right = sorted(cursors[0].positions()), sorted(cursors[1].positions())
+
+        i, j = 0, 0
+        while i < len(left) and j < len(right):
+            if abs(left[i] - right[j]) <= distance:
+                return True
+            if left[i] < right[j]:
+                i += 1
+            else:
+                j += 1
+
+        return False
+
+    def fetch_candidate_postings(self, term, candidates):
+        """
+        Auxiliar function to get the postings of a term for a group of
+        candidate documents only, using a cursor that skips the postings
+        of the other documents
+
+        Parameters
+        ----------
+        term
+            term to be fetched
+        candidates
+            sorted list of the candidate docnos
+
+        Returns
+        ----------
+        postings
+            dictionary with the weight of the term in each candidate document
+        """
+        fetch_start = perf_counter()
+
+        postings = {}
+        cursor = self.open_cursor(term)
+
+        for docno in candidates:
+            if cursor.advance(docno) is None:
+                break
+
+            if cursor.docno == docno:
+                postings[str(docno)] = cursor.weight()
+
+                # window size calculation auxiliar structure
+                self.doc_window_size.setdefault(str(docno), {})[term] = [str(position) for position in cursor.positions()]
+
+        self.query_stats["bytes_read"] += cursor.bytes_read
+        self.query_stats["fetch"] += perf_counter() - fetch_start
+        self.query_stats["terms"][term] = len(postings)
+
+        return postings
+
     def load_metadata(self):
         """
         Auxiliar function to fill metadata structure with parameters used in indexer
-        to help in the searcher phase
+        to help in the searcher phase (read from the index manifest)
         
         Returns
         ----------
@@ -100,21 +585,46 @@ class Searcher:
             otherwise
 
         """
-        if (not os.path.exists("metadata/metadata.json")):
-            print("Could not load \"metadata.json\" file.")
+        index_metadata = load_index_metadata(self.index_folder)
+        if index_metadata is None:
             return False
 
-        with open("metadata/metadata.json", "r", encoding="utf-8") as metadata_file: 
-            self.metadata = json.load(metadata_file)
-
-        #print(list(metadata.keys())[5000], list(metadata.values())[5000])
+        self.index_folder, self.metadata = index_metadata
 
         return True
 
+    def load_generations(self):
+        """
+        Auxiliar function to fill the generations list with the folders and
+        statistics of each generation of the index (an index that was not
+        built incrementally has a single generation in its root folder)
+        """
+        index_output_folder = self.metadata["metadata"]["index_output_folder"]
+
+        if (not os.path.exists("{}/data/generations.json".format(index_output_folder))):
+            self.generations = [{"folder": index_output_folder, "merged_folder": self.index_folder, "first_docno": 0, "documents": None, "total_length": None, "tombstones": None, "table": None}]
+            self.first_docnos = [0]
+            return
+
+        with open("{}/data/generations.json".format(index_output_folder), "r", encoding="utf-8") as generations_file:
+            generations = json.load(generations_file)["generations"]
+
+        self.generations = []
+        for generation in generations:
+            folder = "{}/{}".format(index_output_folder, generation["folder"]) if generation["folder"] != "." else index_output_folder
+            merged_folder = "{}/merged".format(folder) if generation["folder"] != "." else self.index_folder
+            # deleted documents of the generation (ignored when fetching postings)
+            tombstones = TombstoneBitmap.load("{}/data/tombstones.bin".format(folder))
+
+            self.generations.append({"folder": folder, "merged_folder": merged_folder, "first_docno": generation["first_docno"], "documents": generation["documents"],
+                                     "total_length": generation["total_length"], "tombstones": tombstones if len(tombstones) > 0 else None, "table": None})
+
+        self.first_docnos = [generation["first_docno"] for generation in self.generations]
+
     def load_terms_data(self):
         """
-        Auxiliar function to fill terms data structure with pre-computed data
-        to help in the searcher phase
+        Auxiliar function to open the term dictionary of each generation,
+        (which is built from the terms data file in case it does not exist)
         
         Returns
         ----------
@@ -124,43 +634,453 @@ class Searcher:
             otherwise
 
         """
-        if (not os.path.exists("{}/data/terms_data.txt".format(self.metadata["metadata"]["index_output_folder"]))):
-            print("Could not load \"terms_data.txt\" file.")
-            return False
+        self.load_generations()
 
-        with open("{}/data/terms_data.txt".format(self.metadata["metadata"]["index_output_folder"]), "r", encoding="utf-8") as terms_data_file: 
-            for line in terms_data_file:
-                data = line.strip().split(",")
-                self.terms_data[data[0]] = (float(data[1]), int(data[2]))
+        for generation in self.generations:
+            if (not os.path.exists("{}/data/terms_dict.bin".format(generation["folder"]))):
+                if (not os.path.exists("{}/data/terms_data.txt".format(generation["folder"]))):
+                    print("Could not load \"terms_data.txt\" file.")
+                    return False
 
-        #print(list(terms_data.keys())[5000], list(terms_data.values())[5000])
+                TermDictionary.build("{}/data/terms_data.txt".format(generation["folder"]), "{}/data/terms_dict.bin".format(generation["folder"]))
+
+            self.term_dictionaries.append(TermDictionary("{}/data/terms_dict.bin".format(generation["folder"])))
+            self.skip_tables.append(SkipTable("{}/data/skips.bin".format(generation["folder"])) if os.path.exists("{}/data/skips.bin".format(generation["folder"])) else None)
+
+            # the segments are listed and checked once, the queries read them through the registry
+            try:
+                self.segments.append(SegmentRegistry(generation["merged_folder"], self.max_open_segments))
+                self.segments[-1].validate(self.term_dictionaries[-1])
+            except RuntimeError as error:
+                print(error)
+                return False
 
         return True
 
+    def close(self):
+        """
+        Auxiliar function to close the files opened by the searcher
+        """
+        for term_dictionary in self.term_dictionaries:
+            term_dictionary.close()
+        self.term_dictionaries.clear()
+
+        for skip_table in self.skip_tables:
+            if skip_table is not None:
+                skip_table.close()
+        self.skip_tables.clear()
+
+        if self.prefetch_pool is not None:
+            self.prefetch_pool.shutdown()
+            self.prefetch_pool = None
+
+        for segments in self.segments:
+            segments.close()
+        self.segments.clear()
+
+        for impact_table in self.impact_tables:
+            impact_table.close()
+        self.impact_tables.clear()
+
+        for champion_table in self.champion_tables:
+            champion_table.close()
+        self.champion_tables.clear()
+
+        for generation in self.generations:
+            if generation["table"] is not None:
+                generation["table"].close()
+                generation["table"] = None
+
     def load_docs_data(self):
         """
-        Auxiliar function to fill docs data structure with pre-computed data
-        to help in the searcher phase
+        Auxiliar function to memory map the documents table of each generation,
+        that maps the docnos used in the postings to the documents' pmid and length
         
         Returns
         ----------
         True
-            in case terms data was sucessfully loaded
+            in case docs data was sucessfully loaded
         False
             otherwise
 
         """
-        if (not os.path.exists("{}/data/docs_data.txt".format(self.metadata["metadata"]["index_output_folder"]))):
-            print("Could not load \"docs_data.txt\" file.")
+        for generation in self.generations:
+            if (not os.path.exists("{}/data/docs_table.bin".format(generation["folder"]))):
+                print("Could not load \"docs_table.bin\" file.")
+                return False
+
+        for generation in self.generations:
+            generation["table"] = DocumentsTable("{}/data/docs_table.bin".format(generation["folder"]))
+
+        # several generations, the document lengths are normalized by the average length of all the generations
+        if len(self.generations) > 1:
+            self.avdl = sum([generation["total_length"] for generation in self.generations]) / sum([generation["documents"] for generation in self.generations])
+        else:
+            self.avdl = self.generations[0]["table"].avdl
+
+        return True
+
+    def load_impacts_data(self):
+        """
+        Auxiliar function to open the impact ordered postings of each generation,
+        which are only used (and required) in case a postings or time budget is given
+
+        Returns
+        ----------
+        True
+            in case impacts data was sucessfully loaded (or is not needed)
+        False
+            otherwise
+
+        """
+        if self.postings_budget is None and self.time_budget is None:
+            return True
+
+        for generation in self.generations:
+            if (not os.path.exists("{}/data/impacts.bin".format(generation["folder"]))):
+                print("Could not load \"impacts.bin\" file, the index must be built with --indexer.impact_ordered to be searched with a budget.")
+                return False
+
+        for generation in self.generations:
+            self.impact_tables.append(ImpactTable("{}/data/impacts.bin".format(generation["folder"])))
+
+        # the impacts hold the document side of the score of the rsv the index was built with
+        if self.impact_tables[0].weighting != self.metadata["metadata"]["searcher_rsv"]:
+            print("The impacts of the index were computed for the \"{}\" rsv, it can not be searched with a budget using the \"{}\" rsv.".format(self.impact_tables[0].weighting, self.metadata["metadata"]["searcher_rsv"]))
             return False
 
-        with open("{}/data/docs_data.txt".format(self.metadata["metadata"]["index_output_folder"]), "r", encoding="utf-8") as docs_data_file: 
-            for line in docs_data_file:
-                data = line.strip().split(",")
-                self.docs_data[data[0]] = float(data[1])
+        # the BM25 impacts hold the term frequency component computed with the k1 and b of the index
+        for impact_table in self.impact_tables:
+            if impact_table.weighting == "bm25" and (not math.isclose(impact_table.k1, float(self.k1), rel_tol=1e-6) or not math.isclose(impact_table.b, float(self.b), rel_tol=1e-6)):
+                print("The impacts of the index were computed with k1 = {:g} and b = {:g}, it can only be searched with a budget using --bm25.k1 {:g} --bm25.b {:g}.".format(impact_table.k1, impact_table.b, impact_table.k1, impact_table.b))
+                return False
+
+        # and with the average document length of their generation, not the one of the whole index
+        if self.impact_tables[0].weighting == "bm25" and len(self.generations) > 1:
+            print("The BM25 impacts of each generation were computed with the generation's average document length, an index with several generations can not be searched with a budget (merge them with --indexer.final_merge).")
+            return False
 
         return True
 
+    def load_champions_data(self):
+        """
+        Auxiliar function to open the champion lists of each generation,
+        which are only used (and required) in tiered search
+
+        Returns
+        ----------
+        True
+            in case champions data was sucessfully loaded (or is not needed)
+        False
+            otherwise
+
+        """
+        if not self.tiered:
+            return True
+
+        for generation in self.generations:
+            if (not os.path.exists("{}/data/champions.bin".format(generation["folder"]))):
+                print("Could not load \"champions.bin\" file, the index must be built with --indexer.champions to be searched in tiers.")
+                return False
+
+        for generation in self.generations:
+            self.champion_tables.append(ChampionTable("{}/data/champions.bin".format(generation["folder"])))
+
+        # the champions were selected by the score contribution of the rsv the index was built with
+        if self.champion_tables[0].weighting != self.metadata["metadata"]["searcher_rsv"]:
+            print("The champion lists of the index were selected for the \"{}\" rsv, it can not be searched in tiers using the \"{}\" rsv.".format(self.champion_tables[0].weighting, self.metadata["metadata"]["searcher_rsv"]))
+            return False
+
+        # the thresholds only bound the BM25 contributions computed with the k1 and b of the index
+        for champion_table in self.champion_tables:
+            if champion_table.weighting == "bm25" and (not math.isclose(champion_table.k1, float(self.k1), rel_tol=1e-6) or not math.isclose(champion_table.b, float(self.b), rel_tol=1e-6)):
+                print("The champion lists of the index were selected with k1 = {:g} and b = {:g}, it can only be searched in tiers using --bm25.k1 {:g} --bm25.b {:g}.".format(champion_table.k1, champion_table.b, champion_table.k1, champion_table.b))
+                return False
+
+        # and with the average document length of their generation, not the one of the whole index
+        if self.champion_tables[0].weighting == "bm25" and len(self.generations) > 1:
+            print("The BM25 champion lists of each generation were selected with the generation's average document length, an index with several generations can not be searched in tiers (merge them with --indexer.final_merge).")
+            return False
+
+        # nor do they bound the window boost (of any value)
+        if self.B is not None and self.B != "None":
+            print("The champion lists do not bound the window boost, the index can not be searched in tiers with --windowboost.B.")
+            return False
+
+        return True
+
+    def fetch_champion_postings(self, index, term):
+        """
+        Auxiliar function to get the champion list of a term (its whole
+        postings list in the generations where it is not longer than the
+        champion lists)
+
+        Parameters
+        ----------
+        index
+            index object
+        term
+            term to be fetched
+
+        Returns
+        ----------
+        champions
+            (postings, threshold) tuple where postings is a dictionary with the
+            weight of the term in each champion document and threshold is the
+            highest contribution of the term to a document that is not a champion
+        """
+        fetch_start = perf_counter()
+
+        champions_dict = {}
+        threshold = 0.0
+        for generation_num, term_dictionary in enumerate(self.term_dictionaries):
+            ordinal = term_dictionary.find(term)
+            if ordinal < 0:
+                continue
+
+            champions = self.champion_tables[generation_num].get(ordinal)
+            if champions is None:
+                # short postings list, the whole list is read from its segment
+                _, _, file_num, offset = term_dictionary.get_entry(ordinal)
+                line = self.segments[generation_num].read_line(file_num, offset)
+                self.query_stats["bytes_read"] += len(line.encode("utf-8"))
+                index.load_postings_line(line, champions_dict, term, self.doc_window_size, self.generations[generation_num]["tombstones"])
+                continue
+
+            offset, generation_threshold = champions
+            threshold = max(threshold, generation_threshold)
+
+            self.query_stats["bytes_read"] += index.load_from_disk("{}/data/champions.txt".format(self.generations[generation_num]["folder"]), champions_dict, term, self.doc_window_size,
+                                                                   self.generations[generation_num]["tombstones"], offset)
+
+        postings = champions_dict.get(term, {})
+
+        self.query_stats["fetch"] += perf_counter() - fetch_start
+        self.query_stats["terms"][term] = len(postings)
+
+        return (postings, threshold)
+
+    def add_champions_bound(self, postings, term_bound):
+        """
+        Auxiliar function to register the highest contribution of a query
+        term to a document missing from its champion list
+
+        Parameters
+        ----------
+        postings
+            champion list of the term
+        term_bound
+            highest contribution of the term to a document missing from its champion list
+        """
+        self.champions_bound += term_bound
+
+        for doc_id in postings:
+            self.champions_seen[doc_id] = self.champions_seen.get(doc_id, 0.0) + term_bound
+
+    def get_champions_topk(self):
+        """
+        Auxiliar function to check if the champion lists of a query give its
+        top-k documents, that is, they fill the top-k and no other document
+        can outscore the k-th one (the score of a document is at most its
+        score over the champion lists plus the highest contribution of each
+        query term whose champion list does not hold it)
+
+        Returns
+        ----------
+        docnos
+            sorted list of the docnos of the top-k documents, None in case
+            the champion lists do not give them
+        """
+        if len(self.doc_scores) < self.topk:
+            return None
+
+        ranked = sorted(self.doc_scores.items(), key=operator.itemgetter(1), reverse=True)
+        kth_score = ranked[self.topk - 1][1]
+
+        # documents missing from every champion list
+        if self.champions_bound > kth_score:
+            return None
+
+        for doc_id, score in ranked[self.topk:]:
+            if score + self.champions_bound - self.champions_seen[doc_id] > kth_score:
+                return None
+
+        return sorted([int(doc_id) for doc_id, _ in ranked[:self.topk]])
+
+    def search_full_postings(self, index, tokenizer, query, docnos=None):
+        """
+        Auxiliar function to search a query over the full postings lists
+        after its champion lists were scored (tiered search)
+
+        Parameters
+        ----------
+        index
+            index object
+        tokenizer
+            tokenizer object
+        query
+            user query
+        docnos
+            sorted list of the docnos of the top-k documents given by the
+            champion lists (only these are scored), None in case every
+            document must be scored
+        """
+        if docnos is None:
+            self.query_stats["fallbacks"] += 1
+
+        self.doc_scores.clear()
+        self.doc_window_size.clear()
+
+        champion_tables = self.champion_tables
+        self.champion_tables = []
+        self.rescored_docnos = docnos
+        try:
+            self.query_search(index, tokenizer, query)
+        finally:
+            self.champion_tables = champion_tables
+            self.rescored_docnos = None
+
+    def score_at_a_time(self, terms_weights, candidates):
+        """
+        Auxiliar function to score the impact ordered postings of the query
+        terms (score-at-a-time), the impact segments of every term are scored
+        by decreasing contribution (query term weight times impact) until the
+        postings budget or the time budget runs out, so the documents with the
+        highest contributions are always scored first
+
+        Parameters
+        ----------
+        terms_weights
+            dictionary with the query side weight of each query term
+        candidates
+            sorted list of the only docnos that can be scored, None in case
+            every document can be scored
+        """
+        # the time budget also covers listing the impact segments
+        fetch_start = budget_start = perf_counter()
+
+        # impact segments of every term in every generation
+        segments = []
+        for term, weight in terms_weights.items():
+            postings_num = 0
+            for generation_num, term_dictionary in enumerate(self.term_dictionaries):
+                ordinal = term_dictionary.find(term)
+                if ordinal < 0:
+                    continue
+
+                for impact, segment_postings, position in self.impact_tables[generation_num].get(ordinal):
+                    segments.append((weight * impact, segment_postings, generation_num, position))
+                    postings_num += segment_postings
+
+            self.query_stats["terms"][term] = postings_num
+
+        segments.sort(key=lambda segment: segment[0], reverse=True)
+        self.query_stats["fetch"] += perf_counter() - fetch_start
+
+        scoring_start = perf_counter()
+        candidates = set(candidates) if candidates is not None else None
+        postings_scored = 0
+
+        for contribution, segment_postings, generation_num, position in segments:
+            # anytime ranking, stop once any budget runs out
+            if self.time_budget is not None and perf_counter() - budget_start >= self.time_budget:
+                break
+            if self.postings_budget is not None:
+                if postings_scored >= self.postings_budget:
+                    break
+                segment_postings = min(segment_postings, self.postings_budget - postings_scored)
+
+            tombstones = self.generations[generation_num]["tombstones"]
+            for posting_num, docno in enumerate(self.impact_tables[generation_num].read_docnos(position, segment_postings)):
+                # the time budget is also checked inside the long segments
+                if self.time_budget is not None and posting_num % self.TIME_CHECK_POSTINGS == 0 and posting_num > 0 and perf_counter() - budget_start >= self.time_budget:
+                    segment_postings = posting_num
+                    break
+
+                if (tombstones is not None and docno in tombstones) or (candidates is not None and docno not in candidates):
+                    continue
+
+                doc_id = str(docno)
+                if doc_id not in self.doc_scores.keys():
+                    self.doc_scores[doc_id] = contribution
+                else:
+                    self.doc_scores[doc_id] += contribution
+
+            postings_scored += segment_postings
+
+        self.query_stats["postings_scored"] += postings_scored
+        self.query_stats["scoring"] += perf_counter() - scoring_start
+
+    def get_document_table(self, doc_id):
+        """
+        Auxiliar function to get the documents table of the generation
+        that holds a document
+
+        Parameters
+        ----------
+        doc_id
+            docno of the document
+
+        Returns
+        ----------
+        table
+            documents table holding the document
+        """
+        return self.generations[bisect_right(self.first_docnos, doc_id) - 1]["table"]
+
+    def get_pmid(self, doc_id):
+        """
+        Auxiliar function to get the pmid of a document
+
+        Parameters
+        ----------
+        doc_id
+            docno of the document (as found in the postings)
+
+        Returns
+        ----------
+        pmid
+            pmid of the document
+        """
+        doc_id = int(doc_id)
+        return self.get_document_table(doc_id).get_pmid(doc_id)
+
+    def document_length(self, doc_id):
+        """
+        Auxiliar function to get the normalized length of a document
+
+        Parameters
+        ----------
+        doc_id
+            docno of the document (as found in the postings)
+
+        Returns
+        ----------
+        dl_avdl
+            document length divided by the average document length
+        """
+        doc_id = int(doc_id)
+        return self.get_document_table(doc_id).get_length(doc_id) / self.avdl
+
+    def document_norm(self, doc_id, normalization):
+        """
+        Auxiliar function to get a normalization factor of a document
+
+        Parameters
+        ----------
+        doc_id
+            docno of the document (as found in the postings)
+        normalization
+            SMART normalization letter, "c" (cosine) or "u" (unique terms)
+
+        Returns
+        ----------
+        norm
+            normalization factor of the document
+        """
+        doc_id = int(doc_id)
+        return self.get_document_table(doc_id).get_norm(doc_id, normalization)
+
     def calculate_window_boost(self, min_window_size):
         """
         Auxiliar function to calculate window boost for the retrieved documents
@@ -227,11 +1147,16 @@ class TFIDFSearcher(Searcher):
     def __init__(self,
                 index_folder:str,
                 metadata,
+                smart_notation=None,
                 **kwargs):
         super().__init__(index_folder, metadata, **kwargs)
 
+        # raw indexes hold term frequencies, the document weights are computed at query time
+        self.raw_postings = self.metadata["metadata"]["rsv"] != "tfidf"
+        self.smart_notation = smart_notation or self.metadata["metadata"]["smart_notation"] or "lnc.ltc"
+
         print("init TFIDFSearcher|", f"{index_folder=}")
-        print("SMART notation: %s" % (self.metadata["metadata"]["smart_notation"]))
+        print("SMART notation: %s" % (self.smart_notation))
         if kwargs:
             print(f"{self.__class__.__name__} also caught the following additional arguments {kwargs}")
             self.B = kwargs['B']
@@ -259,11 +1184,11 @@ class TFIDFSearcher(Searcher):
         #   t -> idf -> log (number_of_documents / document_frequency) ; document_frequency is the number of documents that contain the term 
         #   c -> cosine normalization -> 1 / sqrt(w1^2 + w2^2 + ...)
 
-        # postings list dictionary size threshold
-        dict_threshold = 20  # 20 MBytes
-
-        # tokenize query
-        token_stream = tokenizer.tokenize(query)
+        # tokenize query (phrase and proximity operators are handled apart)
+        phase_start = perf_counter()
+        text, operators = self.parse_query(query)
+        token_stream = tokenizer.tokenize(text)
+        self.query_stats["tokenize"] += perf_counter() - phase_start
 
         # NOTE: Minimum window size will be equal to tokenized query elements which have an idf
         # higher than 2.0; it is to note that the stop words filter already removes
@@ -279,53 +1204,98 @@ class TFIDFSearcher(Searcher):
         # normalize weight
         query_terms_dict = {k: round(v / query_length, 2) for k, v in query_terms_dict.items()}
 
-        # get index files to an array
-        index_files = [file for file in os.listdir(self.index_folder) if os.path.isfile("{}/{}".format(self.index_folder, file))]
+        # documents that satisfy the positional operators and the match mode (only these are scored)
+        phase_start = perf_counter()
+        candidates = self.match_operators(tokenizer, operators)
+        if candidates != []:
+            candidates = self.match_terms(list(query_terms_dict), candidates)
+        if self.rescored_docnos is not None:
+            candidates = self.rescored_docnos
+        self.query_stats["fetch"] += perf_counter() - phase_start
+
+        # query side weight of each term (score-at-a-time)
+        terms_weights = {}
+
+        # tiered search, the champion lists are scored first
+        use_champions = len(self.champion_tables) > 0 and candidates is None and len(self.impact_tables) == 0
+        self.champions_bound = 0.0
+        self.champions_seen.clear()
+
+        # the postings lists of every query term are read from disk before scoring
+        if candidates is None and not use_champions and len(self.impact_tables) == 0:
+            self.prefetch_postings(list(query_terms_dict))
 
         # itereate through query
         for term, weight in query_terms_dict.items():
+            phase_start = perf_counter()
+            term_data = self.lookup_term(term)
+            self.query_stats["lookup"] += perf_counter() - phase_start
+
             # calculate score in case term is present in documents
-            if (term in self.terms_data.keys()):
+            if (term_data is not None):
                 # count words that have a good idf value
-                if (self.terms_data[term][0] > 2.0):
+                if (term_data[0] > 2.0):
                     min_window_size += 1
 
-                # fetch term postings list from disk in case term is not yet in our indexes dictionary
-                if (term not in self.indexes_dict.keys()):
-
-                    self.oldest_keys.append(term)
-
-                    # memory managemet
-                    if (sys.getsizeof(self.indexes_dict) / 1048576 > dict_threshold):
-                        # remove oldest least used key from dictionary
-                        self.indexes_dict.pop(self.oldest_keys[0])
-                        # remove oldest least used key from list
-                        self.oldest_keys.pop(0)
-                        #self.indexes_dict.clear()
-
-                    # NOTE: metadata[term][1] -> index of the file where the term is saved
-                    index.load_from_disk("{}/{}".format(self.index_folder, index_files[self.terms_data[term][1]]), self.indexes_dict, term, self.doc_window_size)
-                # update term in oldest used key list
+                # score-at-a-time, the impact ordered postings are scored once every term is looked up
+                if self.impact_tables:
+                    terms_weights[term] = weight * term_data[0] if self.smart_notation == "lnc.ltc" or self.smart_notation == "lnu.ltc" else weight
+                    continue
+
+                threshold = 0.0
+                if use_champions:
+                    postings, threshold = self.fetch_champion_postings(index, term)
+                elif candidates is None:
+                    self.fetch_postings(index, term, term_data)
+                    postings = self.indexes_dict[term]
                 else:
-                    self.oldest_keys.remove(term)
-                    self.oldest_keys.append(term)
+                    postings = self.fetch_candidate_postings(term, candidates)
+
+                phase_start = perf_counter()
 
                 # multiply query term's weight by idf in case it's "lnc.ltc" or lnu.ltc (it would be x1 in case of "lnc.lnc")
-                if self.metadata["metadata"]["smart_notation"] == "lnc.ltc" or self.metadata["metadata"]["smart_notation"] == "lnu.ltc":
-                    weight *= self.terms_data[term][0]
+                if self.smart_notation == "lnc.ltc" or self.smart_notation == "lnu.ltc":
+                    weight *= term_data[0]
+
+                # highest contribution of the term to a document missing from its champion list
+                if use_champions:
+                    self.add_champions_bound(postings, round(weight * threshold, 2))
 
                 # add score to dictionary
-                for doc_id in self.indexes_dict[term]:
+                for doc_id in postings:
+                    doc_weight = postings[doc_id]
+
+                    # raw term frequency, "l" weight normalized by the document's cosine ("c") or unique terms ("u") factor
+                    if self.raw_postings:
+                        doc_weight = round((1 + math.log(doc_weight, 10)) / self.document_norm(doc_id, self.smart_notation[2]), 2)
+
                     if doc_id not in self.doc_scores.keys():
-                        self.doc_scores[doc_id] = round(self.indexes_dict[term][doc_id] * weight, 2)
+                        self.doc_scores[doc_id] = round(doc_weight * weight, 2)
                     else:
-                        self.doc_scores[doc_id] += round(self.indexes_dict[term][doc_id] * weight, 2)
+                        self.doc_scores[doc_id] += round(doc_weight * weight, 2)
+
+                self.query_stats["scoring"] += perf_counter() - phase_start
+            else:
+                self.query_stats["terms"][term] = 0
+
+        if self.impact_tables:
+            self.score_at_a_time(terms_weights, candidates)
+
+        # the champion lists give the top-k documents in case no other document can outscore the k-th one, these are
+        # then scored over the full postings lists (otherwise every document is scored over the full postings lists)
+        if use_champions:
+            self.search_full_postings(index, tokenizer, query, self.get_champions_topk())
+            return
 
         # add window boost factor
+        phase_start = perf_counter()
         self.calculate_window_boost(min_window_size)
+        self.query_stats["window_boost"] += perf_counter() - phase_start
 
         # reverse sort scores dictionary by value
+        phase_start = perf_counter()
         self.doc_scores = dict(sorted(self.doc_scores.items(), key=operator.itemgetter(1),reverse=True))
+        self.query_stats["topk"] += perf_counter() - phase_start
 
 
 class BM25Searcher(Searcher):
@@ -343,9 +1313,8 @@ class BM25Searcher(Searcher):
                 **kwargs):
         super().__init__(index_folder, metadata, **kwargs)
 
-        self.docs_data = {}
-        self.k1 = 0.0
-        self.b = 0.0
+        self.k1 = k1
+        self.b = b
 
         print("init BM25Searcher|", f"{index_folder=}")
         print("k1: %s, b: %s" % (k1, b))
@@ -369,11 +1338,11 @@ class BM25Searcher(Searcher):
             user query
 
         """
-        # postings list dictionary size threshold
-        dict_threshold = 20  # 20 MBytes
-
-        # tokenize query
-        token_stream = tokenizer.tokenize(query)
+        # tokenize query (phrase and proximity operators are handled apart)
+        phase_start = perf_counter()
+        text, operators = self.parse_query(query)
+        token_stream = tokenizer.tokenize(text)
+        self.query_stats["tokenize"] += perf_counter() - phase_start
 
         # NOTE: Minimum window size will be equal to tokenized query elements which have an idf
         # higher than 2.0; it is to note that the stop words filter already removes
@@ -383,54 +1352,255 @@ class BM25Searcher(Searcher):
         # get dictionary of weighted terms
         query_terms_dict = {term:token_stream.count(term) for term in token_stream}
 
-        # get index files to an array
-        index_files = [file for file in os.listdir(self.index_folder) if os.path.isfile("{}/{}".format(self.index_folder, file))]
+        # documents that satisfy the positional operators and the match mode (only these are scored)
+        phase_start = perf_counter()
+        candidates = self.match_operators(tokenizer, operators)
+        if candidates != []:
+            candidates = self.match_terms(list(query_terms_dict), candidates)
+        if self.rescored_docnos is not None:
+            candidates = self.rescored_docnos
+        self.query_stats["fetch"] += perf_counter() - phase_start
+
+        # query side weight of each term (score-at-a-time)
+        terms_weights = {}
+
+        # tiered search, the champion lists are scored first
+        use_champions = len(self.champion_tables) > 0 and candidates is None and len(self.impact_tables) == 0
+        self.champions_bound = 0.0
+        self.champions_seen.clear()
+
+        # the postings lists of every query term are read from disk before scoring
+        if candidates is None and not use_champions and len(self.impact_tables) == 0:
+            self.prefetch_postings(list(query_terms_dict))
 
         # itereate through query
         for term, weight in query_terms_dict.items():
+            phase_start = perf_counter()
+            term_data = self.lookup_term(term)
+            self.query_stats["lookup"] += perf_counter() - phase_start
+
             # calculate score in case term is present in documents
-            if (term in self.terms_data.keys()):
+            if (term_data is not None):
                 # count words that have a good idf value
-                if (self.terms_data[term][0] > 2.0):
+                if (term_data[0] > 2.0):
                     min_window_size += 1
-                # fetch term postings list from disk in case term is not yet in our indexes dictionary
-                if (term not in self.indexes_dict.keys()):
-
-                    self.oldest_keys.append(term)
-
-                    # memory managemet
-                    if (sys.getsizeof(self.indexes_dict) / 1048576 > dict_threshold):
-                        # remove oldest least used key from dictionary
-                        self.indexes_dict.pop(self.oldest_keys[0])
-                        # remove oldest least used key from list
-                        self.oldest_keys.pop(0)
-                        #self.indexes_dict.clear()
-
-                    # NOTE: metadata[term][1] -> index of the file where the term is saved
-                    index.load_from_disk("{}/{}".format(self.index_folder, index_files[self.terms_data[term][1]]), self.indexes_dict, term, self.doc_window_size)
-                # update term in oldest used key list
+
+                # score-at-a-time, the impact ordered postings are scored once every term is looked up
+                if self.impact_tables:
+                    terms_weights[term] = term_data[0]
+                    continue
+
+                threshold = 0.0
+                if use_champions:
+                    postings, threshold = self.fetch_champion_postings(index, term)
+                elif candidates is None:
+                    self.fetch_postings(index, term, term_data)
+                    postings = self.indexes_dict[term]
                 else:
-                    self.oldest_keys.remove(term)
-                    self.oldest_keys.append(term)
+                    postings = self.fetch_candidate_postings(term, candidates)
 
-                idf = self.terms_data[term][0]
+                phase_start = perf_counter()
+
+                idf = term_data[0]
+
+                # highest contribution of the term to a document missing from its champion list
+                if use_champions:
+                    self.add_champions_bound(postings, idf * threshold)
 
                 # add score to dictionary
-                for doc_id in self.indexes_dict[term]:
-                    term_freq = self.indexes_dict[term][doc_id]
+                for doc_id in postings:
+                    term_freq = postings[doc_id]
 
-                    # get (dl / avdl) value from docs data file
+                    # get (dl / avdl) value from the documents table
                     # dl -> document length (how many terms the document have)
                     # avdl -> average document length
-                    dl_avdl = self.docs_data[doc_id]
+                    dl_avdl = self.document_length(doc_id)
 
                     if doc_id not in self.doc_scores.keys():
                         self.doc_scores[doc_id] = idf * ((self.k1 + 1) * term_freq) / (self.k1 * ((1 - self.b) + self.b * dl_avdl) + term_freq)
                     else:
                         self.doc_scores[doc_id] += idf * ((self.k1 + 1) * term_freq) / (self.k1 * ((1 - self.b) + self.b * dl_avdl) + term_freq)
 
+                self.query_stats["scoring"] += perf_counter() - phase_start
+            else:
+                self.query_stats["terms"][term] = 0
+
+        if self.impact_tables:
+            self.score_at_a_time(terms_weights, candidates)
+
+        # the champion lists give the top-k documents in case no other document can outscore the k-th one, these are
+        # then scored over the full postings lists (otherwise every document is scored over the full postings lists)
+        if use_champions:
+            self.search_full_postings(index, tokenizer, query, self.get_champions_topk())
+            return
+
         # add window boost factor
+        phase_start = perf_counter()
         self.calculate_window_boost(min_window_size)
+        self.query_stats["window_boost"] += perf_counter() - phase_start
 
         # reverse sort scores dictionary by value
-        self.doc_scores = dict(sorted(self.doc_scores.items(), key=operator.itemgetter(1),reverse=True))
\ No newline at end of file
+        phase_start = perf_counter()
+        self.doc_scores = dict(sorted(self.doc_scores.items(), key=operator.itemgetter(1),reverse=True))
+        self.query_stats["topk"] += perf_counter() - phase_start
+
+
+class MultiIndexSearcher(Searcher):
+    """
+    MultiIndexSearcher queries several independent indexes
+    (shards, for instance one per year of the collection)
+    in a single process and merges their top-k documents
+
+    Every shard is scored with the statistics of the whole
+    collection (number of documents, document frequency of
+    the terms and average document length), so the scores of
+    the shards are comparable. The retrieved documents are
+    identified by (shard, docno) tuples.
+
+    """
+    def __init__(self,
+                searchers,
+                topk,
+                **kwargs):
+        self.searchers = searchers          # searcher of each shard
+
+        super().__init__(None, searchers[0].metadata, **kwargs)
+
+        self.topk = topk
+
+        print("init MultiIndexSearcher|", "shards={}".format([searcher.metadata["metadata"]["index_output_folder"] for searcher in searchers]))
+
+    def reset_query_stats(self):
+        """
+        Auxiliar function to reset the statistics of the current query
+        of the searcher and of each shard
+        """
+        super().reset_query_stats()
+
+        for searcher in self.searchers:
+            searcher.reset_query_stats()
+
+    def memory_structures(self):
+        """
+        Auxiliar function to get the in-memory structures of the searcher
+        of each shard (prefixed by the shard number)
+        """
+        return {"shard{}.{}".format(shard, name): structure for shard, searcher in enumerate(self.searchers) for name, structure in searcher.memory_structures().items()}
+
+    def load_collection_statistics(self):
+        """
+        Auxiliar function to compute the statistics of the whole collection
+        from the ones of the shards (which must have their terms and documents
+        data loaded) and make every shard score with them
+
+        Returns
+        ----------
+        True
+            in case the shards can be scored with the collection statistics
+        False
+            otherwise
+
+        """
+        # the BM25 impacts and champion bounds hold the length normalization of the average document length of their shard
+        if self.metadata["metadata"]["searcher_rsv"] == "bm25" and any([len(searcher.impact_tables) > 0 or len(searcher.champion_tables) > 0 for searcher in self.searchers]):
+            print("The impacts and champion lists of BM25 indexes are computed with the average document length of their index, several indexes can not be searched together with a budget or in tiers.")
+            return False
+
+        # indexes without generations only have their documents table
+        generations = [generation for searcher in self.searchers for generation in searcher.generations]
+        self.documents = sum([generation["documents"] if generation["documents"] is not None else len(generation["table"]) for generation in generations])
+        self.avdl = sum([generation["total_length"] if generation["total_length"] is not None else generation["table"].avdl * len(generation["table"]) for generation in generations]) / self.documents
+
+        for searcher in self.searchers:
+            searcher.avdl = self.avdl
+            searcher.collection_statistics = self
+
+        return True
+
+    def get_idf(self, term):
+        """
+        Auxiliar function to get the idf of a term in the whole collection,
+        from its document frequency in every generation of every shard
+        """
+        df = 0
+        for searcher in self.searchers:
+            for term_dictionary in searcher.term_dictionaries:
+                entry = term_dictionary.get(term)
+                if entry is not None:
+                    df += entry[1]
+
+        return round(math.log(self.documents / df, 10), 2)
+
+    def load_terms_data(self):
+        return all([searcher.load_terms_data() for searcher in self.searchers])
+
+    def load_docs_data(self):
+        return all([searcher.load_docs_data() for searcher in self.searchers])
+
+    def load_impacts_data(self):
+        return all([searcher.load_impacts_data() for searcher in self.searchers])
+
+    def load_champions_data(self):
+        return all([searcher.load_champions_data() for searcher in self.searchers])
+
+    def close(self):
+        """
+        Auxiliar function to close the files opened by the searcher of each shard
+        """
+        for searcher in self.searchers:
+            searcher.close()
+
+    def get_pmid(self, doc_id):
+        """
+        Auxiliar function to get the pmid of a document
+
+        Parameters
+        ----------
+        doc_id
+            (shard, docno) tuple of the document
+
+        Returns
+        ----------
+        pmid
+            pmid of the document
+        """
+        return self.searchers[doc_id[0]].get_pmid(doc_id[1])
+
+    def query_search(self, index, tokenizer, query):
+        """
+        Function to search a query inputed by the user in every
+        shard and merge their top-k scores
+        
+        Parameters
+        ----------
+        index
+            index object
+        tokenizer
+            tokenizer object
+        query
+            user query
+
+        """
+        shard_scores = []
+
+        for shard, searcher in enumerate(self.searchers):
+            searcher.doc_scores.clear()
+            searcher.doc_window_size.clear()
+
+            searcher.query_search(index, tokenizer, query)
+
+            # the shard scores are already sorted
+            shard_scores += [((shard, doc_id), score) for doc_id, score in list(searcher.doc_scores.items())[0:self.topk]]
+
+            # add the shard statistics to the query statistics
+            for key, value in searcher.query_stats.items():
+                if key == "terms":
+                    for term, postings in value.items():
+                        self.query_stats["terms"][term] = self.query_stats["terms"].get(term, 0) + postings
+                else:
+                    self.query_stats[key] += value
+
+        # merge the top-k of every shard
+        phase_start = perf_counter()
+        self.doc_scores = dict(sorted(shard_scores, key=operator.itemgetter(1), reverse=True))
+        self.query_stats["topk"] += perf_counter() - phase_start
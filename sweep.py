@@ -0,0 +1,321 @@
+"""
+    sweep.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Parameter sweep module
+
+    Searches the questions with gold standard over an index
+    with every combination of a grid of ranking parameters
+    (BM25 k1 and b or the TFIDF SMART notation, window boost
+    B and top k), loading the index and questions once and
+    reusing the fetched postings lists between combinations,
+    and writes the evaluation metrics and query latency of
+    each combination to a csv file.
+
+    Example:
+        python sweep.py questions/questions_with_gs.zip pubmedSPIMIindex --k1 0.9,1.2,1.5 --b 0.5,0.75 --B None,2 --topk 10,50,100
+        python sweep.py questions/questions_with_gs.zip pubmedSPIMIindex --rsv tfidf --notation lnc.ltc,lnc.lnc --output sweep-tfidf.csv
+
+"""
+
+import argparse
+import csv
+import itertools
+import math
+import os
+from time import time
+
+from searcher import load_index_metadata, TFIDFSearcher, BM25Searcher
+from tokenizers import PubMedTokenizer
+from reader import QuestionsReader
+from index import BaseIndex
+from utils import percentile
+
+CSV_FIELDS = ["rsv", "k1", "b", "smart_notation", "B", "topk", "queries", "precision", "recall", "f_measure", "average_precision", "ndcg",
+              "mean_query_time_ms", "p95_query_time_ms"]
+
+
+def parse_grid(value, cast):
+    """
+    Parses a comma separated grid of parameter values
+
+    Parameters
+    ----------
+    value
+        comma separated values
+    cast
+        function converting each value to its type
+
+    Returns
+    ----------
+    values
+        list of the grid values
+    """
+    return [cast(item.strip()) for item in value.split(",") if item.strip() != ""]
+
+
+def parse_boost(value):
+    if value != "None" and not value.isnumeric():
+        raise argparse.ArgumentTypeError("window boost values must be integers or None, got \"{}\"".format(value))
+    return value
+
+
+def evaluate_ranking(ranking, relevant, topk):
+    """
+    Computes the evaluation metrics of the top k documents of a query
+    (the same metrics of the searcher, plus the binary relevance nDCG)
+
+    Parameters
+    ----------
+    ranking
+        pmids of the retrieved documents, by decreasing score
+    relevant
+        set with the pmids of the relevant documents
+    topk
+        number of retrieved documents evaluated
+
+    Returns
+    ----------
+    metrics
+        (precision, recall, f-measure, average precision, ndcg) tuple
+    """
+    retrieved = ranking[:topk]
+
+    tp = 0
+    average_precision_array = []
+    dcg = 0.0
+    for rank, pmid in enumerate(retrieved):
+        if pmid in relevant:
+            tp += 1
+            average_precision_array.append(tp / (rank + 1))
+            dcg += 1 / math.log2(rank + 2)
+
+    precision = tp / len(retrieved)
+    recall = tp / (tp + len([pmid for pmid in relevant if pmid not in retrieved])) if len(relevant) > 0 else 0.0
+    f_measure = 2 * precision * recall / (precision + recall) if (precision + recall) > 0.0 else 0.0
+    average_precision = sum(average_precision_array) / len(average_precision_array) if len(average_precision_array) > 0 else 0.0
+
+    ideal_dcg = sum([1 / math.log2(rank + 2) for rank in range(min(len(relevant), topk))])
+    ndcg = dcg / ideal_dcg if ideal_dcg > 0.0 else 0.0
+
+    return (precision, recall, f_measure, average_precision, ndcg)
+
+
+def run_questions(searcher, index, tokenizer, questions, max_topk):
+    """
+    Searches every question with the current parameters of the searcher
+
+    Parameters
+    ----------
+    searcher
+        searcher object (its fetched postings lists are kept between calls)
+    index
+        index object
+    tokenizer
+        tokenizer object
+    questions
+        list of (question, set of relevant pmids) tuples
+    max_topk
+        number of documents kept of each ranking
+
+    Returns
+    ----------
+    rankings
+        list of (ranking, relevant pmids, query time) tuples of the questions
+        with matching documents
+    """
+    rankings = []
+
+    for query, relevant in questions:
+        query_start = time()
+
+        searcher.doc_scores.clear()
+        searcher.doc_window_size.clear()
+        searcher.reset_query_stats()
+
+        searcher.query_search(index, tokenizer, query)
+
+        if len(searcher.doc_scores) == 0:
+            continue
+
+        ranking = [int(searcher.get_pmid(doc_id)) for doc_id in list(searcher.doc_scores)[0:max_topk]]
+        rankings.append((ranking, relevant, time() - query_start))
+
+    return rankings
+
+
+def sweep(questions_path, index_folder, rsv, k1_grid, b_grid, notation_grid, boost_grid, topk_grid, output_path):
+    """
+    Searches the questions with every combination of the parameter grids
+    and writes the mean metrics of each combination to a csv file
+
+    Parameters
+    ----------
+    questions_path
+        questions zip file path
+    index_folder
+        index root folder (or its merged folder)
+    rsv
+        "bm25" or "tfidf"
+    k1_grid
+        BM25 k1 values
+    b_grid
+        BM25 b values
+    notation_grid
+        TFIDF SMART notations
+    boost_grid
+        window boost B values ("None" or integers)
+    topk_grid
+        numbers of retrieved documents evaluated
+    output_path
+        csv file path
+
+    Returns
+    ----------
+    rows
+        list with the csv row (dictionary) of each combination
+    """
+    index_metadata = load_index_metadata(index_folder)
+    if index_metadata is None:
+        return None
+
+    index_folder, metadata = index_metadata
+
+    if rsv == "bm25" and metadata["metadata"]["rsv"] == "tfidf":
+        print("Index \"{}\" was built with the \"tfidf\" rsv, use a \"raw\" or \"bm25\" index to sweep the BM25 parameters.".format(metadata["metadata"]["index_output_folder"]))
+        return None
+
+    if rsv == "tfidf" and metadata["metadata"]["rsv"] == "tfidf":
+        # tfidf postings hold weights normalized with the document part of the notation of the index
+        supported_grid = [notation for notation in notation_grid if notation[:3] == metadata["metadata"]["smart_notation"][:3]]
+        if len(supported_grid) < len(notation_grid):
+            print("Skipping the notations not supported by the \"{}\" notation of the index: {}".format(metadata["metadata"]["smart_notation"],
+                                                                                                       ", ".join([notation for notation in notation_grid if notation not in supported_grid])))
+        notation_grid = supported_grid
+        if len(notation_grid) == 0:
+            print("Index \"{}\" was built with the \"{}\" notation, use a \"raw\" index to sweep other weightings.".format(metadata["metadata"]["index_output_folder"], metadata["metadata"]["smart_notation"]))
+            return None
+
+    metadata["metadata"]["searcher_rsv"] = rsv
+    metadata["metadata"]["searcher_smart_notation"] = notation_grid[0] if rsv == "tfidf" else None
+
+    max_topk = max(topk_grid)
+
+    # the index and the questions are loaded once
+    if rsv == "bm25":
+        searcher = BM25Searcher(index_folder, metadata, k1_grid[0], b_grid[0], B=boost_grid[0], topk=max_topk)
+        settings = [{"k1": k1, "b": b, "smart_notation": None, "B": boost} for k1, b, boost in itertools.product(k1_grid, b_grid, boost_grid)]
+    else:
+        searcher = TFIDFSearcher(index_folder, metadata, smart_notation=notation_grid[0], B=boost_grid[0], topk=max_topk)
+        settings = [{"k1": None, "b": None, "smart_notation": notation, "B": boost} for notation, boost in itertools.product(notation_grid, boost_grid)]
+
+    if not searcher.load_terms_data() or not searcher.load_docs_data():
+        return None
+
+    tokenizer = PubMedTokenizer(metadata["metadata"]["tokenizer"]["minL"], metadata["metadata"]["tokenizer"]["stopwords_path"], metadata["metadata"]["tokenizer"]["stemmer"])
+    questions = list(QuestionsReader(questions_path).read_questions())
+    index = BaseIndex()
+
+    # the postings lists are fetched from disk once, the query times of every setting are measured with the same (warm) cache
+    warmup_start = time()
+    run_questions(searcher, index, tokenizer, questions, max_topk)
+    print("Warm up: {} questions searched in {:.3f} seconds".format(len(questions), time() - warmup_start))
+
+    rows = []
+    for setting in settings:
+        if rsv == "bm25":
+            searcher.k1, searcher.b = setting["k1"], setting["b"]
+        else:
+            searcher.smart_notation = setting["smart_notation"]
+        searcher.B = setting["B"]
+
+        # the rankings of the largest top k are evaluated at every top k
+        rankings = run_questions(searcher, index, tokenizer, questions, max_topk)
+        query_times = [query_time * 1000 for _, _, query_time in rankings]
+
+        for topk in topk_grid:
+            metrics = [evaluate_ranking(ranking, relevant, topk) for ranking, relevant, _ in rankings]
+
+            row = {"rsv": rsv, **setting, "topk": topk, "queries": len(rankings)}
+            for position, name in enumerate(("precision", "recall", "f_measure", "average_precision", "ndcg")):
+                row[name] = round(sum([metric[position] for metric in metrics]) / len(metrics), 4) if len(metrics) > 0 else None
+            row["mean_query_time_ms"] = round(sum(query_times) / len(query_times), 3) if len(query_times) > 0 else None
+            row["p95_query_time_ms"] = round(percentile(query_times, 95), 3) if len(query_times) > 0 else None
+            rows.append(row)
+
+            print("{}: P={} R={} F={} AP={} nDCG={} ({} ms)".format(", ".join(["{}={}".format(key, value) for key, value in list(row.items())[:6] if value is not None]),
+                                                                   row["precision"], row["recall"], row["f_measure"], row["average_precision"], row["ndcg"], row["mean_query_time_ms"]))
+
+    searcher.close()
+
+    output_folder = os.path.dirname(output_path)
+    if output_folder != "":
+        os.makedirs(output_folder, exist_ok=True)
+
+    with open(output_path, "w", newline="", encoding="utf-8") as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Searches the questions with gold standard with every combination of a grid of ranking parameters, loading the index once")
+
+    parser.add_argument("path_to_questions", type=str,
+                        help="Questions zip with gold standard.")
+    parser.add_argument("index_folder", type=str,
+                        help="Index root folder.")
+    parser.add_argument("--rsv", type=str, default="bm25", choices=["bm25", "tfidf"],
+                        help="Retrieval status value whose parameters are swept (default=bm25).")
+    parser.add_argument("--k1", type=lambda value: parse_grid(value, float), default="1.2",
+                        help="Comma separated BM25 k1 values (default=1.2).")
+    parser.add_argument("--b", type=lambda value: parse_grid(value, float), default="0.75",
+                        help="Comma separated BM25 b values (default=0.75).")
+    parser.add_argument("--notation", type=lambda value: parse_grid(value, str), default="lnc.ltc",
+                        help="Comma separated TFIDF SMART notations, \"lnc.ltc\", \"lnc.lnc\" or \"lnu.ltc\" (default=lnc.ltc).")
+    parser.add_argument("--B", type=lambda value: parse_grid(value, parse_boost), default="None",
+                        help="Comma separated window boost values, integers or None (default=None).")
+    parser.add_argument("--topk", type=lambda value: parse_grid(value, int), default="10",
+                        help="Comma separated numbers of retrieved documents evaluated (default=10).")
+    parser.add_argument("--output", type=str, default="sweep.csv",
+                        help="Csv file where the metrics of each combination are written (default=sweep.csv).")
+
+    args = parser.parse_args()
+
+    for notation in args.notation:
+        if notation not in ("lnc.ltc", "lnc.lnc", "lnu.ltc"):
+            parser.error("Weighting notation \"{}\" not supported.".format(notation))
+
+    sweep_start = time()
+    rows = sweep(args.path_to_questions, args.index_folder, args.rsv, args.k1, args.b, args.notation, args.B, args.topk, args.output)
+
+    if rows is not None:
+        print("\n:: Sweep ::")
+        print("> Combinations: {}".format(len(rows)))
+        print("> Sweep time: {:.3f} seconds".format(time() - sweep_start))
+        print("> Results written to \"{}\"".format(args.output))
+
+        best = max(rows, key=lambda row: row["average_precision"] if row["average_precision"] is not None else -1.0)
+        print("> Best average precision: {} ({})".format(best["average_precision"], ", ".join(["{}={}".format(key, best[key]) for key in ("k1", "b", "smart_notation", "B", "topk")
+                                                                                             if best[key] is not None])))
@@ -0,0 +1,187 @@
+"""
+    token_cache.py
+
+    ====================================
+
+    University of Aveiro
+    Department of Electronics, Telecommunications and Informatics
+
+    Information Retrieval (42596)
+    Master's in Computer Engineering
+
+    João Pedro dos Reis - 115513
+    Luís Miguel Gomes Batista - 115279
+
+    ====================================
+
+    Information Retrieval Indexer System
+
+
+
+    Authors:
+
+    Tokenized collection cache module
+
+    Holds the code/logic addressing the cache of the
+    tokenized documents of a collection, so that indexes
+    built with the same tokenizer settings do not need to
+    read and tokenize the collection again.
+
+"""
+
+import os                           # manage folders
+import json                         # cache key in json format
+import struct                       # pack fixed width values
+import sys                          # check the system byte order
+import hashlib                      # hash the cache key and the stopwords file
+from array import array             # compact term ids sequences
+
+
+class TokenStreamCache:
+    """
+    Cache of the tokenized documents of a collection
+
+    The cache file holds, for each document, its pmid and the
+    sequence of the ids of its tokens, followed by the term
+    table (the term of each id). The file name is the hash of
+    the cache key, that identifies the collection file (path,
+    size and modification time) and the tokenizer settings
+    (minL, hash of the stopwords file and stemmer).
+
+    File layout:
+        header          magic, version, number of documents, offset of the term table
+        documents       (pmid uint64, number of tokens uint32, term ids uint32[tokens])[documents]
+        term table      number of terms uint32, (length uint32, utf-8 term)[terms]
+
+    """
+    MAGIC = b"TOKC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIQQ")
+    DOCUMENT = struct.Struct("<QI")
+
+    def __init__(self, cache_folder, path_to_collection, tokenizer):
+        self.key = self.get_key(path_to_collection, tokenizer)
+        self.path = "{}/{}.bin".format(cache_folder, hashlib.sha1(json.dumps(self.key, sort_keys=True).encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def get_key(path_to_collection, tokenizer):
+        """
+        Builds the cache key of a collection tokenized by a tokenizer
+
+        Parameters
+        ----------
+        path_to_collection
+            collection file path
+        tokenizer
+            tokenizer object
+
+        Returns
+        ----------
+        key
+            dictionary with the collection and tokenizer settings
+        """
+        stopwords_hash = None
+        if tokenizer.stopwords_path is not None:
+            with open(tokenizer.stopwords_path, "rb") as stopwords_file:
+                stopwords_hash = hashlib.sha1(stopwords_file.read()).hexdigest()
+
+        collection_stat = os.stat(path_to_collection)
+
+        return {"collection": {"path": os.path.abspath(path_to_collection), "size": collection_stat.st_size, "mtime": collection_stat.st_mtime_ns},
+                "tokenizer": {"class": tokenizer.__class__.__name__, "minL": tokenizer.minL, "stopwords": stopwords_hash, "stemmer": tokenizer.stemmer_name}}
+
+    def exists(self):
+        """
+        Checks if the collection was already cached with the same settings
+        """
+        return os.path.exists(self.path)
+
+    def read(self):
+        """
+        Reads the tokenized documents from the cache
+
+        Yields
+        ----------
+        document
+            (pmid, token stream) tuple of each document
+        """
+        with open(self.path, "rb") as cache_file:
+            magic, version, documents, terms_offset = self.HEADER.unpack(cache_file.read(self.HEADER.size))
+            if magic != self.MAGIC or version != self.VERSION:
+                raise RuntimeError("\"{}\" is not a valid token cache file".format(self.path))
+
+            # term table
+            cache_file.seek(terms_offset)
+            data = cache_file.read()
+            terms_num = struct.unpack_from("<I", data, 0)[0]
+            terms = []
+            position = 4
+            for _ in range(terms_num):
+                length = struct.unpack_from("<I", data, position)[0]
+                terms.append(data[position + 4:position + 4 + length].decode("utf-8"))
+                position += 4 + length
+            data = None
+
+            # documents
+            cache_file.seek(self.HEADER.size)
+            for _ in range(documents):
+                pmid, tokens_num = self.DOCUMENT.unpack(cache_file.read(self.DOCUMENT.size))
+
+                term_ids = array("I")
+                term_ids.frombytes(cache_file.read(4 * tokens_num))
+                if sys.byteorder == "big":
+                    term_ids.byteswap()
+
+                yield (str(pmid), [terms[term_id] for term_id in term_ids])
+
+    def write(self, documents):
+        """
+        Writes the tokenized documents to the cache while passing them through,
+        the cache file only becomes visible once every document was written
+
+        Parameters
+        ----------
+        documents
+            iterable of (pmid, token stream) tuples
+
+        Yields
+        ----------
+        document
+            (pmid, token stream) tuple of each document
+        """
+        if (not os.path.exists(os.path.dirname(self.path))):
+            os.makedirs(os.path.dirname(self.path))
+
+        term_ids_dict = {}
+        documents_num = 0
+
+        with open(self.path + ".tmp", "wb") as cache_file:
+            cache_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, 0, 0))
+
+            for pmid, token_stream in documents:
+                term_ids = array("I", [term_ids_dict.setdefault(token, len(term_ids_dict)) for token in token_stream])
+                # arrays are stored in little endian
+                if sys.byteorder == "big":
+                    term_ids.byteswap()
+
+                cache_file.write(self.DOCUMENT.pack(int(pmid), len(term_ids)))
+                cache_file.write(term_ids.tobytes())
+                documents_num += 1
+
+                yield (pmid, token_stream)
+
+            terms_offset = cache_file.tell()
+            cache_file.write(struct.pack("<I", len(term_ids_dict)))
+            for term in term_ids_dict:
+                term = term.encode("utf-8")
+                cache_file.write(struct.pack("<I", len(term)))
+                cache_file.write(term)
+
+            cache_file.seek(0)
+            cache_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, documents_num, terms_offset))
+
+        # the key is saved next to the cache file to help identifying it
+        with open(self.path[:-len(".bin")] + ".json", "w", encoding="utf-8") as key_file:
+            json.dump(self.key, key_file, indent=4)
+
+        os.replace(self.path + ".tmp", self.path)
@@ -10,6 +10,7 @@ Holds utility code that can be reused by several modules.
 
 
 import sys
+import math
 
 def dynamically_init_class(module_name, **kwargs):
     """Dynamically initializes a python object based
@@ -43,4 +44,70 @@ def dynamically_init_class(module_name, **kwargs):
     """
 
     class_name = kwargs.pop("class")
-    return getattr(sys.modules[module_name], class_name)(**kwargs)
\ No newline at end of file
+    return getattr(sys.modules[module_name], class_name)(**kwargs)
+
+def percentile(values, percent):
+    """Computes a percentile of a list of values with the
+    nearest-rank method.
+
+    Parameters
+    ----------
+    values : List[float]
+        list of values
+    percent : float
+        percentile to be computed (0-100)
+
+    Returns
+        ----------
+        float
+            percentile value, None if the list is empty
+    """
+    if len(values) == 0:
+        return None
+
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def encode_varint(value, buffer):
+    """Appends a non-negative integer to a buffer using the
+    variable-byte encoding (7 bits per byte, the highest bit
+    of a byte is set when more bytes follow).
+
+    Parameters
+    ----------
+    value : int
+        non-negative integer to be encoded
+    buffer : bytearray
+        buffer where the encoded bytes are appended
+    """
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def decode_varint(data, position):
+    """Decodes a variable-byte encoded integer.
+
+    Parameters
+    ----------
+    data : bytes
+        buffer holding the encoded integer
+    position : int
+        position of the first byte of the integer
+
+    Returns
+        ----------
+        Tuple[int, int]
+            decoded integer and the position after its last byte
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7